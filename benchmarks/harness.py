@@ -0,0 +1,109 @@
+import os
+import gc
+import json
+import time
+import platform
+import tracemalloc
+
+from stage_metrics import percentile
+
+# timing, memory and baseline helpers shared by the benchmarks;
+# the scripts put the repo on sys.path and run from there before importing this
+
+BASELINE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baselines')
+# a slower p50 or lower throughput than this, relative to the baseline, is reported
+REGRESSION_THRESHOLD = 0.10
+
+
+def measure(run, iterations: int, batch: int = 1, warmup: int = 3, memory_iterations: int = 3) -> dict:
+    # run() is one sample doing batch operations; latencies are per operation
+    for _ in range(warmup):
+        run()
+    gc.collect()
+    samples = list()
+    for _ in range(iterations):
+        start = time.perf_counter()
+        run()
+        samples.append((time.perf_counter() - start) / batch)
+    total = sum(samples) * batch
+
+    # traced separately, tracemalloc slows everything down
+    gc.collect()
+    tracemalloc.start()
+    try:
+        tracemalloc.reset_peak()
+        base, _ = tracemalloc.get_traced_memory()
+        for _ in range(memory_iterations):
+            run()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'operations': iterations * batch,
+        'throughput_per_s': iterations * batch / total if total > 0 else float('inf'),
+        'mean_ms': total / (iterations * batch) * 1000,
+        'p50_ms': percentile(samples, 0.5) * 1000,
+        'p90_ms': percentile(samples, 0.9) * 1000,
+        'p99_ms': percentile(samples, 0.99) * 1000,
+        'peak_memory_kb': (peak - base) / 1024,
+    }
+
+
+def environment() -> dict:
+    return {
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'processor': platform.processor(),
+        'system': platform.system(),
+    }
+
+
+def baseline_path(name: str) -> str:
+    return os.path.join(BASELINE_DIR, '{}.json'.format(name))
+
+
+def load_baseline(name: str) -> dict:
+    path = baseline_path(name)
+    if not os.path.exists(path):
+        return dict()
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.loads(f.read())
+
+
+def save_baseline(name: str, results: dict) -> str:
+    path = baseline_path(name)
+    os.makedirs(BASELINE_DIR, exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(json.dumps({'environment': environment(), 'results': results}, indent=4))
+    return path
+
+
+def compare(result: dict, baseline: dict) -> list:
+    # (metric, relative change, is regression) against a baseline result
+    changes = list()
+    for metric, higher_is_better in [('p50_ms', False), ('throughput_per_s', True), ('peak_memory_kb', False)]:
+        if not baseline.get(metric):
+            continue
+        change = result[metric] / baseline[metric] - 1
+        worse = -change if higher_is_better else change
+        changes.append((metric, change, worse > REGRESSION_THRESHOLD))
+    return changes
+
+
+def report(results: dict, baseline: dict) -> int:
+    # prints one line per benchmark, returns the number of regressions
+    regressions = 0
+    baseline_results = baseline.get('results', dict())
+    for name, result in results.items():
+        print('{:<28} {:>12.1f}/s  p50 {:10.4f} ms  p90 {:10.4f} ms  p99 {:10.4f} ms  peak {:9.1f} KiB'.format(
+            name, result['throughput_per_s'], result['p50_ms'], result['p90_ms'], result['p99_ms'],
+            result['peak_memory_kb']))
+        if name not in baseline_results:
+            continue
+        changes = compare(result, baseline_results[name])
+        print('{:<28} {}'.format('', '  '.join(
+            '{} {:+.1f}%{}'.format(metric, change * 100, ' REGRESSION' if regressed else '')
+            for metric, change, regressed in changes)))
+        regressions += sum(1 for _, _, regressed in changes if regressed)
+    return regressions
@@ -0,0 +1,244 @@
+import os
+import sys
+import glob
+import random
+import argparse
+import tempfile
+
+# benchmarks of the probability and rendering hot paths, on synthetic league inputs
+# usage: python benchmarks/hot_paths.py [--scale 1] [--only name ...] [--save]
+
+BENCHMARK_PATH = os.path.dirname(os.path.abspath(__file__))
+REPO_PATH = os.path.dirname(BENCHMARK_PATH)
+sys.path.insert(0, REPO_PATH)
+# modules read _config.json from the working directory
+os.chdir(REPO_PATH)
+
+from openpyxl.workbook.workbook import Workbook
+
+import probability_machine
+from probability_engine import compute_workbooks
+from markets import compute_markets
+from strength_model import fit_strengths, compute_fitted_page
+from fixture_tensor import FixtureTensor
+from league_table import summarize_league_table
+from http_scraper import parse_standings_html
+
+from harness import measure, load_baseline, save_baseline, report
+
+FIXTURE_PATHS = sorted(glob.glob(os.path.join(BENCHMARK_PATH, 'fixtures', 'standings_*.html')))
+BASELINE_NAME = 'hot_paths'
+SEED = 3448
+
+
+def synthetic_inputs(rng: random.Random) -> dict:
+    # keyword arguments of probability_machine.write_spreadsheet for a plausible league
+    teams = rng.randint(10, 20)
+    rounds = rng.randint(4, 2 * (teams - 1))
+    league_home_matches_played = teams * rounds // 2
+    league_home_goals = int(league_home_matches_played * rng.uniform(1.1, 1.8))
+    league_away_goals = int(league_home_matches_played * rng.uniform(0.8, 1.4))
+
+    def team(matches_played: int) -> tuple:
+        return (
+            matches_played,
+            int(matches_played * rng.uniform(0.5, 2.5)),
+            int(matches_played * rng.uniform(0.5, 2.5))
+        )
+
+    ht_total = team(rounds)
+    at_total = team(rounds)
+    ht_home = team(rounds // 2)
+    at_away = team(rounds - rounds // 2)
+    return dict(
+        ht_total_matches_played=ht_total[0],
+        ht_total_goals_scored=ht_total[1],
+        ht_total_goals_lost=ht_total[2],
+        at_total_matches_played=at_total[0],
+        at_total_goals_scored=at_total[1],
+        at_total_goals_lost=at_total[2],
+        league_home_matches_played=league_home_matches_played,
+        ht_home_matches_played=ht_home[0],
+        ht_home_goals_scored=ht_home[1],
+        ht_home_goals_lost=ht_home[2],
+        at_away_matches_played=at_away[0],
+        at_away_goals_scored=at_away[1],
+        at_away_goals_lost=at_away[2],
+        league_total_matches_played=2 * league_home_matches_played,
+        league_home_goals=league_home_goals,
+        league_away_goals=league_away_goals
+    )
+
+
+def cycle(items: list):
+    # a callable returning the next item, round robin
+    state = {'index': 0}
+
+    def next_item():
+        item = items[state['index'] % len(items)]
+        state['index'] += 1
+        return item
+    return next_item
+
+
+def bench_color_probability(scale: float) -> dict:
+    batch = 1000
+    rng = random.Random(SEED)
+    probabilities = [rng.random() for _ in range(batch)]
+
+    def run():
+        for p in probabilities:
+            probability_machine.color_probability(p)
+    return measure(run, max(10, int(200 * scale)), batch=batch)
+
+
+def bench_generate_page(inputs: list, scale: float) -> dict:
+    next_inputs = cycle(inputs)
+
+    def run():
+        i = next_inputs()
+        ws = Workbook().active
+        probability_machine.generate_page(
+            ws,
+            i['ht_total_matches_played'], i['ht_total_goals_scored'], i['ht_total_goals_lost'],
+            i['at_total_matches_played'], i['at_total_goals_scored'], i['at_total_goals_lost'],
+            i['league_home_matches_played'], i['league_home_goals'], i['league_away_goals']
+        )
+    return measure(run, max(5, int(50 * scale)))
+
+
+def bench_write_spreadsheet_disk(inputs: list, scale: float, output_dir: str) -> dict:
+    next_inputs = cycle(inputs)
+    path = os.path.join(output_dir, 'benchmark.xlsx')
+
+    def run():
+        probability_machine.write_spreadsheet(path, **next_inputs())
+    return measure(run, max(5, int(50 * scale)))
+
+
+def bench_write_spreadsheet_memory(inputs: list, scale: float) -> dict:
+    next_inputs = cycle(inputs)
+
+    def run():
+        probability_machine.write_spreadsheet(None, **next_inputs())
+    return measure(run, max(5, int(50 * scale)))
+
+
+def bench_compute_workbooks(inputs: list, scale: float) -> dict:
+    # the whole slate in one vectorized call, latency per match
+    slate = {key: [i[key] for i in inputs] for key in inputs[0]}
+
+    def run():
+        compute_workbooks(**slate)
+    return measure(run, max(10, int(200 * scale)), batch=len(inputs))
+
+
+def bench_compute_markets(inputs: list, scale: float) -> dict:
+    # every market of the slate from its score matrices, latency per match
+    slate = {key: [i[key] for i in inputs] for key in inputs[0]}
+    normal_page, _ = compute_workbooks(**slate)
+
+    def run():
+        compute_markets(normal_page.score_matrix)
+    return measure(run, max(10, int(200 * scale)), batch=len(inputs))
+
+
+def bench_write_output(inputs: list, scale: float, output_format: str) -> dict:
+    # the whole slate in one file, latency per match
+    slate = {key: [i[key] for i in inputs] for key in inputs[0]}
+    match_names = ['match {}'.format(i) for i in range(len(inputs))]
+    normal_page, double_page = compute_workbooks(**slate)
+
+    def run():
+        probability_machine.write_output(output_format, None, match_names, normal_page, double_page)
+    return measure(run, max(5, int(50 * scale)), batch=len(inputs))
+
+
+def bench_parse_standings(scale: float) -> dict:
+    pages = list()
+    for path in FIXTURE_PATHS:
+        with open(path, 'r', encoding='utf-8') as f:
+            pages.append(f.read())
+    next_page = cycle(pages)
+
+    def run():
+        summarize_league_table(parse_standings_html(next_page()))
+    return measure(run, max(10, int(200 * scale)))
+
+
+def bench_fit_strengths(scale: float) -> dict:
+    # one fit per league table
+    standings = list()
+    for path in FIXTURE_PATHS:
+        with open(path, 'r', encoding='utf-8') as f:
+            standings.append(summarize_league_table(parse_standings_html(f.read())))
+    next_standings = cycle(standings)
+
+    def run():
+        fit_strengths(next_standings())
+    return measure(run, max(10, int(200 * scale)))
+
+
+def bench_fitted_page(scale: float) -> dict:
+    # every fixture of the largest league from one fit, latency per match
+    with open(FIXTURE_PATHS[-1], 'r', encoding='utf-8') as f:
+        strengths = fit_strengths(summarize_league_table(parse_standings_html(f.read())))
+    home_teams = [h for h in strengths.teams for v in strengths.teams if h != v]
+    visitor_teams = [v for h in strengths.teams for v in strengths.teams if h != v]
+
+    def run():
+        compute_fitted_page(strengths, home_teams, visitor_teams)
+    return measure(run, max(10, int(100 * scale)), batch=len(home_teams))
+
+
+def bench_fixture_tensor(scale: float, lazy: bool) -> dict:
+    # every pairing of the largest league, latency per pairing
+    with open(FIXTURE_PATHS[-1], 'r', encoding='utf-8') as f:
+        standings = summarize_league_table(parse_standings_html(f.read()))
+    pairings = len(standings.rows) ** 2
+
+    def run():
+        FixtureTensor(standings, lazy)
+    return measure(run, max(10, int(100 * scale)), batch=pairings)
+
+
+def run(scale: float, only: list) -> dict:
+    rng = random.Random(SEED)
+    inputs = [synthetic_inputs(rng) for _ in range(64)]
+    with tempfile.TemporaryDirectory() as output_dir:
+        benchmarks = {
+            'color_probability': lambda: bench_color_probability(scale),
+            'generate_page': lambda: bench_generate_page(inputs, scale),
+            'write_spreadsheet_disk': lambda: bench_write_spreadsheet_disk(inputs, scale, output_dir),
+            'write_spreadsheet_memory': lambda: bench_write_spreadsheet_memory(inputs, scale),
+            'compute_workbooks_slate': lambda: bench_compute_workbooks(inputs, scale),
+            'compute_markets_slate': lambda: bench_compute_markets(inputs, scale),
+            'write_output_json': lambda: bench_write_output(inputs, scale, 'json'),
+            'write_output_csv': lambda: bench_write_output(inputs, scale, 'csv'),
+            'write_output_npz': lambda: bench_write_output(inputs, scale, 'npz'),
+            'parse_standings': lambda: bench_parse_standings(scale),
+            'fit_strengths': lambda: bench_fit_strengths(scale),
+            'fitted_page_slate': lambda: bench_fitted_page(scale),
+            'fixture_tensor': lambda: bench_fixture_tensor(scale, False),
+            'fixture_tensor_lazy': lambda: bench_fixture_tensor(scale, True),
+        }
+        results = dict()
+        for name, benchmark in benchmarks.items():
+            if only and name not in only:
+                continue
+            results[name] = benchmark()
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmarks of the probability and rendering hot paths')
+    parser.add_argument('--scale', type=float, default=1, help='multiplies the number of iterations')
+    parser.add_argument('--only', nargs='*', default=list(), help='benchmark names to run')
+    parser.add_argument('--save', action='store_true', help='save the results as the new baseline')
+    args = parser.parse_args()
+
+    results = run(args.scale, args.only)
+    regressions = report(results, load_baseline(BASELINE_NAME))
+    if args.save:
+        print('baseline saved to {}'.format(save_baseline(BASELINE_NAME, results)))
+    sys.exit(1 if regressions > 0 and not args.save else 0)
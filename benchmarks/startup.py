@@ -0,0 +1,102 @@
+import os
+import sys
+import time
+import argparse
+import statistics
+import subprocess
+
+# startup time of each entry point, every run in a fresh interpreter
+# usage: python benchmarks/startup.py [--runs 5] [--save]
+
+REPO_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_PATH)
+# modules read _config.json from the working directory
+os.chdir(REPO_PATH)
+
+from harness import load_baseline, save_baseline
+
+BASELINE_NAME = 'startup'
+
+# name -> python source to time; the loops in main.py only run as a script
+IMPORT_ENTRY_POINTS = {
+    'main': 'import main',
+    'email_machine': 'import email_machine',
+    'pipeline': 'import pipeline',
+    'probability_machine': 'import probability_machine',
+}
+# printed by probability_function.py when it is ready for input
+PROMPT_MARKER = 'Ev Sahibi'
+
+
+def time_import(source: str) -> float:
+    # seconds from interpreter start to the end of the import
+    process = subprocess.run(
+        [sys.executable, '-c', 'import time; t = time.perf_counter(); {}; print(time.perf_counter() - t)'.format(source)],
+        cwd=REPO_PATH, capture_output=True, text=True, encoding='utf-8')
+    if process.returncode != 0:
+        raise RuntimeError(process.stderr.strip().splitlines()[-1])
+    return float(process.stdout.strip().splitlines()[-1])
+
+
+def time_prompt() -> float:
+    # seconds from launching probability_function.py to its first prompt
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, '-u', 'probability_function.py'],
+        cwd=REPO_PATH, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+        text=True, encoding='utf-8')
+    try:
+        while True:
+            line = process.stdout.readline()
+            if line == '':
+                raise RuntimeError('probability_function.py exited before its prompt')
+            if PROMPT_MARKER in line:
+                return time.perf_counter() - start
+    finally:
+        process.kill()
+        process.wait()
+
+
+def summarize(times: list) -> dict:
+    return {
+        'runs': len(times),
+        'min_ms': min(times) * 1000,
+        'median_ms': statistics.median(times) * 1000,
+        'max_ms': max(times) * 1000,
+    }
+
+
+def run(runs: int) -> dict:
+    results = dict()
+    for name, source in IMPORT_ENTRY_POINTS.items():
+        try:
+            results[name] = summarize([time_import(source) for _ in range(runs)])
+        except Exception as e:
+            print('{}: {}'.format(name, e))
+    try:
+        results['probability_function'] = summarize([time_prompt() for _ in range(runs)])
+    except Exception as e:
+        print('probability_function: {}'.format(e))
+    return results
+
+
+def report(results: dict, baseline: dict) -> None:
+    for name, result in results.items():
+        line = '{:<22} median {:8.1f} ms  min {:8.1f} ms  max {:8.1f} ms'.format(
+            name, result['median_ms'], result['min_ms'], result['max_ms'])
+        if name in baseline:
+            line += '  ({:+.1f}% vs baseline)'.format(
+                (result['median_ms'] / baseline[name]['median_ms'] - 1) * 100)
+        print(line)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Startup time of each entry point')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--save', action='store_true', help='save the results as the new baseline')
+    args = parser.parse_args()
+
+    results = run(args.runs)
+    report(results, load_baseline(BASELINE_NAME).get('results', dict()))
+    if args.save:
+        print('baseline saved to {}'.format(save_baseline(BASELINE_NAME, results)))
@@ -0,0 +1,102 @@
+from selenium import webdriver
+from selenium.webdriver.firefox.options import Options
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+from stage_metrics import stage
+
+
+class BrowserManager:
+    # keeps one warm Firefox across loop iterations and only recycles it
+    # after a crash, max_cycles iterations or max_memory_growth_mb of growth
+
+    def __init__(
+        self,
+        options: Options,
+        addon_path: str = None,
+        max_cycles: int = 0,
+        max_memory_growth_mb: float = 0
+    ):
+        self.options = options
+        self.addon_path = addon_path
+        self.max_cycles = max_cycles
+        self.max_memory_growth_mb = max_memory_growth_mb
+        self.wd: webdriver.Firefox = None
+        self.cycles = 0
+        self.start_memory_mb = None
+
+    def start(self) -> webdriver.Firefox:
+        with stage('browser_start'):
+            self.wd = webdriver.Firefox(options=self.options)
+        if self.addon_path is not None:
+            # see https://datarebellion.com/blog/using-firefox-extensions-with-selenium-in-python/
+            with stage('addon_install'):
+                self.wd.install_addon(self.addon_path)
+        self.wd.fullscreen_window()
+        self.cycles = 0
+        self.start_memory_mb = self.memory_mb()
+        print('browser started')
+        return self.wd
+
+    def quit(self) -> None:
+        if self.wd is not None:
+            try:
+                self.wd.quit()
+            except Exception as e:
+                print('Browser quit error: {}'.format(e))
+            self.wd = None
+
+    def is_healthy(self) -> bool:
+        try:
+            return len(self.wd.window_handles) > 0 and self.wd.execute_script('return 1;') == 1
+        except Exception as e:
+            print('Browser health check failed: {}'.format(e))
+            return False
+
+    def memory_mb(self) -> float:
+        # resident memory of geckodriver and every browser process under it
+        if psutil is None or self.wd is None:
+            return None
+        try:
+            process = psutil.Process(self.wd.service.process.pid)
+            processes = [process] + process.children(recursive=True)
+            return sum(p.memory_info().rss for p in processes) / (1024 * 1024)
+        except Exception:
+            return None
+
+    def recycle_reason(self) -> str:
+        if self.wd is None:
+            return 'not started'
+        if not self.is_healthy():
+            return 'unhealthy'
+        if self.max_cycles > 0 and self.cycles >= self.max_cycles:
+            return 'after {} cycles'.format(self.cycles)
+        if self.max_memory_growth_mb > 0 and self.start_memory_mb is not None:
+            memory_mb = self.memory_mb()
+            if memory_mb is not None and memory_mb - self.start_memory_mb > self.max_memory_growth_mb:
+                return 'memory grew to {:.0f}MB'.format(memory_mb)
+        return None
+
+    def reset_windows(self) -> None:
+        # close whatever the last cycle left open and go back to the first window
+        handles = self.wd.window_handles
+        for handle in handles[1:]:
+            self.wd.switch_to.window(handle)
+            self.wd.close()
+        self.wd.switch_to.window(handles[0])
+
+    def acquire(self) -> webdriver.Firefox:
+        # call at the start of each cycle
+        reason = self.recycle_reason()
+        if reason is not None:
+            if self.wd is not None:
+                print('recycling browser: {}'.format(reason))
+            self.quit()
+            self.start()
+        else:
+            self.reset_windows()
+        self.cycles += 1
+        return self.wd
@@ -1,14 +1,19 @@
 # See https://chozinthet20602.medium.com/sending-email-with-python-using-gmail-api-33628e36306a
 
 import os
+import io
 import json
+import time
+import random
 import base64
+import zipfile
+import threading
 import mimetypes
+from typing import NamedTuple
 
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from google.auth.transport.requests import Request
-from googleapiclient.discovery import build
+from stage_metrics import record_stage
+
+# the google client libraries are imported on first use, see get_email_service
 
 from email import encoders
 from email.mime.base import MIMEBase
@@ -22,98 +27,209 @@ with open('_config.json', 'r') as f:
     CREDENTIALS_PATH = config.get('credentialsPath')
     SENDER_EMAIL = config.get('senderEmail')
     RECEIVER_EMAIL = SENDER_EMAIL
+    # attachments are split over as many messages as needed to stay under this
+    MAX_MESSAGE_MB = config.get('emailMaxMessageMb', 20)
+    ZIP_ATTACHMENTS = config.get('emailZipAttachments', False)
+    MAX_RETRIES = config.get('emailMaxRetries', 5)
+    RETRY_BASE_SECONDS = config.get('emailRetryBaseSeconds', 1)
+    # e.g. a local fake of the gmail api, which needs no authorization
+    GMAIL_API_ENDPOINT = config.get('gmailApiEndpoint')
     
     SCOPES = ['https://mail.google.com/']
     
     del config
 
-credentials = None
-if os.path.exists(CREDENTIALS_PATH):
-    credentials = Credentials.from_authorized_user_file(CREDENTIALS_PATH, SCOPES)
+# room for headers and the body text, on top of the attachments
+MESSAGE_OVERHEAD_BYTES = 64*1024
+# http statuses worth another try
+TRANSIENT_STATUSES = {429, 500, 502, 503, 504}
 
-if not credentials or not credentials.valid:
-    if credentials and credentials.expired and credentials.refresh_token:
-        try:
-            credentials.refresh(Request())
-        except Exception as e:
-            print('Credential error: {}'.format(e))
+
+class SendOutcome(NamedTuple):
+    # attachment file names in this message
+    filenames: list
+    # size of the raw message sent
+    size: int
+    # gmail message id, None if it was not sent
+    message_id: str
+    attempts: int
+    # error message if it was not sent, None otherwise
+    error: str
+
+
+def load_credentials():
+    from google.oauth2.credentials import Credentials
+    from google_auth_oauthlib.flow import InstalledAppFlow
+    from google.auth.transport.requests import Request
+
+    credentials = None
+    if os.path.exists(CREDENTIALS_PATH):
+        credentials = Credentials.from_authorized_user_file(CREDENTIALS_PATH, SCOPES)
+
+    if not credentials or not credentials.valid:
+        if credentials and credentials.expired and credentials.refresh_token:
+            try:
+                credentials.refresh(Request())
+            except Exception as e:
+                print('Credential error: {}'.format(e))
+                flow = InstalledAppFlow.from_client_secrets_file(CLIENT_SECRET_PATH, SCOPES)
+                credentials = flow.run_local_server(port=0)
+        else:
             flow = InstalledAppFlow.from_client_secrets_file(CLIENT_SECRET_PATH, SCOPES)
             credentials = flow.run_local_server(port=0)
-    else:
-        flow = InstalledAppFlow.from_client_secrets_file(CLIENT_SECRET_PATH, SCOPES)
-        credentials = flow.run_local_server(port=0)
-    # Save the credentials for the next run
-    with open(CREDENTIALS_PATH, 'w') as f:
-        f.write(credentials.to_json())
+        # Save the credentials for the next run
+        with open(CREDENTIALS_PATH, 'w') as f:
+            f.write(credentials.to_json())
+    return credentials
 
-email_service = build('gmail', 'v1', credentials=credentials)
 
+def build_service(api_endpoint: str = None):
+    from googleapiclient.discovery import build
 
-def send_update(file_list: list) -> None:
-    
+    # the discovery document shipped with the client, instead of fetching it
+    if api_endpoint is not None:
+        from google.auth.credentials import AnonymousCredentials
+        return build(
+            'gmail', 'v1', credentials=AnonymousCredentials(),
+            client_options={'api_endpoint': api_endpoint},
+            static_discovery=True, cache_discovery=False)
+    return build(
+        'gmail', 'v1', credentials=load_credentials(),
+        static_discovery=True, cache_discovery=False)
+
+
+# one authorized service, built when the first message is sent and reused after
+email_service = None
+email_service_lock = threading.Lock()
+
+
+def get_email_service():
+    global email_service
+    with email_service_lock:
+        if email_service is None:
+            email_service = build_service(GMAIL_API_ENDPOINT)
+        return email_service
+
+
+def read_attachment(attachment) -> tuple:
+    # attachments are either file paths or (name, bytes) pairs
+    if isinstance(attachment, str):
+        with open(attachment, 'rb') as file:
+            return attachment, file.read()
+    return attachment
+
+
+def encoded_size(size: int) -> int:
+    # base64 in 76 character lines
+    encoded = (size + 2) // 3 * 4
+    return encoded + (encoded + 75) // 76 * 2
+
+
+def split_attachments(attachments: list, max_bytes: int) -> list:
+    # consecutive groups of attachments, each group small enough for one message;
+    # an attachment too big on its own still gets a message of its own
+    groups = list()
+    group = list()
+    group_size = MESSAGE_OVERHEAD_BYTES
+    for filename, data in attachments:
+        size = encoded_size(len(data))
+        if len(group) > 0 and group_size + size > max_bytes:
+            groups.append(group)
+            group = list()
+            group_size = MESSAGE_OVERHEAD_BYTES
+        group.append((filename, data))
+        group_size += size
+    if len(group) > 0:
+        groups.append(group)
+    return groups
+
+
+def zip_attachments(attachments: list, filename: str) -> tuple:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for name, data in attachments:
+            archive.writestr(os.path.basename(name), data)
+    return filename, buffer.getvalue()
+
+
+def build_message(attachments: list, file_list: list, subject: str) -> bytes:
     # Create a multipart message and set headers
     message = MIMEMultipart()
     message['From'] = SENDER_EMAIL
     message['To'] = RECEIVER_EMAIL
-    message['Subject'] = 'Mackolik update'
+    message['Subject'] = subject
     
     # Body is just a list of files
     message.attach(MIMEText('\n'.join(file_list), 'plain'))
     # See https://stackoverflow.com/a/11077828/5957296
-    for filename in file_list:
+    for filename, data in attachments:
         ctype, encoding = mimetypes.guess_type(filename)
         if ctype is None or encoding is not None:
             ctype = 'application/octet-stream'
         maintype, subtype = ctype.split('/', 1)
-        # Open file / read | binary
-        with open(filename, 'rb') as file:
-            # Add file as application/octet-stream
-            part = MIMEBase(maintype, subtype)
-            part.set_payload(file.read())
-            # Encode file b64
-            encoders.encode_base64(part)
-            # Add header to attachment
-            part.add_header('Content-Disposition', 'attachment', filename=filename)
-            # Add attachment to message
-            message.attach(part)
-            
-    # Create a multipart message and set headers
-    message = MIMEMultipart()
-    message['From'] = FROM_LINE
-    message['To'] = TO_LINE
-    message['Subject'] = SUBJECT_LINE
+        # Add file as application/octet-stream
+        part = MIMEBase(maintype, subtype)
+        part.set_payload(data)
+        # Encode file b64
+        encoders.encode_base64(part)
+        # Add header to attachment
+        part.add_header('Content-Disposition', 'attachment', filename=os.path.basename(filename))
+        # Add attachment to message
+        message.attach(part)
+    return message.as_bytes()
 
-    # body is just a list of files
-    message.attach(MIMEText('\n'.join(file_list), 'plain'))
-    # see https://stackoverflow.com/a/11077828/5957296
-    for filename in file_list:
-        ctype, encoding = mimetypes.guess_type(filename)
-        if ctype is None or encoding is not None:
-            ctype = 'application/octet-stream'
-        maintype, subtype = ctype.split('/', 1)
-        # open file / read | binary
-        with open(filename, 'rb') as file:
-            # Add file as application/octet-stream
-            # Email client can usually download this automatically as attachment
-            part = MIMEBase(maintype, subtype)
-            part.set_payload(file.read())
-            # Encode file in ASCII characters to send by email    
-            encoders.encode_base64(part)
-            # Add header as key/value pair to attachment part
-            part.add_header('Content-Disposition', 'attachment', filename=filename)
-            # Add attachment to message
-            message.attach(part)
-    
-    # Attempt to send the message
-    message_obj = {'raw': base64.urlsafe_b64encode(message.as_string().encode()).decode()}
-    try:
-        message_result = (
-            email_service.
-            users().
-            messages().
-            send(userId=SENDER_EMAIL, body=message_obj).
-            execute()
-        )
-        print('Message out: {}'.format(message_result))
-    except Exception as e:
-        print('Gmail error: {}'.format(e))
+
+def is_transient(error: Exception) -> bool:
+    # googleapiclient HttpErrors carry the response
+    status = getattr(getattr(error, 'resp', None), 'status', None)
+    if status is not None:
+        return status in TRANSIENT_STATUSES
+    # dropped connections, timeouts
+    return isinstance(error, (ConnectionError, TimeoutError, OSError))
+
+
+def send_message(raw: bytes, service=None) -> tuple:
+    # (message id, attempts, error), retried with exponential backoff on transient errors
+    service = service or get_email_service()
+    message_obj = {'raw': base64.urlsafe_b64encode(raw).decode()}
+    attempt = 0
+    while True:
+        attempt += 1
+        try:
+            message_result = (
+                service.
+                users().
+                messages().
+                send(userId=SENDER_EMAIL, body=message_obj).
+                execute()
+            )
+            return message_result.get('id'), attempt, None
+        except Exception as e:
+            if attempt > MAX_RETRIES or not is_transient(e):
+                print('Gmail error: {}'.format(e))
+                return None, attempt, repr(e)
+            delay = RETRY_BASE_SECONDS * 2**(attempt - 1) * (1 + random.random())
+            print('Gmail error: {}, retrying in {:.1f}s'.format(e, delay))
+            time.sleep(delay)
+
+
+def send_update(file_list: list, service=None) -> list:
+    # one SendOutcome per message, each message under MAX_MESSAGE_MB
+    attachments = [read_attachment(a) for a in file_list]
+    groups = split_attachments(attachments, int(MAX_MESSAGE_MB*1024*1024))
+    outcomes = list()
+    for i, group in enumerate(groups):
+        filenames = [filename for filename, _ in group]
+        subject = 'Mackolik update'
+        if len(groups) > 1:
+            subject = '{} ({}/{})'.format(subject, i + 1, len(groups))
+        if ZIP_ATTACHMENTS:
+            group = [zip_attachments(group, 'mackolik_update_{}.zip'.format(i + 1))]
+        raw = build_message(group, filenames, subject)
+        start = time.monotonic()
+        message_id, attempts, error = send_message(raw, service)
+        record_stage('send_message', time.monotonic() - start, error is not None)
+        if error is None:
+            print('Message out: {} ({} files, {} bytes)'.format(message_id, len(filenames), len(raw)))
+        outcomes.append(SendOutcome(filenames, len(raw), message_id, attempts, error))
+    return outcomes
@@ -0,0 +1,125 @@
+import threading
+import collections
+import numpy as np
+
+from league_table import (
+    LeagueStandings, IDX_TEAM_NAME, HOME_TEAM_COLUMNS, VISITOR_TEAM_COLUMNS, league_inputs)
+from probability_engine import (
+    PageData, TAIL_EPSILON, workbook_mean_goals, workbook_grid_sizes, build_page,
+    mean_goals_slice, page_slice)
+
+# every home/visitor pairing of a standing table priced in one vectorized call;
+# pair (home i, visitor j) is row i * N + j of the pages, so a match is an index lookup
+
+
+def pair_inputs(standings: LeagueStandings) -> dict:
+    # keyword arguments of compute_workbooks for all N * N pairings, like league_table.match_inputs
+    rows = standings.rows
+    n = len(rows)
+
+    def column(idx: int) -> np.ndarray:
+        return np.array([int(r[idx]) for r in rows], dtype=np.int64)
+
+    inputs = dict()
+    for key, idx in HOME_TEAM_COLUMNS.items():
+        inputs[key] = np.repeat(column(idx), n)
+    for key, idx in VISITOR_TEAM_COLUMNS.items():
+        inputs[key] = np.tile(column(idx), n)
+    inputs.update(league_inputs(standings))
+    return inputs
+
+
+def page_nbytes(page) -> int:
+    return sum(field.nbytes for field in page if isinstance(field, np.ndarray))
+
+
+class FixtureTensor:
+    # normal and double pages of every pairing of one standings snapshot;
+    # lazy keeps only the expected goals of each pairing and builds score matrices on request
+
+    def __init__(self, standings: LeagueStandings, lazy: bool = False, epsilon: float = TAIL_EPSILON):
+        self.teams = [r[IDX_TEAM_NAME] for r in standings.rows]
+        self.index = {team: i for i, team in enumerate(self.teams)}
+        self.scraped_at = standings.scraped_at
+        self.lazy = lazy
+        self.epsilon = epsilon
+        self.normal_means, self.double_means = workbook_mean_goals(**pair_inputs(standings))
+        # the grid of each pairing, and the one grid big enough for all of them
+        self.grid_sizes = workbook_grid_sizes(self.normal_means, self.double_means, epsilon)
+        self.max_goals = int(self.grid_sizes.max())
+        self.normal_page: PageData = None
+        self.double_page: PageData = None
+        if not lazy:
+            self.normal_page = build_page(self.normal_means, self.grid_sizes)
+            self.double_page = build_page(self.double_means, self.grid_sizes)
+
+    def pair_index(self, home_team: str, visitor_team: str) -> int:
+        # a KeyError for teams not in the table, like league_table.match_inputs
+        return self.index[home_team] * len(self.teams) + self.index[visitor_team]
+
+    def expected_goals(self, page: str = 'normal') -> tuple:
+        # (home, visitor) expected goals of every pairing, shape (N, N) each
+        mean_goals = self.normal_means if page == 'normal' else self.double_means
+        n = len(self.teams)
+        return mean_goals.ht_adj_mean_goals.reshape(n, n), mean_goals.vt_adj_mean_goals.reshape(n, n)
+
+    def pages(self, home_team: str, visitor_team: str) -> tuple:
+        # (normal page, double page, 0) of the match, ready for probability_machine.save_workbook;
+        # the same pages, grid included, as compute_workbooks gives for the match alone
+        index = self.pair_index(home_team, visitor_team)
+        if self.lazy:
+            max_goals = self.grid_sizes[index]
+            return (
+                build_page(mean_goals_slice(self.normal_means, index), max_goals),
+                build_page(mean_goals_slice(self.double_means, index), max_goals),
+                0
+            )
+        return page_slice(self.normal_page, index), page_slice(self.double_page, index), 0
+
+    def score_matrices(self, page: str = 'normal') -> np.ndarray:
+        # every pairing at once on the shared grid, shape (N, N, G, G), 0 beyond the grid
+        # of each pairing; built on the spot when lazy
+        n = len(self.teams)
+        built = self.normal_page if page == 'normal' else self.double_page
+        if built is None:
+            built = build_page(self.normal_means if page == 'normal' else self.double_means, self.grid_sizes)
+        return built.score_matrix.reshape(n, n, self.max_goals, self.max_goals)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(page_nbytes(p) for p in [
+            self.normal_means, self.double_means, self.normal_page, self.double_page
+        ] if p is not None)
+
+
+class FixtureTensorCache:
+    # (league key, snapshot time) -> FixtureTensor, the least recently used ones are
+    # dropped once together they take more than max_bytes
+
+    def __init__(self, max_bytes: int, lazy: bool = False):
+        self.max_bytes = max_bytes
+        self.lazy = lazy
+        self.entries = collections.OrderedDict()
+        self.nbytes = 0
+        self.lock = threading.Lock()
+
+    def get(self, league_key: str, standings: LeagueStandings) -> FixtureTensor:
+        key = (league_key, standings.scraped_at)
+        with self.lock:
+            tensor = self.entries.get(key)
+            if tensor is not None:
+                self.entries.move_to_end(key)
+                return tensor
+        tensor = FixtureTensor(standings, self.lazy)
+        with self.lock:
+            if key not in self.entries:
+                self.entries[key] = tensor
+                self.nbytes += tensor.nbytes
+            # the newest one stays, even if it alone is over the limit
+            while self.nbytes > self.max_bytes and len(self.entries) > 1:
+                _, dropped = self.entries.popitem(last=False)
+                self.nbytes -= dropped.nbytes
+        return tensor
+
+    def pages(self, league_key: str, standings: LeagueStandings, home_team: str, visitor_team: str) -> tuple:
+        return self.get(league_key, standings).pages(home_team, visitor_team)
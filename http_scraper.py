@@ -0,0 +1,200 @@
+import requests
+from requests.adapters import HTTPAdapter
+from lxml import html as lxml_html
+from urllib.parse import urljoin
+from concurrent.futures import ThreadPoolExecutor
+
+from league_table import StandingsCache
+from team_names import TeamNameCache
+from stage_metrics import stage, timed
+from scraper import (
+    LISTING_URL, LISTING_DATE_VALUE, LISTING_TAB_TYPE, MatchJob, ScrapeResult, is_navigable)
+
+# the listing and standing pages are server rendered, so plain http and an html parser
+# give the same rows as table_extractor.js does in the browser
+
+REQUEST_TIMEOUT_SECONDS = 15
+REQUEST_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:105.0) Gecko/20100101 Firefox/105.0'
+}
+
+
+def cell_text(cell) -> str:
+    return ' '.join(cell.text_content().split())
+
+
+def link_of(cell, base_url: str) -> dict:
+    links = cell.xpath('.//a') if cell is not None else []
+    if len(links) == 0:
+        return {'text': '', 'href': None, 'onclick': None, 'url': None}
+    link = links[0]
+    href = link.get('href')
+    return {
+        'text': cell_text(link),
+        'href': href,
+        'onclick': link.get('onclick'),
+        'url': urljoin(base_url, href) if href is not None else None
+    }
+
+
+def inner_html(cell) -> str:
+    return (cell.text or '') + ''.join(
+        lxml_html.tostring(child, encoding='unicode') for child in cell)
+
+
+def parse_listing_html(page: str, base_url: str = LISTING_URL) -> list:
+    # same rows as get_listing_rows, without the clickable nodes
+    tree = lxml_html.fromstring(page)
+    rows = list()
+    # raw html may not have the tbody a browser would add
+    for row in tree.xpath(
+            '//span[@id="iddaa-tab-body2"]/table/tbody/tr | //span[@id="iddaa-tab-body2"]/table/tr'):
+        cells = row.xpath('./td')
+        rows.append({
+            'className': row.get('class'),
+            'cells': [cell_text(c) for c in cells],
+            'time': inner_html(cells[0]) if len(cells) > 0 else '',
+            'leagueNode': None,
+            'matchNode': None,
+            'league': link_of(cells[1] if len(cells) > 1 else None, base_url),
+            'match': link_of(cells[4] if len(cells) > 4 else None, base_url)
+        })
+    return rows
+
+
+def parse_listing_selection(page: str) -> tuple:
+    # (date value, tab type) the page was served with, None for either one that is not there;
+    # load_listing selects them with scripts, a plain request cannot
+    tree = lxml_html.fromstring(page)
+    date_value = None
+    options = tree.xpath('//select[@id="IddaaDateCmb"]/option')
+    if len(options) > 0:
+        # without a selected option, a browser shows the first one
+        selected = next((o for o in options if o.get('selected') is not None), options[0])
+        date_value = selected.get('value')
+    tabs = tree.xpath(
+        '//a[@href="#" and @type and contains(concat(" ", normalize-space(@class), " "), " selected ")]')
+    tab_type = tabs[0].get('type') if len(tabs) > 0 else None
+    return date_value, tab_type
+
+
+def parse_standings_html(page: str) -> list:
+    # same rows as get_standing_rows, None if the page has no standing table
+    tree = lxml_html.fromstring(page)
+    tables = tree.xpath('//*[@id="tblStanding"]')
+    if len(tables) == 0:
+        return None
+    return [
+        [cell_text(datum).lower() for datum in row.xpath('./td')]
+        for row in tables[0].xpath('.//*[contains(concat(" ", normalize-space(@class), " "), " puan_row ")]')
+    ]
+
+
+def parse_sub_league_url(page: str, base_url: str) -> str:
+    # the shortest sub-league, if it is not the one already shown, see read_league_table
+    tree = lxml_html.fromstring(page)
+    options = tree.xpath('//select[@id="Select2"]/option')
+    if len(options) == 0:
+        return None
+    selected = next((o for o in options if o.get('selected') is not None), options[0])
+    shortest = min(options, key=lambda o: len(cell_text(o)))
+    if len(cell_text(shortest)) >= len(cell_text(selected)):
+        return None
+    value = shortest.get('value')
+    if not value:
+        return None
+    url = urljoin(base_url, value)
+    return url if is_navigable(url, base_url) else None
+
+
+def parse_team_names_html(page: str) -> list:
+    tree = lxml_html.fromstring(page)
+    home = tree.xpath('//a[@class="left-block-team-name"]')
+    away = tree.xpath('//a[@class="r-left-block-team-name"]')
+    if len(home) == 0 or len(away) == 0:
+        return None
+    return [cell_text(home[0]).lower(), cell_text(away[0]).lower()]
+
+
+class HttpScraper:
+    # pooled keep-alive session; the selenium scraper stays as the fallback
+
+    def __init__(self, pool_size: int = 8, listing_url: str = LISTING_URL):
+        self.pool_size = pool_size
+        self.listing_url = listing_url
+        self.session = requests.Session()
+        self.session.headers.update(REQUEST_HEADERS)
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def fetch(self, url: str) -> str:
+        response = self.session.get(url, timeout=REQUEST_TIMEOUT_SECONDS)
+        response.raise_for_status()
+        return response.text
+
+    def get_listing_rows(self) -> list:
+        # no rows unless the page is already on the date and tab load_listing selects,
+        # the caller then reads the listing in the browser
+        try:
+            with stage('http_listing_load'):
+                page = self.fetch(self.listing_url)
+                selection = parse_listing_selection(page)
+                if selection != (LISTING_DATE_VALUE, LISTING_TAB_TYPE):
+                    print('Listing over http is on date {} tab {}, not the one the browser selects'.format(
+                        *selection))
+                    return list()
+                return parse_listing_html(page, self.listing_url)
+        except Exception as e:
+            print('Listing error over http: {}'.format(e))
+            return list()
+
+    @timed('http_league_table')
+    def load_league_table(self, url: str) -> list:
+        page = self.fetch(url)
+        sub_league_url = parse_sub_league_url(page, url)
+        if sub_league_url is not None:
+            page = self.fetch(sub_league_url)
+        rows = parse_standings_html(page)
+        if not rows:
+            # may only be there once scripts run, let the browser decide
+            raise ValueError('no tblStanding rows on {}'.format(url))
+        return rows
+
+    @timed('http_team_names')
+    def load_team_names(self, url: str) -> list:
+        team_names = parse_team_names_html(self.fetch(url))
+        if team_names is None:
+            raise ValueError('no team names on {}'.format(url))
+        return team_names
+
+    def scrape_match(
+        self,
+        job: MatchJob,
+        standings_cache: StandingsCache,
+        team_name_cache: TeamNameCache
+    ) -> ScrapeResult:
+        # same steps as scraper.scrape_match
+        try:
+            team_names = team_name_cache.get(job.match_id) or job.listing_team_names
+            standings = standings_cache.get_or_scrape(
+                job.league_key, lambda: self.load_league_table(job.league_url))
+            if team_names is None or (
+                    len(standings.rows) > 0 and any(t not in standings.teams for t in team_names)):
+                team_names = self.load_team_names(job.match_url)
+                team_name_cache.put(job.match_id, team_names)
+            return ScrapeResult(job, team_names, standings, None)
+        except Exception as e:
+            return ScrapeResult(job, None, None, e)
+
+    def scrape(
+        self,
+        match_jobs: list,
+        standings_cache: StandingsCache,
+        team_name_cache: TeamNameCache
+    ):
+        # concurrent fetches, results are yielded in the order of match_jobs
+        with ThreadPoolExecutor(max_workers=self.pool_size) as executor:
+            yield from executor.map(
+                lambda job: self.scrape_match(job, standings_cache, team_name_cache),
+                match_jobs)
@@ -0,0 +1,132 @@
+import time
+import datetime
+import threading
+from typing import NamedTuple
+
+# these will be used to read the league table
+IDX_TEAM_NAME = 1
+IDX_TOTAL_MATCHES_PLAYED = 2
+IDX_TOTAL_GOALS_SCORED = 6
+IDX_TOTAL_GOALS_LOST = 7
+IDX_HT_MATCHES_PLAYED = 11
+IDX_HT_GOALS_SCORED = 15
+IDX_HT_GOALS_LOST = 16
+IDX_AT_MATCHES_PLAYED = 19
+IDX_AT_GOALS_SCORED = 23
+IDX_AT_GOALS_LOST = 24
+
+
+class LeagueStandings(NamedTuple):
+    # rows as scraped from tblStanding
+    rows: list
+    # team name -> row
+    teams: dict
+    # league-wide sums used by write_spreadsheet
+    home_matches_played: int
+    total_matches_played: int
+    home_goals: int
+    away_goals: int
+    # when the table was scraped
+    scraped_at: datetime.datetime
+
+
+def summarize_league_table(rows: list) -> LeagueStandings:
+    return LeagueStandings(
+        rows=rows,
+        teams={r[IDX_TEAM_NAME]: r for r in rows},
+        home_matches_played=sum(int(r[IDX_HT_MATCHES_PLAYED]) for r in rows),
+        total_matches_played=sum(int(r[IDX_TOTAL_MATCHES_PLAYED]) for r in rows),
+        home_goals=sum(int(r[IDX_HT_GOALS_SCORED]) for r in rows),
+        away_goals=sum(int(r[IDX_AT_GOALS_SCORED]) for r in rows),
+        scraped_at=datetime.datetime.now()
+    )
+
+
+# keyword arguments of probability_machine.write_spreadsheet read from the home team row
+HOME_TEAM_COLUMNS = {
+    'ht_total_matches_played': IDX_TOTAL_MATCHES_PLAYED,
+    'ht_total_goals_scored': IDX_TOTAL_GOALS_SCORED,
+    'ht_total_goals_lost': IDX_TOTAL_GOALS_LOST,
+    'ht_home_matches_played': IDX_HT_MATCHES_PLAYED,
+    'ht_home_goals_scored': IDX_HT_GOALS_SCORED,
+    'ht_home_goals_lost': IDX_HT_GOALS_LOST,
+}
+# and from the visitor team row
+VISITOR_TEAM_COLUMNS = {
+    'at_total_matches_played': IDX_TOTAL_MATCHES_PLAYED,
+    'at_total_goals_scored': IDX_TOTAL_GOALS_SCORED,
+    'at_total_goals_lost': IDX_TOTAL_GOALS_LOST,
+    'at_away_matches_played': IDX_AT_MATCHES_PLAYED,
+    'at_away_goals_scored': IDX_AT_GOALS_SCORED,
+    'at_away_goals_lost': IDX_AT_GOALS_LOST,
+}
+
+
+def league_inputs(standings: LeagueStandings) -> dict:
+    # the keyword arguments of write_spreadsheet that are the same for every match of the league
+    return dict(
+        league_home_matches_played=standings.home_matches_played,
+        league_total_matches_played=standings.total_matches_played,
+        league_home_goals=standings.home_goals,
+        league_away_goals=standings.away_goals
+    )
+
+
+def match_inputs(standings: LeagueStandings, home_team: str, away_team: str) -> dict:
+    # keyword arguments for probability_machine.write_spreadsheet
+    ht_data = standings.teams[home_team]
+    at_data = standings.teams[away_team]
+    inputs = {key: int(ht_data[idx]) for key, idx in HOME_TEAM_COLUMNS.items()}
+    inputs.update({key: int(at_data[idx]) for key, idx in VISITOR_TEAM_COLUMNS.items()})
+    inputs.update(league_inputs(standings))
+    return inputs
+
+
+class StandingsCache:
+    # league key -> LeagueStandings, each entry expires after ttl_seconds
+
+    def __init__(self, ttl_seconds: float):
+        self.ttl_seconds = ttl_seconds
+        self.entries = dict()
+        # one lock per league, so parallel scrapers never scrape the same league twice
+        self.lock = threading.Lock()
+        self.league_locks = dict()
+
+    def get(self, league_key: str) -> LeagueStandings:
+        entry = self.entries.get(league_key)
+        if entry is None:
+            return None
+        stored_at, standings = entry
+        if time.monotonic() - stored_at > self.ttl_seconds:
+            self.entries.pop(league_key, None)
+            return None
+        return standings
+
+    def put(self, league_key: str, rows: list) -> LeagueStandings:
+        standings = summarize_league_table(rows)
+        self.entries[league_key] = (time.monotonic(), standings)
+        return standings
+
+    def get_or_scrape(self, league_key: str, scrape) -> LeagueStandings:
+        with self.lock:
+            league_lock = self.league_locks.setdefault(league_key, threading.Lock())
+        with league_lock:
+            standings = self.get(league_key)
+            if standings is None:
+                rows = scrape()
+                if len(rows) == 0:
+                    # usually a failed or timed out scrape, so it is not cached
+                    # and the next match of the league scrapes again
+                    return summarize_league_table(rows)
+                standings = self.put(league_key, rows)
+            else:
+                print('cached standing table for {}'.format(league_key))
+        return standings
+
+    def expire(self) -> None:
+        now = time.monotonic()
+        for league_key in [
+            k for k, (stored_at, _) in list(self.entries.items())
+            if now - stored_at > self.ttl_seconds
+        ]:
+            self.entries.pop(league_key, None)
@@ -1,239 +1,258 @@
 from selenium import webdriver
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import Select
-from selenium.webdriver.remote.webelement import WebElement
 from selenium.webdriver.firefox.options import Options
-from selenium.common.exceptions import NoSuchElementException
 
 import os
 import time
 import datetime
 import json
 
-import probability_machine
-import email_machine
+from league_table import StandingsCache
+from pipeline import run_pipeline
+from render_pool import RenderExecutor
+from match_scheduler import MatchScheduler
+from match_store import MatchStore
+from fixture_tensor import FixtureTensorCache
+from strength_model import StrengthCache, strength_cache
+from team_names import TeamNameCache
+from scraper import load_listing, build_match_jobs, all_navigable, scrape_serial
+from page_waits import print_wait_summary, reset_waits, wait_summary
+from stage_metrics import start_cycle, end_cycle, print_cycle, export_cycle
+from browser_manager import BrowserManager
+from scrape_pool import ScrapePool
+from http_scraper import HttpScraper
 
 # see https://stackoverflow.com/a/3850271
 import atexit
 # close the driver if you can, when you close the program
-def exit_handler():
-    global wd
-    if wd is not None:
-        wd.quit()
-atexit.register(exit_handler)
-
-with open('_config.json', 'r') as f:
-    config = json.loads(f.read())
-    
-    FIREFOX_BINARY_PATH = config.get('firefoxBinaryPath')
-    TIME_OFFSET_HOURS = config.get('timeOffsetHours')
-    
+def exit_handler(browser_manager: BrowserManager, scrape_pool: ScrapePool):
+    if browser_manager is not None:
+        browser_manager.quit()
+    if scrape_pool is not None:
+        scrape_pool.quit()
+
+
+def iter_scrape_results(
+    match_jobs: list,
+    wd: webdriver.Firefox,
+    browser_manager: BrowserManager,
+    standings_cache: StandingsCache,
+    team_name_cache: TeamNameCache,
+    scrape_pool: ScrapePool = None,
+    http_scraper: HttpScraper = None
+):
+    # scrape results in kickoff order, from whichever scraper is configured
+    if http_scraper is not None and all_navigable(match_jobs):
+        for result in http_scraper.scrape(match_jobs, standings_cache, team_name_cache):
+            if result.error is not None:
+                # anything the plain pages could not give us goes through the browser
+                print('Error scraping match {} over http: {}'.format(
+                    result.job.match_id, result.error))
+                wd = wd or browser_manager.acquire()
+                result = next(scrape_serial(
+                    wd, [result.job], standings_cache, team_name_cache, by_url=True))
+            yield result
+    elif scrape_pool is not None and all_navigable(match_jobs):
+        yield from scrape_pool.scrape(match_jobs)
+    else:
+        yield from scrape_serial(wd, match_jobs, standings_cache, team_name_cache)
+
+
+def main() -> None:
+    # everything is set up here and not on import, render worker processes import this file
+    with open('_config.json', 'r') as f:
+        config = json.loads(f.read())
+
+    firefox_binary_path = config.get('firefoxBinaryPath')
+    time_offset_hours = config.get('timeOffsetHours')
+    league_cache_ttl_seconds = config.get('leagueCacheTtlSeconds', 60*20)
+    team_name_cache_path = config.get('teamNameCachePath', 'team_names.json')
+    firefox_profile_path = config.get('firefoxProfilePath')
+    browser_max_cycles = config.get('browserMaxCycles', 24)
+    browser_max_memory_growth_mb = config.get('browserMaxMemoryGrowthMb', 1024)
+    scrape_workers = config.get('scrapeWorkers', 0)
+    scraper_backend = config.get('scraperBackend', 'selenium')
+    http_pool_size = config.get('httpPoolSize', 8)
+    pipeline_queue_size = config.get('pipelineQueueSize', 8)
+    delivery_batch_size = config.get('deliveryBatchSize', 0)
+    render_workers = config.get('renderWorkers', 0)
+    match_lead_minutes = config.get('matchLeadMinutes', 60*6)
+    refresh_minutes_before_kickoff = config.get('refreshMinutesBeforeKickoff', list())
+    listing_refresh_minutes = config.get('listingRefreshMinutes', 30)
+    processed_matches_path = config.get('processedMatchesPath', 'processed_matches.json')
+    store_path = config.get('storePath', 'mackolik.sqlite3')
+    fixture_tensors = config.get('fixtureTensors', True)
+    fixture_tensor_lazy = config.get('fixtureTensorLazy', False)
+    fixture_tensor_max_mb = config.get('fixtureTensorMaxMb', 256)
+    probability_model = config.get('probabilityModel', 'standings')
+    # a cycle taking longer than this is reported as an overrun
+    cycle_window_minutes = config.get('cycleWindowMinutes', listing_refresh_minutes)
+
     del config
 
-LOOP_SLEEP_TIME_SECONDS = 60*30
-MATCH_TIMEDELTA_MAX = datetime.timedelta(seconds=60*60*6)
-
-with open('page_cleaner.js', 'r') as f:
-    JS_PAGE_CLEANER = f.read()
-
-
-def get_team_names(wd: webdriver.Firefox, node: WebElement) -> list:
-    wh_main = wd.current_window_handle
-    node.find_element(By.TAG_NAME, 'a').click()
-    time.sleep(3)
-    wd.switch_to.window(wd.window_handles[-1])
-    team_names = list()
-    team_names.append(
-        wd.find_element(By.XPATH, '//a[@class="left-block-team-name"]')
-        .text.strip().lower())
-    team_names.append(
-        wd.find_element(By.XPATH, '//a[@class="r-left-block-team-name"]')
-        .text.strip().lower())
-    wd.close()
-    wd.switch_to.window(wh_main)
-    return team_names
-
-
-def get_league_table(wd: webdriver.Firefox, node: WebElement) -> list:
-    wh_main = wd.current_window_handle
-    node.click()
-    time.sleep(3)
-    wd.switch_to.window(wd.window_handles[-1])
-
-    data_rows = list()
-    try:
+    dir_path = os.path.dirname(os.path.abspath(__file__)).replace('/', '\\')
+    # see https://stackoverflow.com/a/55834112
+    options = Options()
+    options.binary_location = firefox_binary_path
+    options.add_argument('--headless')
+    #options.add_argument('log-level=2')
+    if firefox_profile_path is not None:
+        # a cached profile keeps site data between browser restarts
+        options.add_argument('-profile')
+        options.add_argument(firefox_profile_path)
+    # one browser is kept across iterations, see browser_manager.py
+    browser_manager = BrowserManager(
+        options,
+        addon_path='{}\\ublock_origin-1.43.0.xpi'.format(dir_path),
+        max_cycles=browser_max_cycles,
+        max_memory_growth_mb=browser_max_memory_growth_mb
+    )
+    wd: webdriver.Firefox = None
+    # league standings are scraped at most once per league within the ttl
+    standings_cache = StandingsCache(league_cache_ttl_seconds)
+    # team names that could not be read from the listing, by match id
+    team_name_cache = TeamNameCache(team_name_cache_path)
+    # with scrapeWorkers > 0, matches are scraped by a pool of headless browsers
+    scrape_pool: ScrapePool = None
+    if scrape_workers > 0:
+        worker_options = Options()
+        worker_options.binary_location = firefox_binary_path
+        worker_options.add_argument('--headless')
+        scrape_pool = ScrapePool(
+            worker_options,
+            scrape_workers,
+            standings_cache,
+            team_name_cache,
+            addon_path='{}\\ublock_origin-1.43.0.xpi'.format(dir_path),
+            max_cycles=browser_max_cycles,
+            max_memory_growth_mb=browser_max_memory_growth_mb
+        )
+    atexit.register(exit_handler, browser_manager, scrape_pool)
+
+    # with scraperBackend "http", plain pages are fetched and parsed without a browser
+    http_scraper: HttpScraper = None
+    if scraper_backend == 'http':
+        http_scraper = HttpScraper(http_pool_size)
+
+    # with renderWorkers > 0, workbooks are rendered in worker processes
+    render_executor: RenderExecutor = None
+    if render_workers > 0:
+        render_executor = RenderExecutor(render_workers)
+
+    # matches are processed once they start within match_lead_minutes, see match_scheduler.py
+    scheduler = MatchScheduler(
+        processed_matches_path,
+        datetime.timedelta(minutes=match_lead_minutes),
+        [datetime.timedelta(minutes=m) for m in refresh_minutes_before_kickoff],
+        datetime.timedelta(minutes=listing_refresh_minutes)
+    )
+    # standings, matches and score matrices are kept in sqlite, storePath null turns it off
+    store: MatchStore = None
+    if store_path:
+        store = MatchStore(store_path)
+    # every pairing of a league is priced once per standing table, retries and later matches are lookups
+    tensors: FixtureTensorCache = None
+    if fixture_tensors:
+        tensors = FixtureTensorCache(fixture_tensor_max_mb * 1024 * 1024, fixture_tensor_lazy)
+    # with probabilityModel "fitted", the normal page comes from team strengths fitted once per league
+    # standing table, see strength_model.py; "standings" keeps the means of the standing table
+    strengths: StrengthCache = None
+    if probability_model == 'fitted':
+        strengths = strength_cache
+    elif probability_model != 'standings':
+        raise ValueError('unknown probabilityModel {}'.format(probability_model))
+    delivered: list = list()
+    skipped: list = list()
+    match_jobs: list = list()
+
+    while True:
         try:
-            # make sure it's not in the finals league, e.g. KOSTA Apertural Final
-            # just choose the shortest name, that should do it (?)
-            # no groups no finals etc.
-            league_select: WebElement = wd.find_element(By.ID, 'Select2')
-            league_names = [e.text for e in league_select.find_elements(By.TAG_NAME, 'option')]
-            shortest_name = min(league_names, key=len)
-            if len(shortest_name) < len(Select(league_select).first_selected_option.text):
-                Select(league_select).select_by_visible_text(shortest_name)
-                time.sleep(3)
-        except NoSuchElementException:
-            print('no sub-league selector')
-        # go on to find the data table
-        standing_table = wd.find_element(By.ID, 'tblStanding')
-        table_rows = standing_table.find_elements(By.CSS_SELECTOR, '.puan_row')
-        for r in table_rows:
-            data_row = list()
-            row_data = r.find_elements(By.XPATH, './td')
-            for datum in row_data:
-                data_row.append(datum.text.strip().lower())
-            data_rows.append(data_row)
-    except Exception as e:
-        print(e)
-    finally:
-        wd.close()
-        wd.switch_to.window(wh_main)
-        return data_rows
-
-
-DIR_PATH = os.path.dirname(os.path.abspath(__file__)).replace('/', '\\')
-# see https://stackoverflow.com/a/55834112
-options = Options()
-options.binary_location = FIREFOX_BINARY_PATH
-options.add_argument('--headless')
-#options.add_argument('log-level=2')
-wd: webdriver.Firefox = None
-# these will be used to read the league table
-IDX_TEAM_NAME = 1
-IDX_TOTAL_MATCHES_PLAYED = 2
-IDX_TOTAL_GOALS_SCORED = 6
-IDX_TOTAL_GOALS_LOST = 7
-IDX_HT_MATCHES_PLAYED = 11
-IDX_HT_GOALS_SCORED = 15
-IDX_HT_GOALS_LOST = 16
-IDX_AT_MATCHES_PLAYED = 19
-IDX_AT_GOALS_SCORED = 23
-IDX_AT_GOALS_LOST = 24
-
-
-file_list: list = list()
-
-while True:
-    try:
-        file_list = list()
-        wd = webdriver.Firefox(options=options)
-        # see https://datarebellion.com/blog/using-firefox-extensions-with-selenium-in-python/
-        wd.install_addon('{}\\ublock_origin-1.43.0.xpi'.format(DIR_PATH))
-        wd.fullscreen_window()
-        # record starting time
-        dt_now = datetime.datetime.now() + datetime.timedelta(hours=TIME_OFFSET_HOURS)
-        print('░▒▓ Iteration start {}'.format(dt_now.strftime('%Y.%m.%d %H:%M\'%S"')))
-
-        # go to webpage
-        wd.get('http://arsiv.mackolik.com/Iddaa-Programi')
-
-        # change webpage settings
-        Select(wd.find_element(By.ID, 'IddaaDateCmb')).select_by_value('-1')
-        time.sleep(3)
-        wd.find_element(By.XPATH, '//a[@href="#" and @type="2"]').click()
-        time.sleep(3)
-        wd.execute_script(JS_PAGE_CLEANER)
-
-        # organise all the matches
-        match_entries = wd.find_elements(By.XPATH, '//span[@id="iddaa-tab-body2"]/table/tbody/tr')
-
-        # process relevant data
-        skip_next = False
-        list_date = dt_now
-        for match_entry in match_entries:
-            # check if we should skip this entry
-            if skip_next:
-                skip_next = False
-                continue
-            print('░▒▓ Entry:')
-            # check if this entry is just a date header
-            if match_entry.get_attribute('class') == 'iddaa-oyna-title2':
-                datestr = match_entry.find_elements(By.TAG_NAME,'td')[0].text.strip()
-                list_date = datetime.datetime.strptime(datestr, '%d.%m.%Y')
-                skip_next = True
-                print('is date header, skip next')
-                continue
-            # this entry is a match, figure out what time it starts
-            entry_children = match_entry.find_elements(By.TAG_NAME, 'td')
-            match_time = datetime.datetime.strptime(
-                entry_children[0].get_attribute('innerHTML'), '%H:%M')
-            match_dt = datetime.datetime(
-                list_date.year,
-                list_date.month,
-                list_date.day,
-                match_time.hour,
-                match_time.minute
+            delivered = list()
+            skipped = list()
+            match_jobs = list()
+            start_cycle()
+            standings_cache.expire()
+            reset_waits()
+            wd = None
+            # record starting time
+            dt_now = datetime.datetime.now() + datetime.timedelta(hours=time_offset_hours)
+            print('░▒▓ Iteration start {}'.format(dt_now.strftime('%Y.%m.%d %H:%M\'%S"')))
+
+            # figure out which matches to scrape
+            # match_jobs stays a list for the metrics, even if reading the listing fails
+            listing_jobs = None
+            if http_scraper is not None:
+                listing_rows = http_scraper.get_listing_rows()
+                if len(listing_rows) > 0:
+                    listing_jobs = build_match_jobs(listing_rows, dt_now, scheduler.listing_horizon())
+                if listing_jobs is None or not all_navigable(listing_jobs):
+                    print('no usable listing over http, falling back to the browser')
+                    listing_jobs = None
+            if listing_jobs is None:
+                wd = browser_manager.acquire()
+                listing_jobs = build_match_jobs(load_listing(wd), dt_now, scheduler.listing_horizon())
+            scheduler.update_listing(listing_jobs, dt_now)
+            # only the matches that are due, anything already sent is skipped
+            match_jobs = scheduler.due_jobs(listing_jobs, dt_now)
+            print('{} matches due'.format(len(match_jobs)))
+
+            # scrape, compute, render and send in overlapping stages
+            delivered, skipped = run_pipeline(
+                iter_scrape_results(
+                    match_jobs, wd, browser_manager, standings_cache, team_name_cache,
+                    scrape_pool, http_scraper),
+                queue_size=pipeline_queue_size,
+                delivery_batch_size=delivery_batch_size,
+                render_executor=render_executor,
+                store=store,
+                tensors=tensors,
+                strengths=strengths
             )
-            dt_difference = match_dt - dt_now
-            print('time difference {}'.format(dt_difference))
-            # check when the match takes place, relative to dt_now
-            if dt_difference < MATCH_TIMEDELTA_MAX:
-                # this match happens within the next hour, scrape data
-                team_names = get_team_names(wd, entry_children[4])
-                match_name = '{} {} - {}'.format(
-                    match_dt.strftime('%Y.%m.%d %H.%M'), team_names[0], team_names[1])
-                print('match {}'.format(match_name))
-                league_table = get_league_table(wd, entry_children[1])
-                time.sleep(1)
-                if len(league_table) == 0:
-                    # some leagues(?) such as ROK GKOK do not have standing tables
-                    # just skip those I guess
-                    print('no standing table for {} - {}'.format(team_names[0], team_names[1]))
-                    continue
-                ht_data = next(r for r in league_table if r[IDX_TEAM_NAME] == team_names[0])
-                at_data = next(r for r in league_table if r[IDX_TEAM_NAME] == team_names[1])
-                filename = '{}.xlsx'.format(match_name)
-                probability_machine.write_spreadsheet(
-                    filename=filename,
-
-                    ht_total_matches_played=int(ht_data[IDX_TOTAL_MATCHES_PLAYED]),
-                    ht_total_goals_scored=int(ht_data[IDX_TOTAL_GOALS_SCORED]),
-                    ht_total_goals_lost=int(ht_data[IDX_TOTAL_GOALS_LOST]),
-                    at_total_matches_played=int(at_data[IDX_TOTAL_MATCHES_PLAYED]),
-                    at_total_goals_scored=int(at_data[IDX_TOTAL_GOALS_SCORED]),
-                    at_total_goals_lost=int(at_data[IDX_TOTAL_GOALS_LOST]),
-                    league_home_matches_played=sum(
-                        [int(r[IDX_HT_MATCHES_PLAYED]) for r in league_table]),
-
-                    ht_home_matches_played=int(ht_data[IDX_HT_MATCHES_PLAYED]),
-                    ht_home_goals_scored=int(ht_data[IDX_HT_GOALS_SCORED]),
-                    ht_home_goals_lost=int(ht_data[IDX_HT_GOALS_LOST]),
-                    at_away_matches_played=int(at_data[IDX_AT_MATCHES_PLAYED]),
-                    at_away_goals_scored=int(at_data[IDX_AT_GOALS_SCORED]),
-                    at_away_goals_lost=int(at_data[IDX_AT_GOALS_LOST]),
-                    league_total_matches_played=sum(
-                        [int(r[IDX_TOTAL_MATCHES_PLAYED]) for r in league_table]),
-
-                    league_home_goals=sum([int(r[IDX_HT_GOALS_SCORED]) for r in league_table]),
-                    league_away_goals=sum([int(r[IDX_AT_GOALS_SCORED]) for r in league_table])
-                )
-                print('OK wrote file `{}`'.format(filename))
-                file_list.append(filename)
-            else:
-                print('end entries')
-                # this match is more than one hour later; break and go to sleep
-                break
-
-    except KeyboardInterrupt as e:
-        os._exit(1)
-    except Exception as e:
-        print('Error in iteration: {}'.format(e))
-    finally:
-        # close window
-        if wd is not None:
-            wd.quit()
+            # skipped matches are not recorded, a skip is often a failed scrape
+            # and they are tried again next cycle
+            for job in delivered:
+                scheduler.mark_processed(job, dt_now)
+
+        except KeyboardInterrupt as e:
+            os._exit(1)
+        except Exception as e:
+            print('Error in iteration: {}'.format(e))
+        finally:
+            # the browser stays open for the next iteration
             wd = None
-        # send emails and delete files
-        if len(file_list) == 0:
-            print('░▒▓ No matches this iteration')
-        else:
-            email_machine.send_update(file_list)
-            print('░▒▓ Update sent, {} matches'.format(len(file_list)))
-            for filename in file_list:
-                if os.path.exists(filename):
-                    os.remove(filename)
-        file_list = list()
-        # go to sleep
-        print('░▒▓ Iteration end {}'.format(
-            datetime.datetime.now().strftime('%Y.%m.%d %H:%M\'%S"')))
-        time.sleep(LOOP_SLEEP_TIME_SECONDS)
\ No newline at end of file
+            team_name_cache.save()
+            if store is not None:
+                try:
+                    print('stored {} records'.format(store.flush()))
+                except Exception as e:
+                    print('Error writing store: {}'.format(e))
+            print_wait_summary()
+            try:
+                cycle = end_cycle(
+                    cycle_window_minutes * 60,
+                    wait_summary(),
+                    due=len(match_jobs),
+                    delivered=len(delivered),
+                    skipped=len(skipped)
+                )
+                print_cycle(cycle)
+                export_cycle(cycle)
+            except Exception as e:
+                print('Error writing metrics: {}'.format(e))
+            dt_end = datetime.datetime.now() + datetime.timedelta(hours=time_offset_hours)
+            scheduler.prune(dt_end)
+            scheduler.save()
+            # emails were sent by the pipeline, the files only ever exist in memory
+            if len(delivered) == 0:
+                print('░▒▓ No matches this iteration')
+            delivered = list()
+            # go to sleep until the next match is due or the listing needs a refresh
+            dt_wake = scheduler.next_wake(dt_end)
+            print('░▒▓ Iteration end {}, next {}'.format(
+                datetime.datetime.now().strftime('%Y.%m.%d %H:%M\'%S"'),
+                dt_wake.strftime('%Y.%m.%d %H:%M\'%S"')))
+            time.sleep(max(1, (dt_wake - dt_end).total_seconds()))
+
+
+# render worker processes import this file, so only run the loop as a script
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,161 @@
+import numpy as np
+from typing import NamedTuple
+from functools import lru_cache
+
+# every market is a reduction over the same score matrix, for a whole slate at once;
+# score_matrix[n, i, j] = P(home team scores i, visitor team scores j), see probability_engine.PageData
+
+# number of most likely scores kept
+TOP_SCORES = 5
+# home team handicaps, whole lines can push
+ASIAN_HANDICAP_LINES = [-2.5, -2, -1.5, -1, -0.5, 0, 0.5, 1, 1.5, 2, 2.5]
+# n,5 goals of one team
+TEAM_TOTAL_LINES = [0.5, 1.5, 2.5, 3.5]
+
+
+class Markets(NamedTuple):
+    # home win, draw, visitor win, shape (N, 3)
+    result: np.ndarray
+    # 1X, 12, X2, shape (N, 3)
+    double_chance: np.ndarray
+    # P(both teams score), shape (N,)
+    both_teams_score: np.ndarray
+    # most likely scores first, shape (N, TOP_SCORES) each
+    top_score_home_goals: np.ndarray
+    top_score_visitor_goals: np.ndarray
+    top_score_probability: np.ndarray
+    # for the home team at each of ASIAN_HANDICAP_LINES, shape (N, L) each
+    asian_handicap_win: np.ndarray
+    asian_handicap_push: np.ndarray
+    asian_handicap_lose: np.ndarray
+    # P(team scores more than each of TEAM_TOTAL_LINES), shape (N, T) each
+    home_total_over: np.ndarray
+    visitor_total_over: np.ndarray
+
+
+@lru_cache(maxsize=None)
+def goal_difference_map(max_goals: int) -> np.ndarray:
+    # one-hot (G*G, 2G-1) map from score cells to home minus visitor goals + G-1
+    goals = np.arange(max_goals)
+    difference = (goals[:, None] - goals[None, :]).ravel() + max_goals - 1
+    difference_map = np.zeros((max_goals * max_goals, 2 * max_goals - 1))
+    difference_map[np.arange(max_goals * max_goals), difference] = 1
+    return difference_map
+
+
+def goal_difference_pmf(score_matrix: np.ndarray) -> np.ndarray:
+    # P(home minus visitor goals = d) at index d + G-1, shape (N, 2G-1)
+    n, max_goals, _ = score_matrix.shape
+    return score_matrix.reshape(n, -1) @ goal_difference_map(max_goals)
+
+
+def asian_handicap(difference_pmf: np.ndarray, lines: list) -> tuple:
+    # (win, push, lose) of a home bet at each handicap line
+    offset = (difference_pmf.shape[1] - 1) // 2
+    differences = np.arange(difference_pmf.shape[1]) - offset
+    lines = np.asarray(lines, dtype=np.float64)
+    # the bet is settled on goal difference + line
+    settled = differences[None, :] + lines[:, None]
+    win = difference_pmf @ (settled > 0).T.astype(np.float64)
+    push = difference_pmf @ (settled == 0).T.astype(np.float64)
+    lose = difference_pmf @ (settled < 0).T.astype(np.float64)
+    return win, push, lose
+
+
+def team_total_over(goal_pmf: np.ndarray, lines: list) -> np.ndarray:
+    # P(goals > line) for n,5 lines
+    cdf = np.cumsum(goal_pmf, axis=-1)
+    indices = np.minimum(np.floor(lines).astype(int), goal_pmf.shape[1] - 1)
+    return 1 - cdf[:, indices]
+
+
+def top_scores(score_matrix: np.ndarray, k: int) -> tuple:
+    n, max_goals, _ = score_matrix.shape
+    k = min(k, max_goals * max_goals)
+    flat = score_matrix.reshape(n, -1)
+    top = np.argpartition(-flat, k - 1, axis=1)[:, :k]
+    top_probability = np.take_along_axis(flat, top, axis=1)
+    order = np.argsort(-top_probability, axis=1, kind='stable')
+    top = np.take_along_axis(top, order, axis=1)
+    return top // max_goals, top % max_goals, np.take_along_axis(top_probability, order, axis=1)
+
+
+def compute_markets(score_matrix: np.ndarray, top_k: int = TOP_SCORES) -> Markets:
+    score_matrix = np.asarray(score_matrix, dtype=np.float64)
+    if score_matrix.ndim == 2:
+        score_matrix = score_matrix[None]
+    max_goals = score_matrix.shape[1]
+
+    difference_pmf = goal_difference_pmf(score_matrix)
+    home_win = difference_pmf[:, max_goals:].sum(axis=1)
+    draw = difference_pmf[:, max_goals - 1]
+    visitor_win = difference_pmf[:, :max_goals - 1].sum(axis=1)
+    result = np.stack([home_win, draw, visitor_win], axis=-1)
+    double_chance = np.stack([home_win + draw, home_win + visitor_win, draw + visitor_win], axis=-1)
+
+    both_teams_score = score_matrix[:, 1:, 1:].sum(axis=(1, 2))
+    top_home, top_visitor, top_probability = top_scores(score_matrix, top_k)
+    win, push, lose = asian_handicap(difference_pmf, ASIAN_HANDICAP_LINES)
+
+    return Markets(
+        result=result,
+        double_chance=double_chance,
+        both_teams_score=both_teams_score,
+        top_score_home_goals=top_home,
+        top_score_visitor_goals=top_visitor,
+        top_score_probability=top_probability,
+        asian_handicap_win=win,
+        asian_handicap_push=push,
+        asian_handicap_lose=lose,
+        home_total_over=team_total_over(score_matrix.sum(axis=2), TEAM_TOTAL_LINES),
+        visitor_total_over=team_total_over(score_matrix.sum(axis=1), TEAM_TOTAL_LINES)
+    )
+
+
+def fair_odds(probability: np.ndarray) -> np.ndarray:
+    with np.errstate(divide='ignore'):
+        return np.reciprocal(np.asarray(probability, dtype=np.float64))
+
+
+def asian_handicap_odds(markets: Markets) -> np.ndarray:
+    # a push returns the stake, so fair odds are (win + lose) / win
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return (markets.asian_handicap_win + markets.asian_handicap_lose) / markets.asian_handicap_win
+
+
+def markets_slice(markets: Markets, index: int) -> Markets:
+    # the markets of a single match, keeping the leading axis
+    return Markets(*(field[index:index+1] for field in markets))
+
+
+def line_label(line: float) -> str:
+    # n,5 like the over/under columns, whole lines without a decimal
+    if line == int(line):
+        return '{:+d}'.format(int(line)) if line != 0 else '0'
+    return '{}{},5'.format('-' if line < 0 else '+', int(abs(line)))
+
+
+def market_columns(markets: Markets) -> dict:
+    # column name -> values of shape (N,), for flat outputs such as csv
+    columns = {
+        'result_1': markets.result[:, 0],
+        'result_x': markets.result[:, 1],
+        'result_2': markets.result[:, 2],
+        'double_chance_1x': markets.double_chance[:, 0],
+        'double_chance_12': markets.double_chance[:, 1],
+        'double_chance_x2': markets.double_chance[:, 2],
+        'both_teams_score_yes': markets.both_teams_score,
+        'both_teams_score_no': 1 - markets.both_teams_score,
+    }
+    for k in range(markets.top_score_probability.shape[1]):
+        columns['top_score_{}_home_goals'.format(k + 1)] = markets.top_score_home_goals[:, k]
+        columns['top_score_{}_visitor_goals'.format(k + 1)] = markets.top_score_visitor_goals[:, k]
+        columns['top_score_{}_probability'.format(k + 1)] = markets.top_score_probability[:, k]
+    for l, line in enumerate(ASIAN_HANDICAP_LINES):
+        columns['asian_handicap_{}_win'.format(line_label(line))] = markets.asian_handicap_win[:, l]
+        columns['asian_handicap_{}_push'.format(line_label(line))] = markets.asian_handicap_push[:, l]
+        columns['asian_handicap_{}_lose'.format(line_label(line))] = markets.asian_handicap_lose[:, l]
+    for t, line in enumerate(TEAM_TOTAL_LINES):
+        columns['home_total_over_{}'.format(line_label(line).lstrip('+'))] = markets.home_total_over[:, t]
+        columns['visitor_total_over_{}'.format(line_label(line).lstrip('+'))] = markets.visitor_total_over[:, t]
+    return columns
@@ -0,0 +1,111 @@
+import os
+import json
+import datetime
+
+from scraper import MatchJob
+
+# how long processed matches are remembered after kickoff
+RECORD_KEEP_TIMEDELTA = datetime.timedelta(days=1)
+
+
+def job_key(job: MatchJob) -> str:
+    if job.match_id is not None:
+        return job.match_id
+    names = ' - '.join(job.listing_team_names or [job.league_key or ''])
+    return '{} {}'.format(job.kickoff.strftime('%Y.%m.%d %H.%M'), names)
+
+
+class MatchScheduler:
+    # decides which matches to process and when to wake up next, instead of a fixed sleep;
+    # processed matches are saved as json so a restart does not send them again
+
+    def __init__(
+        self,
+        path: str,
+        lead_timedelta: datetime.timedelta,
+        refresh_timedeltas: list,
+        listing_refresh_timedelta: datetime.timedelta
+    ):
+        self.path = path
+        # a match is processed once it starts within lead_timedelta
+        self.lead_timedelta = lead_timedelta
+        # and sent again when it starts within each of refresh_timedeltas
+        self.refresh_timedeltas = sorted(refresh_timedeltas, reverse=True)
+        # the listing is read at least this often, to find new matches
+        self.listing_refresh_timedelta = listing_refresh_timedelta
+        # match key -> {'kickoff': iso time, 'sent': [iso time, ...]}
+        self.records = dict()
+        # match key -> kickoff, from the last listing
+        self.upcoming = dict()
+        self.last_listing: datetime.datetime = None
+        if path and os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    self.records = json.loads(f.read())
+            except Exception as e:
+                print('Processed match record error: {}'.format(e))
+
+    def listing_horizon(self) -> datetime.timedelta:
+        # every match that can become due before the next listing read
+        return self.lead_timedelta + self.listing_refresh_timedelta
+
+    def update_listing(self, match_jobs: list, now: datetime.datetime) -> None:
+        self.upcoming = {job_key(job): job.kickoff for job in match_jobs}
+        self.last_listing = now
+
+    def last_sent(self, key: str) -> datetime.datetime:
+        record = self.records.get(key)
+        if record is None or len(record['sent']) == 0:
+            return None
+        return datetime.datetime.fromisoformat(max(record['sent']))
+
+    def is_due(self, job: MatchJob, now: datetime.datetime) -> bool:
+        if job.kickoff - now >= self.lead_timedelta:
+            return False
+        last_sent = self.last_sent(job_key(job))
+        if last_sent is None:
+            return True
+        # refresh if a refresh point has passed since it was last sent
+        return any(
+            last_sent < job.kickoff - refresh <= now
+            for refresh in self.refresh_timedeltas)
+
+    def due_jobs(self, match_jobs: list, now: datetime.datetime) -> list:
+        # re-indexed, since results are collected by job index
+        due = [job for job in match_jobs if self.is_due(job, now)]
+        return [job._replace(index=i) for i, job in enumerate(due)]
+
+    def mark_processed(self, job: MatchJob, now: datetime.datetime) -> None:
+        record = self.records.setdefault(
+            job_key(job), {'kickoff': job.kickoff.isoformat(), 'sent': list()})
+        record['sent'].append(now.isoformat())
+
+    def next_wake(self, now: datetime.datetime) -> datetime.datetime:
+        wake_times = list()
+        if self.last_listing is not None:
+            wake_times.append(self.last_listing + self.listing_refresh_timedelta)
+        for key, kickoff in self.upcoming.items():
+            last_sent = self.last_sent(key)
+            if last_sent is None:
+                wake_times.append(kickoff - self.lead_timedelta)
+            for refresh in self.refresh_timedeltas:
+                refresh_time = kickoff - refresh
+                if last_sent is None or last_sent < refresh_time:
+                    wake_times.append(refresh_time)
+        future_wake_times = [t for t in wake_times if t > now]
+        if len(future_wake_times) == 0:
+            return now + self.listing_refresh_timedelta
+        return min(future_wake_times)
+
+    def prune(self, now: datetime.datetime) -> None:
+        for key in [
+            k for k, record in self.records.items()
+            if datetime.datetime.fromisoformat(record['kickoff']) < now - RECORD_KEEP_TIMEDELTA
+        ]:
+            del self.records[key]
+
+    def save(self) -> None:
+        if not self.path:
+            return
+        with open(self.path, 'w', encoding='utf-8') as f:
+            f.write(json.dumps(self.records))
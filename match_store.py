@@ -0,0 +1,383 @@
+import json
+import sqlite3
+import datetime
+import threading
+
+import numpy as np
+
+from league_table import (
+    LeagueStandings, IDX_TEAM_NAME,
+    IDX_TOTAL_MATCHES_PLAYED, IDX_TOTAL_GOALS_SCORED, IDX_TOTAL_GOALS_LOST,
+    IDX_HT_MATCHES_PLAYED, IDX_HT_GOALS_SCORED, IDX_HT_GOALS_LOST,
+    IDX_AT_MATCHES_PLAYED, IDX_AT_GOALS_SCORED, IDX_AT_GOALS_LOST
+)
+from probability_engine import PageData
+from match_scheduler import job_key
+
+# everything scraped and computed is kept here, so it can be looked up later
+# without scraping mackolik again; writes are queued and go in once per cycle, see flush
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS leagues (
+    id INTEGER PRIMARY KEY,
+    league_key TEXT NOT NULL UNIQUE,
+    url TEXT
+);
+CREATE TABLE IF NOT EXISTS teams (
+    id INTEGER PRIMARY KEY,
+    league_id INTEGER NOT NULL REFERENCES leagues(id),
+    name TEXT NOT NULL,
+    UNIQUE (league_id, name)
+);
+CREATE INDEX IF NOT EXISTS teams_name ON teams (name);
+CREATE TABLE IF NOT EXISTS standings_snapshots (
+    id INTEGER PRIMARY KEY,
+    league_id INTEGER NOT NULL REFERENCES leagues(id),
+    scraped_at TEXT NOT NULL,
+    UNIQUE (league_id, scraped_at)
+);
+CREATE INDEX IF NOT EXISTS standings_snapshots_scraped_at ON standings_snapshots (scraped_at);
+CREATE TABLE IF NOT EXISTS standings_rows (
+    snapshot_id INTEGER NOT NULL REFERENCES standings_snapshots(id),
+    team_id INTEGER NOT NULL REFERENCES teams(id),
+    total_matches_played INTEGER,
+    total_goals_scored INTEGER,
+    total_goals_lost INTEGER,
+    home_matches_played INTEGER,
+    home_goals_scored INTEGER,
+    home_goals_lost INTEGER,
+    away_matches_played INTEGER,
+    away_goals_scored INTEGER,
+    away_goals_lost INTEGER,
+    -- the whole row as scraped, as a json list
+    cells TEXT NOT NULL,
+    PRIMARY KEY (snapshot_id, team_id)
+);
+CREATE INDEX IF NOT EXISTS standings_rows_team ON standings_rows (team_id);
+CREATE TABLE IF NOT EXISTS matches (
+    id INTEGER PRIMARY KEY,
+    match_key TEXT NOT NULL UNIQUE,
+    match_id TEXT,
+    league_id INTEGER REFERENCES leagues(id),
+    home_team_id INTEGER REFERENCES teams(id),
+    away_team_id INTEGER REFERENCES teams(id),
+    kickoff TEXT NOT NULL,
+    url TEXT
+);
+CREATE INDEX IF NOT EXISTS matches_kickoff ON matches (kickoff);
+CREATE INDEX IF NOT EXISTS matches_league_kickoff ON matches (league_id, kickoff);
+CREATE INDEX IF NOT EXISTS matches_home_team ON matches (home_team_id, kickoff);
+CREATE INDEX IF NOT EXISTS matches_away_team ON matches (away_team_id, kickoff);
+CREATE TABLE IF NOT EXISTS score_matrices (
+    id INTEGER PRIMARY KEY,
+    match_id INTEGER NOT NULL REFERENCES matches(id),
+    snapshot_id INTEGER REFERENCES standings_snapshots(id),
+    -- 'normal' or 'double', see probability_engine.compute_workbooks
+    page TEXT NOT NULL,
+    computed_at TEXT NOT NULL,
+    ht_adj_mean_goals REAL,
+    vt_adj_mean_goals REAL,
+    max_goals INTEGER NOT NULL,
+    -- float64 [home goals, visitor goals], row-major
+    matrix BLOB NOT NULL,
+    -- float64 P(total goals <= k)
+    under BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS score_matrices_match ON score_matrices (match_id, computed_at);
+'''
+
+STANDINGS_COLUMNS = [
+    IDX_TOTAL_MATCHES_PLAYED, IDX_TOTAL_GOALS_SCORED, IDX_TOTAL_GOALS_LOST,
+    IDX_HT_MATCHES_PLAYED, IDX_HT_GOALS_SCORED, IDX_HT_GOALS_LOST,
+    IDX_AT_MATCHES_PLAYED, IDX_AT_GOALS_SCORED, IDX_AT_GOALS_LOST
+]
+
+
+def to_int(value) -> int:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def from_blob(blob: bytes, shape: tuple = None) -> np.ndarray:
+    values = np.frombuffer(blob, dtype=np.float64)
+    return values if shape is None else values.reshape(shape)
+
+
+class MatchStore:
+    # sqlite file at path; record_* only queue rows and may be called from any thread,
+    # flush writes everything queued in one transaction
+
+    def __init__(self, path: str):
+        self.path = path
+        # one connection, shared by the threads that read through it
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA foreign_keys=ON')
+        self.connection.executescript(SCHEMA)
+        self.connection.commit()
+        self.lock = threading.Lock()
+        # guards the connection, so lookups never interleave with a flush
+        self.connection_lock = threading.Lock()
+        # (league_key, league_url, LeagueStandings)
+        self.pending_standings = list()
+        # (scraper.MatchJob, team_names, LeagueStandings)
+        self.pending_matches = list()
+        # (scraper.MatchJob, page name, PageData, index, computed_at)
+        self.pending_pages = list()
+
+    def record_standings(self, league_key: str, league_url: str, standings: LeagueStandings) -> None:
+        with self.lock:
+            self.pending_standings.append((league_key, league_url, standings))
+
+    def record_match(self, job, team_names: list, standings: LeagueStandings = None) -> None:
+        with self.lock:
+            self.pending_matches.append((job, team_names, standings))
+
+    def record_pages(self, job, normal_page: PageData, double_page: PageData, index: int) -> None:
+        computed_at = datetime.datetime.now().isoformat()
+        with self.lock:
+            self.pending_pages.append((job, 'normal', normal_page, index, computed_at))
+            self.pending_pages.append((job, 'double', double_page, index, computed_at))
+
+    def league_id(self, league_key: str, league_url: str = None) -> int:
+        self.connection.execute(
+            'INSERT OR IGNORE INTO leagues (league_key, url) VALUES (?, ?)', (league_key, league_url))
+        return self.connection.execute(
+            'SELECT id FROM leagues WHERE league_key = ?', (league_key,)).fetchone()[0]
+
+    def team_ids(self, league_id: int, names: list) -> dict:
+        self.connection.executemany(
+            'INSERT OR IGNORE INTO teams (league_id, name) VALUES (?, ?)',
+            [(league_id, name) for name in names])
+        return {
+            name: team_id for team_id, name in self.connection.execute(
+                'SELECT id, name FROM teams WHERE league_id = ?', (league_id,))
+        }
+
+    def snapshot_id(self, league_id: int, standings: LeagueStandings) -> int:
+        scraped_at = standings.scraped_at.isoformat()
+        cursor = self.connection.execute(
+            'INSERT OR IGNORE INTO standings_snapshots (league_id, scraped_at) VALUES (?, ?)',
+            (league_id, scraped_at))
+        snapshot_id = self.connection.execute(
+            'SELECT id FROM standings_snapshots WHERE league_id = ? AND scraped_at = ?',
+            (league_id, scraped_at)).fetchone()[0]
+        if cursor.rowcount > 0:
+            # a new snapshot, its rows go in too
+            team_ids = self.team_ids(league_id, [r[IDX_TEAM_NAME] for r in standings.rows])
+            self.connection.executemany(
+                'INSERT OR REPLACE INTO standings_rows VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                [
+                    (snapshot_id, team_ids[r[IDX_TEAM_NAME]])
+                    + tuple(to_int(r[i]) if i < len(r) else None for i in STANDINGS_COLUMNS)
+                    + (json.dumps(r, ensure_ascii=False),)
+                    for r in standings.rows
+                ])
+        return snapshot_id
+
+    def flush(self) -> int:
+        # writes everything recorded since the last flush, returns the number of rows queued
+        with self.lock:
+            pending_standings, self.pending_standings = self.pending_standings, list()
+            pending_matches, self.pending_matches = self.pending_matches, list()
+            pending_pages, self.pending_pages = self.pending_pages, list()
+        count = len(pending_standings) + len(pending_matches) + len(pending_pages)
+        if count == 0:
+            return 0
+        try:
+            self.write_pending(pending_standings, pending_matches, pending_pages)
+        except Exception:
+            # the transaction was rolled back, the rows go in with the next flush
+            with self.lock:
+                self.pending_standings = pending_standings + self.pending_standings
+                self.pending_matches = pending_matches + self.pending_matches
+                self.pending_pages = pending_pages + self.pending_pages
+            raise
+        return count
+
+    def write_pending(self, pending_standings: list, pending_matches: list, pending_pages: list) -> None:
+        # one transaction, nothing is written if any of it fails
+        with self.connection_lock, self.connection:
+            league_ids = dict()
+            # a cached table is recorded by every match of its league, but stored once
+            snapshot_ids = dict()
+            for league_key, league_url, standings in pending_standings:
+                if league_key not in league_ids:
+                    league_ids[league_key] = self.league_id(league_key, league_url)
+                if id(standings) not in snapshot_ids:
+                    snapshot_ids[id(standings)] = self.snapshot_id(league_ids[league_key], standings)
+
+            match_rows = list()
+            for job, team_names, standings in pending_matches:
+                league_key = job.league_key or ''
+                if league_key not in league_ids:
+                    league_ids[league_key] = self.league_id(league_key, job.league_url)
+                team_ids = self.team_ids(league_ids[league_key], team_names)
+                match_rows.append((
+                    job_key(job), job.match_id, league_ids[league_key],
+                    team_ids[team_names[0]], team_ids[team_names[1]],
+                    job.kickoff.isoformat(), job.match_url
+                ))
+            # a match sent again keeps its row, with whatever changed updated
+            self.connection.executemany(
+                'INSERT INTO matches (match_key, match_id, league_id, home_team_id, away_team_id, kickoff, url) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?) '
+                'ON CONFLICT (match_key) DO UPDATE SET '
+                'league_id = excluded.league_id, home_team_id = excluded.home_team_id, '
+                'away_team_id = excluded.away_team_id, kickoff = excluded.kickoff, url = excluded.url',
+                match_rows)
+
+            match_snapshots = {
+                job_key(job): snapshot_ids.get(id(standings))
+                for job, _, standings in pending_matches
+            }
+            keys = list({job_key(job) for job, _, _, _, _ in pending_pages})
+            match_ids = dict()
+            for key in keys:
+                row = self.connection.execute(
+                    'SELECT id FROM matches WHERE match_key = ?', (key,)).fetchone()
+                if row is not None:
+                    match_ids[key] = row[0]
+            self.connection.executemany(
+                'INSERT INTO score_matrices (match_id, snapshot_id, page, computed_at, '
+                'ht_adj_mean_goals, vt_adj_mean_goals, max_goals, matrix, under) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                [
+                    (
+                        match_ids[job_key(job)], match_snapshots.get(job_key(job)), page_name, computed_at,
+                        float(page.ht_adj_mean_goals[index]), float(page.vt_adj_mean_goals[index]),
+                        int(page.max_goals[index]),
+                        np.ascontiguousarray(
+                            page.score_matrix[index, :page.max_goals[index], :page.max_goals[index]],
+                            dtype=np.float64).tobytes(),
+                        np.ascontiguousarray(page.under[index], dtype=np.float64).tobytes()
+                    )
+                    for job, page_name, page, index, computed_at in pending_pages
+                    if job_key(job) in match_ids
+                ])
+
+    def matches(
+        self,
+        start: datetime.datetime = None,
+        end: datetime.datetime = None,
+        league_key: str = None,
+        team_name: str = None
+    ) -> list:
+        # matches kicking off in [start, end), optionally of one league or team, as dicts
+        query = (
+            'SELECT m.id, m.match_key, m.match_id, l.league_key, h.name, a.name, m.kickoff, m.url '
+            'FROM matches m '
+            'JOIN leagues l ON l.id = m.league_id '
+            'JOIN teams h ON h.id = m.home_team_id '
+            'JOIN teams a ON a.id = m.away_team_id '
+            'WHERE 1 = 1')
+        params = list()
+        if start is not None:
+            query += ' AND m.kickoff >= ?'
+            params.append(start.isoformat())
+        if end is not None:
+            query += ' AND m.kickoff < ?'
+            params.append(end.isoformat())
+        if league_key is not None:
+            query += ' AND l.league_key = ?'
+            params.append(league_key)
+        if team_name is not None:
+            query += ' AND (h.name = ? OR a.name = ?)'
+            params += [team_name, team_name]
+        query += ' ORDER BY m.kickoff'
+        with self.connection_lock:
+            rows = self.connection.execute(query, params).fetchall()
+        return [
+            {
+                'id': row[0], 'match_key': row[1], 'match_id': row[2], 'league_key': row[3],
+                'home_team': row[4], 'away_team': row[5],
+                'kickoff': datetime.datetime.fromisoformat(row[6]), 'url': row[7]
+            }
+            for row in rows
+        ]
+
+    def standings_snapshots(
+        self,
+        league_key: str,
+        start: datetime.datetime = None,
+        end: datetime.datetime = None
+    ) -> list:
+        # (scraped_at, rows) of one league, oldest first; rows are as scraped
+        query = (
+            'SELECT s.id, s.scraped_at FROM standings_snapshots s '
+            'JOIN leagues l ON l.id = s.league_id WHERE l.league_key = ?')
+        params = [league_key]
+        if start is not None:
+            query += ' AND s.scraped_at >= ?'
+            params.append(start.isoformat())
+        if end is not None:
+            query += ' AND s.scraped_at < ?'
+            params.append(end.isoformat())
+        query += ' ORDER BY s.scraped_at'
+        with self.connection_lock:
+            snapshots = self.connection.execute(query, params).fetchall()
+            return [
+                (
+                    datetime.datetime.fromisoformat(scraped_at),
+                    [
+                        json.loads(cells) for (cells,) in self.connection.execute(
+                            'SELECT cells FROM standings_rows WHERE snapshot_id = ?', (snapshot_id,))
+                    ]
+                )
+                for snapshot_id, scraped_at in snapshots
+            ]
+
+    def latest_standings(self, league_key: str) -> list:
+        snapshots = self.standings_snapshots(league_key)
+        return snapshots[-1][1] if len(snapshots) > 0 else None
+
+    def team_history(
+        self,
+        team_name: str,
+        start: datetime.datetime = None,
+        end: datetime.datetime = None
+    ) -> list:
+        # (league_key, scraped_at, row) of every snapshot the team is in, oldest first
+        query = (
+            'SELECT l.league_key, s.scraped_at, r.cells FROM standings_rows r '
+            'JOIN teams t ON t.id = r.team_id '
+            'JOIN standings_snapshots s ON s.id = r.snapshot_id '
+            'JOIN leagues l ON l.id = s.league_id '
+            'WHERE t.name = ?')
+        params = [team_name]
+        if start is not None:
+            query += ' AND s.scraped_at >= ?'
+            params.append(start.isoformat())
+        if end is not None:
+            query += ' AND s.scraped_at < ?'
+            params.append(end.isoformat())
+        query += ' ORDER BY s.scraped_at'
+        with self.connection_lock:
+            rows = self.connection.execute(query, params).fetchall()
+        return [
+            (league_key, datetime.datetime.fromisoformat(scraped_at), json.loads(cells))
+            for league_key, scraped_at, cells in rows
+        ]
+
+    def score_matrices(self, match_key: str, page: str = 'normal') -> list:
+        # (computed_at, ht mean, vt mean, matrix, under) of one match, oldest first
+        with self.connection_lock:
+            rows = self.connection.execute(
+                'SELECT s.computed_at, s.ht_adj_mean_goals, s.vt_adj_mean_goals, s.max_goals, s.matrix, s.under '
+                'FROM score_matrices s JOIN matches m ON m.id = s.match_id '
+                'WHERE m.match_key = ? AND s.page = ? ORDER BY s.computed_at',
+                (match_key, page)).fetchall()
+        return [
+            (
+                datetime.datetime.fromisoformat(computed_at), ht_mean, vt_mean,
+                from_blob(matrix, (max_goals, max_goals)), from_blob(under)
+            )
+            for computed_at, ht_mean, vt_mean, max_goals, matrix, under in rows
+        ]
+
+    def close(self) -> None:
+        self.flush()
+        with self.connection_lock:
+            self.connection.close()
@@ -0,0 +1,106 @@
+from selenium import webdriver
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.webdriver.support import expected_conditions as EC
+from selenium.common.exceptions import TimeoutException
+
+import time
+import json
+
+from stage_metrics import percentile
+
+with open('_config.json', 'r') as f:
+    config = json.loads(f.read())
+
+    WAIT_TIMEOUT_SECONDS = config.get('pageWaitTimeoutSeconds', 10)
+    WAIT_POLL_SECONDS = config.get('pageWaitPollSeconds', 0.1)
+
+    del config
+
+# wait name -> list of (seconds waited, condition met)
+wait_times: dict = dict()
+
+
+def record_wait(name: str, seconds: float, met: bool) -> None:
+    wait_times.setdefault(name, list()).append((seconds, met))
+
+
+def wait_for(wd: webdriver.Firefox, condition, name: str, timeout: float = None) -> bool:
+    # wait until condition(wd) is truthy; on timeout just carry on like the old sleeps did
+    start = time.monotonic()
+    met = True
+    try:
+        WebDriverWait(
+            wd,
+            WAIT_TIMEOUT_SECONDS if timeout is None else timeout,
+            poll_frequency=WAIT_POLL_SECONDS
+        ).until(condition)
+    except TimeoutException:
+        met = False
+        print('wait timed out: {}'.format(name))
+    record_wait(name, time.monotonic() - start, met)
+    return met
+
+
+def listing_signature(wd: webdriver.Firefox) -> str:
+    return wd.execute_script(
+        "var e = document.getElementById('iddaa-tab-body2');"
+        "return e ? e.innerHTML.length + ':' + e.getElementsByTagName('tr').length : null;")
+
+
+def listing_changed(signature: str):
+    # the listing has been re-rendered since signature was taken
+    def condition(wd: webdriver.Firefox) -> bool:
+        current = listing_signature(wd)
+        return current is not None and current != signature
+    return condition
+
+
+def window_opened(window_count: int):
+    return EC.number_of_windows_to_be(window_count + 1)
+
+
+def league_page_loaded(wd: webdriver.Firefox) -> bool:
+    # either the standing table is there, or the page is done and has none;
+    # a new window is a complete about:blank before it navigates, which does not count
+    if len(wd.find_elements(By.ID, 'tblStanding')) > 0:
+        return True
+    if wd.current_url in ('', 'about:blank'):
+        return False
+    return wd.execute_script('return document.readyState;') == 'complete'
+
+
+def standing_table_replaced(old_table):
+    def condition(wd: webdriver.Firefox) -> bool:
+        return EC.staleness_of(old_table)(wd) and len(wd.find_elements(By.ID, 'tblStanding')) > 0
+    return condition
+
+
+def match_page_loaded(wd: webdriver.Firefox) -> bool:
+    return len(wd.find_elements(By.XPATH, '//a[@class="r-left-block-team-name"]')) > 0
+
+
+def wait_summary() -> dict:
+    summary = dict()
+    for name, waits in wait_times.items():
+        seconds = [s for s, _ in waits]
+        summary[name] = {
+            'count': len(waits),
+            'timeouts': sum(1 for _, met in waits if not met),
+            'min': min(seconds),
+            'p50': percentile(seconds, 0.5),
+            'p90': percentile(seconds, 0.9),
+            'max': max(seconds),
+            'total': sum(seconds)
+        }
+    return summary
+
+
+def print_wait_summary() -> None:
+    for name, s in wait_summary().items():
+        print('wait {}: n={} timeouts={} min={:.2f}s p50={:.2f}s p90={:.2f}s max={:.2f}s'.format(
+            name, s['count'], s['timeouts'], s['min'], s['p50'], s['p90'], s['max']))
+
+
+def reset_waits() -> None:
+    wait_times.clear()
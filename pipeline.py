@@ -0,0 +1,273 @@
+import queue
+import threading
+import collections
+from typing import NamedTuple
+
+from probability_engine import compute_workbooks, page_slice
+from league_table import match_inputs
+from render_pool import RenderExecutor, PageRecord
+from match_store import MatchStore
+from fixture_tensor import FixtureTensorCache
+from strength_model import StrengthCache, compute_fitted_page
+from stage_metrics import stage, record_stage
+
+# scrape -> compute -> render -> deliver, each stage in its own thread with a
+# bounded queue in between, so early matches are delivered while later ones are scraped
+
+# put on a queue after the last item
+STOP = object()
+
+
+class PipelineResult(NamedTuple):
+    # scraper.MatchJobs whose workbooks were sent
+    delivered: list
+    # scraper.MatchJobs that were scraped but cannot be priced, e.g. no standing table
+    skipped: list
+
+
+def drain(in_queue: queue.Queue, first_item, limit: int) -> tuple:
+    # first_item plus whatever else is already waiting, up to limit items
+    items = [first_item]
+    stopped = False
+    while len(items) < limit:
+        try:
+            item = in_queue.get_nowait()
+        except queue.Empty:
+            break
+        if item is STOP:
+            stopped = True
+            break
+        items.append(item)
+    return items, stopped
+
+
+def scrape_stage(scrape_results, out_queue: queue.Queue, skipped: list, store: MatchStore = None) -> None:
+    # scrape_results is an iterator of scraper.ScrapeResult in kickoff order
+    try:
+        for result in scrape_results:
+            job, team_names, standings, error = result
+            if error is not None:
+                print('Error scraping match {}: {}'.format(job.match_id, error))
+                continue
+            match_name = '{} {} - {}'.format(
+                job.kickoff.strftime('%Y.%m.%d %H.%M'), team_names[0], team_names[1])
+            print('match {}'.format(match_name))
+            if store is not None and len(standings.rows) > 0:
+                store.record_standings(job.league_key or '', job.league_url, standings)
+            if len(standings.rows) == 0:
+                # some leagues(?) such as ROK GKOK do not have standing tables
+                # just skip those I guess
+                print('no standing table for {} - {}'.format(team_names[0], team_names[1]))
+                skipped.append(job)
+                continue
+            try:
+                inputs = match_inputs(standings, team_names[0], team_names[1])
+            except KeyError as e:
+                print('team {} not in standing table'.format(e))
+                skipped.append(job)
+                continue
+            if store is not None:
+                store.record_match(job, team_names, standings)
+            out_queue.put((job, match_name, inputs, standings, team_names))
+    except Exception as e:
+        print('Error in scrape stage: {}'.format(e))
+    finally:
+        out_queue.put(STOP)
+
+
+def fitted_pages(items: list, strengths: StrengthCache) -> list:
+    # the normal page from the strengths of each league, fitted once per standing table;
+    # the double page stays the one of compute_workbooks
+    inputs = {
+        key: [item[2][key] for item in items]
+        for key in items[0][2]
+    }
+    _, double_page = compute_workbooks(**inputs)
+    computed = list()
+    for index, (job, _, _, standings, team_names) in enumerate(items):
+        fitted = strengths.get_or_fit(job.league_key, standings)
+        normal_page = compute_fitted_page(fitted, [team_names[0]], [team_names[1]])
+        computed.append((normal_page, page_slice(double_page, index), 0))
+    return computed
+
+
+def compute_stage(
+    in_queue: queue.Queue,
+    out_queue: queue.Queue,
+    batch_size: int,
+    store: MatchStore = None,
+    tensors: FixtureTensorCache = None,
+    strengths: StrengthCache = None
+) -> None:
+    # whatever has queued up is computed in one vectorized call;
+    # with tensors every pairing of a league is computed once per standing table and looked up,
+    # with strengths the normal page comes from the fitted model, see strength_model.py
+    stopped = False
+    while not stopped:
+        item = in_queue.get()
+        if item is STOP:
+            break
+        items, stopped = drain(in_queue, item, batch_size)
+        try:
+            match_names = [item[1] for item in items]
+            if strengths is not None:
+                with stage('compute_workbooks'):
+                    computed = fitted_pages(items, strengths)
+            elif tensors is not None:
+                computed = list()
+                with stage('compute_workbooks'):
+                    for job, _, _, standings, team_names in items:
+                        computed.append(tensors.pages(
+                            job.league_key, standings, team_names[0], team_names[1]))
+            else:
+                inputs = {
+                    key: [item[2][key] for item in items]
+                    for key in items[0][2]
+                }
+                with stage('compute_workbooks'):
+                    normal_page, double_page = compute_workbooks(**inputs)
+                computed = [(normal_page, double_page, index) for index in range(len(items))]
+            for (job, match_name, item_inputs, _, _), (normal_page, double_page, index) in zip(items, computed):
+                if store is not None:
+                    store.record_pages(job, normal_page, double_page, index)
+                out_queue.put((job, match_name, item_inputs, normal_page, double_page, index))
+        except Exception as e:
+            print('Error computing {}: {}'.format(', '.join(match_names), e))
+    out_queue.put(STOP)
+
+
+def render_stage(in_queue: queue.Queue, out_queue: queue.Queue) -> None:
+    # openpyxl is only imported once something is rendered, for a faster start
+    import probability_machine
+    while True:
+        item = in_queue.get()
+        if item is STOP:
+            break
+        job, match_name, _, normal_page, double_page, index = item
+        filename = '{}.xlsx'.format(match_name)
+        try:
+            with stage('write_spreadsheet'):
+                file_data = probability_machine.save_workbook(None, normal_page, double_page, index)
+            print('OK wrote file `{}`'.format(filename))
+            out_queue.put((job, filename, file_data))
+        except Exception as e:
+            print('Error rendering `{}`: {}'.format(filename, e))
+    out_queue.put(STOP)
+
+
+def render_pool_stage(
+    in_queue: queue.Queue,
+    out_queue: queue.Queue,
+    render_executor: RenderExecutor
+) -> None:
+    # same as render_stage, with the workbooks rendered in worker processes;
+    # results are passed on in order, as soon as they and every earlier one are done
+    pending = collections.deque()
+
+    def pass_on(block: bool) -> None:
+        while len(pending) > 0 and (block or pending[0][2].done()):
+            job, match_name, future = pending.popleft()
+            try:
+                result = future.result()
+            except Exception as e:
+                # the worker process itself died
+                print('Error rendering `{}.xlsx`: {}'.format(match_name, e))
+                record_stage('write_spreadsheet', 0, True)
+                continue
+            # timed in the worker process
+            record_stage('write_spreadsheet', result.seconds, result.error is not None)
+            if result.error is not None:
+                print('Error rendering `{}`: {}'.format(result.filename, result.error))
+                continue
+            print('OK wrote file `{}`'.format(result.filename))
+            out_queue.put((job, result.filename, result.data))
+
+    while True:
+        try:
+            item = in_queue.get(timeout=0.1)
+        except queue.Empty:
+            pass_on(False)
+            continue
+        if item is STOP:
+            break
+        job, match_name, _, normal_page, double_page, index = item
+        # the pages of the compute stage, only this match's rows go to the worker
+        record = PageRecord(match_name, page_slice(normal_page, index), page_slice(double_page, index))
+        pending.append((job, match_name, render_executor.submit(record)))
+        if len(pending) >= 2 * render_executor.max_workers:
+            # back-pressure, wait for the oldest one
+            pending[0][2].exception()
+        pass_on(False)
+    pass_on(True)
+    out_queue.put(STOP)
+
+
+def deliver_stage(in_queue: queue.Queue, batch_size: int, delivered: list, send=None) -> None:
+    # batch_size 0 sends one update at the end, like before
+    if send is None:
+        # imported here, so render worker processes never set up the mail client
+        import email_machine
+        send = email_machine.send_update
+    batch = list()
+    while True:
+        item = in_queue.get()
+        if item is not STOP:
+            batch.append(item)
+        if len(batch) > 0 and (item is STOP or (batch_size > 0 and len(batch) >= batch_size)):
+            try:
+                # email_machine.SendOutcomes, one per message
+                with stage('send_update'):
+                    outcomes = send([(filename, file_data) for _, filename, file_data in batch]) or list()
+                failed = {
+                    filename for outcome in outcomes if outcome.error is not None
+                    for filename in outcome.filenames
+                }
+                sent = [job for job, filename, _ in batch if filename not in failed]
+                print('░▒▓ Update sent, {} matches'.format(len(sent)))
+                if len(failed) > 0:
+                    print('Error sending {} matches, they are tried again next time'.format(len(failed)))
+                delivered.extend(sent)
+            except Exception as e:
+                print('Error sending update: {}'.format(e))
+            batch = list()
+        if item is STOP:
+            break
+
+
+def run_pipeline(
+    scrape_results,
+    queue_size: int = 8,
+    compute_batch_size: int = 16,
+    delivery_batch_size: int = 0,
+    send=None,
+    render_executor: RenderExecutor = None,
+    store: MatchStore = None,
+    tensors: FixtureTensorCache = None,
+    strengths: StrengthCache = None
+) -> PipelineResult:
+    # scrape_results is consumed in the calling thread,
+    # since a webdriver belongs to the thread using it;
+    # with a store, what is scraped and computed is recorded for store.flush
+    scraped = queue.Queue(maxsize=queue_size)
+    computed = queue.Queue(maxsize=queue_size)
+    rendered = queue.Queue(maxsize=queue_size)
+    delivered = list()
+    skipped = list()
+
+    if render_executor is None:
+        render_thread = threading.Thread(target=render_stage, args=(computed, rendered))
+    else:
+        render_thread = threading.Thread(
+            target=render_pool_stage, args=(computed, rendered, render_executor))
+    threads = [
+        threading.Thread(
+            target=compute_stage, args=(scraped, computed, compute_batch_size, store, tensors, strengths)),
+        render_thread,
+        threading.Thread(target=deliver_stage, args=(rendered, delivery_batch_size, delivered, send))
+    ]
+    for thread in threads:
+        thread.start()
+    scrape_stage(scrape_results, scraped, skipped, store)
+    for thread in threads:
+        thread.join()
+    return PipelineResult(delivered, skipped)
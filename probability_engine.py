@@ -0,0 +1,390 @@
+import numpy as np
+from typing import NamedTuple
+
+# size of the goal grid shown on each page, and the smallest grid computed
+MAX_GOALS = 8
+# the grid grows until the goals outside it are less likely than this
+TAIL_EPSILON = 1e-6
+# however unlikely the rest, the grid stops here
+MAX_GRID_GOALS = 64
+# number of n,5 over/under columns shown on each page
+MAX_SCORE_SUM = 7
+# the columns of PageData.inputs
+PAGE_INPUT_NAMES = [
+    'ht_matches_played',
+    'ht_goals_scored',
+    'ht_goals_lost',
+    'vt_matches_played',
+    'vt_goals_scored',
+    'vt_goals_lost',
+    'league_matches_played',
+    'league_home_goals',
+    'league_visitor_goals'
+]
+
+
+class PageData(NamedTuple):
+    # input values as shown on the page, after fixing zero divisors, shape (N, 9)
+    inputs: np.ndarray
+    # expected goals for each team, shape (N,)
+    ht_adj_mean_goals: np.ndarray
+    vt_adj_mean_goals: np.ndarray
+    # goal probabilities for each team, shape (N, G)
+    ht_pmf: np.ndarray
+    vt_pmf: np.ndarray
+    # score_matrix[n, i, j] = P(home team scores i, visitor team scores j), shape (N, G, G);
+    # G is the largest grid of the slate, cells beyond a match's own grid are 0
+    score_matrix: np.ndarray
+    # P(<n,5), P(>n,5) and their reciprocals, shape (N, MAX_SCORE_SUM)
+    under: np.ndarray
+    under_reciprocal: np.ndarray
+    over: np.ndarray
+    over_reciprocal: np.ndarray
+    # grid size of each match, at least MAX_GOALS, see grid_sizes; shape (N,)
+    max_goals: np.ndarray
+
+
+def poisson_pmf(mu: np.ndarray, max_goals: int = MAX_GOALS) -> np.ndarray:
+    # pmf(k) = exp(-mu) * mu^k / k!, built up as a running product over k
+    mu = np.asarray(mu, dtype=np.float64)
+    terms = np.empty(mu.shape + (max_goals,), dtype=np.float64)
+    terms[..., 0] = 1.0
+    if max_goals > 1:
+        k = np.arange(1, max_goals, dtype=np.float64)
+        terms[..., 1:] = mu[..., None] / k
+    return np.exp(-mu)[..., None] * np.cumprod(terms, axis=-1)
+
+
+def fix_divisor(values: np.ndarray) -> np.ndarray:
+    # TODO: figure out what to do if divisors are 0
+    return np.where(values == 0, 1, values)
+
+
+class MeanGoals(NamedTuple):
+    # see PageData
+    inputs: np.ndarray
+    ht_adj_mean_goals: np.ndarray
+    vt_adj_mean_goals: np.ndarray
+    # the reciprocals of the double page are per home match played, shape (N, 1) or 1
+    reciprocal_scale: np.ndarray
+
+
+def compute_mean_goals(
+    ht_matches_played,
+    ht_goals_scored,
+    ht_goals_lost,
+    vt_matches_played,
+    vt_goals_scored,
+    vt_goals_lost,
+    league_matches_played,
+    league_home_goals,
+    league_visitor_goals,
+    divide_by_ht_matches_played: bool = False
+) -> MeanGoals:
+    # every argument is a scalar or an array with one value per match
+    ht_matches_played = fix_divisor(np.atleast_1d(np.asarray(ht_matches_played)))
+    ht_goals_scored = np.atleast_1d(np.asarray(ht_goals_scored))
+    ht_goals_lost = np.atleast_1d(np.asarray(ht_goals_lost))
+    vt_matches_played = fix_divisor(np.atleast_1d(np.asarray(vt_matches_played)))
+    vt_goals_scored = np.atleast_1d(np.asarray(vt_goals_scored))
+    vt_goals_lost = np.atleast_1d(np.asarray(vt_goals_lost))
+    league_matches_played = fix_divisor(np.atleast_1d(np.asarray(league_matches_played)))
+    league_home_goals = np.atleast_1d(np.asarray(league_home_goals))
+    league_visitor_goals = np.atleast_1d(np.asarray(league_visitor_goals))
+
+    inputs = np.stack(np.broadcast_arrays(
+        ht_matches_played,
+        ht_goals_scored,
+        ht_goals_lost,
+        vt_matches_played,
+        vt_goals_scored,
+        vt_goals_lost,
+        league_matches_played,
+        league_home_goals,
+        league_visitor_goals
+    ), axis=-1)
+
+    ht_mean_goals_scored = ht_goals_scored / ht_matches_played
+    ht_mean_goals_lost = ht_goals_lost / ht_matches_played
+    vt_mean_goals_scored = vt_goals_scored / vt_matches_played
+    vt_mean_goals_lost = vt_goals_lost / vt_matches_played
+    league_mean_home_goals = fix_divisor(league_home_goals / league_matches_played)
+    league_mean_visitor_goals = fix_divisor(league_visitor_goals / league_matches_played)
+
+    ht_power_offense = ht_mean_goals_scored / league_mean_home_goals
+    ht_power_defense = ht_mean_goals_lost / league_mean_visitor_goals
+    vt_power_offense = vt_mean_goals_scored / league_mean_visitor_goals
+    vt_power_defense = vt_mean_goals_lost / league_mean_home_goals
+
+    ht_adj_mean_goals = ht_power_offense * vt_power_defense * league_mean_home_goals
+    vt_adj_mean_goals = vt_power_offense * ht_power_defense * league_mean_visitor_goals
+    ht_adj_mean_goals, vt_adj_mean_goals = np.broadcast_arrays(
+        ht_adj_mean_goals, vt_adj_mean_goals)
+
+    reciprocal_scale = ht_matches_played[:, None] if divide_by_ht_matches_played else 1
+    return MeanGoals(inputs, ht_adj_mean_goals, vt_adj_mean_goals, reciprocal_scale)
+
+
+def grid_sizes(mean_goals, epsilon: float = TAIL_EPSILON, min_goals: int = MAX_GOALS) -> np.ndarray:
+    # for each mean the smallest grid, at least min_goals and at most MAX_GRID_GOALS,
+    # where P(goals outside the grid) < epsilon; shape of mean_goals
+    mean_goals = np.asarray(mean_goals, dtype=np.float64)
+    means = np.where(np.isfinite(mean_goals), np.clip(mean_goals, 0, MAX_GRID_GOALS), 0).ravel()
+    max_mean = float(means.max()) if means.size > 0 else 0
+    # far enough out that whatever lies beyond is below any sensible epsilon
+    bound = int(max_mean + 12 * np.sqrt(max_mean) + 32)
+    pmf = poisson_pmf(means, bound)
+    # tail[k] = P(goals >= k), summed from the far end to keep small tails exact
+    tail = np.cumsum(pmf[:, ::-1], axis=1)[:, ::-1]
+    inside = tail < epsilon
+    sizes = np.where(inside.any(axis=1), inside.argmax(axis=1), bound)
+    return np.clip(sizes, min_goals, MAX_GRID_GOALS).reshape(mean_goals.shape)
+
+
+def grid_size(mean_goals, epsilon: float = TAIL_EPSILON, min_goals: int = MAX_GOALS) -> int:
+    # one grid for every mean; the tail only grows with the mean, so the largest one decides
+    mean_goals = np.asarray(mean_goals, dtype=np.float64)
+    if mean_goals.size == 0:
+        return min_goals
+    return int(grid_sizes(mean_goals, epsilon, min_goals).max())
+
+
+def poisson_cdf(mu: np.ndarray, max_value: int) -> np.ndarray:
+    # P(X <= k) for k < max_value
+    return np.cumsum(poisson_pmf(mu, max_value), axis=-1)
+
+
+def grid_pmf(mu: np.ndarray, max_goals: np.ndarray) -> np.ndarray:
+    # poisson_pmf on the largest grid, 0 beyond the grid of each mean; a grid cut off at
+    # MAX_GRID_GOALS counts the rest of the tail as its last goal, so nothing is lost
+    pmf = poisson_pmf(mu, int(max_goals.max()))
+    goals = np.arange(pmf.shape[1])
+    pmf[goals[None, :] >= max_goals[:, None]] = 0
+    capped = max_goals >= MAX_GRID_GOALS
+    if capped.any():
+        rest = 1 - pmf[capped].sum(axis=1)
+        pmf[capped, MAX_GRID_GOALS - 1] += np.maximum(rest, 0)
+        if np.any(rest >= TAIL_EPSILON):
+            print('Warning: expected goals up to {:.1f} do not fit the {} goal grid, '
+                  'P({}+ goals) is in the last cell'.format(
+                      float(np.nanmax(mu[capped])), MAX_GRID_GOALS, MAX_GRID_GOALS - 1))
+    return pmf
+
+
+def build_page(mean_goals: MeanGoals, max_goals) -> PageData:
+    # max_goals is the grid of every match, or one grid size per match
+    ht_adj_mean_goals = mean_goals.ht_adj_mean_goals
+    vt_adj_mean_goals = mean_goals.vt_adj_mean_goals
+    max_goals = np.broadcast_to(np.asarray(max_goals, dtype=np.int64), ht_adj_mean_goals.shape)
+    ht_pmf = grid_pmf(ht_adj_mean_goals, max_goals)
+    vt_pmf = grid_pmf(vt_adj_mean_goals, max_goals)
+    score_matrix = ht_pmf[:, :, None] * vt_pmf[:, None, :]
+
+    # total goals of two independent poissons are poisson with the summed mean,
+    # so P(<n,5) is exact and needs nothing from the grid
+    under = poisson_cdf(ht_adj_mean_goals + vt_adj_mean_goals, MAX_SCORE_SUM)
+    over = 1 - under
+
+    with np.errstate(divide='ignore'):
+        under_reciprocal = np.reciprocal(under * mean_goals.reciprocal_scale)
+        over_reciprocal = np.reciprocal(over * mean_goals.reciprocal_scale)
+
+    return PageData(
+        inputs=mean_goals.inputs,
+        ht_adj_mean_goals=ht_adj_mean_goals,
+        vt_adj_mean_goals=vt_adj_mean_goals,
+        ht_pmf=ht_pmf,
+        vt_pmf=vt_pmf,
+        score_matrix=score_matrix,
+        under=under,
+        under_reciprocal=under_reciprocal,
+        over=over,
+        over_reciprocal=over_reciprocal,
+        max_goals=max_goals.copy()
+    )
+
+
+def compute_pages(
+    ht_matches_played,
+    ht_goals_scored,
+    ht_goals_lost,
+    vt_matches_played,
+    vt_goals_scored,
+    vt_goals_lost,
+    league_matches_played,
+    league_home_goals,
+    league_visitor_goals,
+    divide_by_ht_matches_played: bool = False,
+    epsilon: float = TAIL_EPSILON
+) -> PageData:
+    # every argument is a scalar or an array with one value per match
+    mean_goals = compute_mean_goals(
+        ht_matches_played,
+        ht_goals_scored,
+        ht_goals_lost,
+        vt_matches_played,
+        vt_goals_scored,
+        vt_goals_lost,
+        league_matches_played,
+        league_home_goals,
+        league_visitor_goals,
+        divide_by_ht_matches_played
+    )
+    max_goals = grid_sizes(
+        np.maximum(mean_goals.ht_adj_mean_goals, mean_goals.vt_adj_mean_goals), epsilon)
+    return build_page(mean_goals, max_goals)
+
+
+def workbook_mean_goals(
+    # inputs for normal page
+    ht_total_matches_played,
+    ht_total_goals_scored,
+    ht_total_goals_lost,
+    at_total_matches_played,
+    at_total_goals_scored,
+    at_total_goals_lost,
+    league_home_matches_played,
+    # inputs for double page
+    ht_home_matches_played,
+    ht_home_goals_scored,
+    ht_home_goals_lost,
+    at_away_matches_played,
+    at_away_goals_scored,
+    at_away_goals_lost,
+    league_total_matches_played,
+    # common inputs
+    league_home_goals,
+    league_away_goals
+) -> tuple:
+    # (normal page MeanGoals, double page MeanGoals), arguments as in compute_workbooks
+    normal_means = compute_mean_goals(
+        ht_total_matches_played,
+        ht_total_goals_scored,
+        ht_total_goals_lost,
+        at_total_matches_played,
+        at_total_goals_scored,
+        at_total_goals_lost,
+        league_home_matches_played,
+        league_home_goals,
+        league_away_goals
+    )
+    double_means = compute_mean_goals(
+        ht_home_matches_played,
+        ht_home_goals_scored,
+        ht_home_goals_lost,
+        at_away_matches_played,
+        at_away_goals_scored,
+        at_away_goals_lost,
+        league_total_matches_played,
+        league_home_goals,
+        league_away_goals,
+        True
+    )
+    return normal_means, double_means
+
+
+def workbook_grid_sizes(normal_means: MeanGoals, double_means: MeanGoals, epsilon: float = TAIL_EPSILON) -> np.ndarray:
+    # one grid size per match, shared by both of its pages, shape (N,)
+    return grid_sizes(np.max(np.stack([
+        normal_means.ht_adj_mean_goals, normal_means.vt_adj_mean_goals,
+        double_means.ht_adj_mean_goals, double_means.vt_adj_mean_goals
+    ]), axis=0), epsilon)
+
+
+def compute_workbooks(
+    # inputs for normal page
+    ht_total_matches_played,
+    ht_total_goals_scored,
+    ht_total_goals_lost,
+    at_total_matches_played,
+    at_total_goals_scored,
+    at_total_goals_lost,
+    league_home_matches_played,
+    # inputs for double page
+    ht_home_matches_played,
+    ht_home_goals_scored,
+    ht_home_goals_lost,
+    at_away_matches_played,
+    at_away_goals_scored,
+    at_away_goals_lost,
+    league_total_matches_played,
+    # common inputs
+    league_home_goals,
+    league_away_goals,
+    epsilon: float = TAIL_EPSILON
+) -> tuple:
+    # same arguments as probability_machine.write_spreadsheet, one value per match;
+    # every match gets the grid it would get alone, see page_slice
+    normal_means, double_means = workbook_mean_goals(
+        ht_total_matches_played,
+        ht_total_goals_scored,
+        ht_total_goals_lost,
+        at_total_matches_played,
+        at_total_goals_scored,
+        at_total_goals_lost,
+        league_home_matches_played,
+        ht_home_matches_played,
+        ht_home_goals_scored,
+        ht_home_goals_lost,
+        at_away_matches_played,
+        at_away_goals_scored,
+        at_away_goals_lost,
+        league_total_matches_played,
+        league_home_goals,
+        league_away_goals
+    )
+    max_goals = workbook_grid_sizes(normal_means, double_means, epsilon)
+    return build_page(normal_means, max_goals), build_page(double_means, max_goals)
+
+
+def mean_goals_slice(mean_goals: MeanGoals, index: int) -> MeanGoals:
+    # the means of a single match, keeping the leading axis
+    reciprocal_scale = mean_goals.reciprocal_scale
+    if isinstance(reciprocal_scale, np.ndarray):
+        reciprocal_scale = reciprocal_scale[index:index+1]
+    return MeanGoals(
+        mean_goals.inputs[index:index+1],
+        mean_goals.ht_adj_mean_goals[index:index+1],
+        mean_goals.vt_adj_mean_goals[index:index+1],
+        reciprocal_scale
+    )
+
+
+def crop_page(page: PageData, max_goals: int) -> PageData:
+    # the page on a smaller grid, at least as large as that of every match in it
+    return page._replace(
+        ht_pmf=page.ht_pmf[:, :max_goals],
+        vt_pmf=page.vt_pmf[:, :max_goals],
+        score_matrix=page.score_matrix[:, :max_goals, :max_goals]
+    )
+
+
+def page_slice(page: PageData, index: int) -> PageData:
+    # the data of a single match on its own grid, keeping the leading axis;
+    # the same page as computing the match alone
+    match_page = PageData(*(field[index:index+1] for field in page))
+    return crop_page(match_page, int(match_page.max_goals[0]))
+
+
+def pad_goals(values: np.ndarray, max_goals: int, axes: int) -> np.ndarray:
+    # zeros for the goals beyond the grid of values, on its last axes
+    width = [(0, 0)] * (values.ndim - axes) + [(0, max_goals - values.shape[-1])] * axes
+    return np.pad(values, width)
+
+
+def concatenate_pages(pages: list) -> PageData:
+    # separately computed slates as one, the smaller grids padded to the largest
+    max_goals = max(page.score_matrix.shape[1] for page in pages)
+    return PageData(
+        inputs=np.concatenate([page.inputs for page in pages]),
+        ht_adj_mean_goals=np.concatenate([page.ht_adj_mean_goals for page in pages]),
+        vt_adj_mean_goals=np.concatenate([page.vt_adj_mean_goals for page in pages]),
+        ht_pmf=np.concatenate([pad_goals(page.ht_pmf, max_goals, 1) for page in pages]),
+        vt_pmf=np.concatenate([pad_goals(page.vt_pmf, max_goals, 1) for page in pages]),
+        score_matrix=np.concatenate([pad_goals(page.score_matrix, max_goals, 2) for page in pages]),
+        under=np.concatenate([page.under for page in pages]),
+        under_reciprocal=np.concatenate([page.under_reciprocal for page in pages]),
+        over=np.concatenate([page.over for page in pages]),
+        over_reciprocal=np.concatenate([page.over_reciprocal for page in pages]),
+        max_goals=np.concatenate([page.max_goals for page in pages])
+    )
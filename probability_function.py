@@ -1,36 +1,263 @@
-import probability_machine
 import os
+import sys
+import csv
+import json
 import time
+import argparse
+import threading
+import importlib
+import importlib.util
 
-while True:
-    print('░▒▓ Ev Sahibi Takım')
-    ht_matches_played = int(input('Oynadığı maç sayısı: '))
-    ht_goals_scored = int(input('Attığı gol: '))
-    ht_goals_lost = int(input('Yediği gol: '))
-    print('░▒▓ Konuk Takım')
-    at_matches_played = int(input('Oynadığı maç sayısı: '))
-    at_goals_scored = int(input('Attığı gol: '))
-    at_goals_lost = int(input('Yediği gol: '))
-    print('░▒▓ Lig Ortalaması')
-    league_matches_played = int(input('Oynanan maç sayısı: '))
-    league_home_goals = int(input('Ev sahibi gol: '))
-    league_away_goals = int(input('Misafir gol: '))
-
-    print('\n░▒▓ Olasılıklar:')
-
-    cprob = probability_machine.write_spreadsheet(
-        'probabilities.xlsx',
-        ht_matches_played,
-        ht_goals_scored,
-        ht_goals_lost,
-        at_matches_played,
-        at_goals_scored,
-        at_goals_lost,
-        league_matches_played * 2,
-        league_matches_played,
-        league_home_goals,
-        league_away_goals
+# interactive by default; with --input, prices a file of matches in one go:
+# python probability_function.py --input matches.csv --format json --output-dir out
+# python probability_function.py --input - --input-format jsonl --format csv --output all.csv
+
+# keyword arguments of probability_machine.write_spreadsheet, the columns of a batch input
+WORKBOOK_INPUT_NAMES = [
+    'ht_total_matches_played', 'ht_total_goals_scored', 'ht_total_goals_lost',
+    'at_total_matches_played', 'at_total_goals_scored', 'at_total_goals_lost',
+    'league_home_matches_played',
+    'ht_home_matches_played', 'ht_home_goals_scored', 'ht_home_goals_lost',
+    'at_away_matches_played', 'at_away_goals_scored', 'at_away_goals_lost',
+    'league_total_matches_played',
+    'league_home_goals', 'league_away_goals'
+]
+# the values asked for in the interactive mode, also accepted as batch input columns
+INTERACTIVE_INPUT_NAMES = [
+    'ht_matches_played', 'ht_goals_scored', 'ht_goals_lost',
+    'at_matches_played', 'at_goals_scored', 'at_goals_lost',
+    'league_matches_played', 'league_home_goals', 'league_away_goals'
+]
+# optional column with the match name, used for file names
+NAME_COLUMN = 'name'
+
+
+def interactive_inputs(
+    ht_matches_played: int,
+    ht_goals_scored: int,
+    ht_goals_lost: int,
+    at_matches_played: int,
+    at_goals_scored: int,
+    at_goals_lost: int,
+    league_matches_played: int,
+    league_home_goals: int,
+    league_away_goals: int
+) -> dict:
+    # keyword arguments of write_spreadsheet; there is one set of team numbers,
+    # so both pages get the same ones, and every league match has a home team
+    return dict(
+        ht_total_matches_played=ht_matches_played,
+        ht_total_goals_scored=ht_goals_scored,
+        ht_total_goals_lost=ht_goals_lost,
+        at_total_matches_played=at_matches_played,
+        at_total_goals_scored=at_goals_scored,
+        at_total_goals_lost=at_goals_lost,
+        league_home_matches_played=league_matches_played,
+        ht_home_matches_played=ht_matches_played,
+        ht_home_goals_scored=ht_goals_scored,
+        ht_home_goals_lost=ht_goals_lost,
+        at_away_matches_played=at_matches_played,
+        at_away_goals_scored=at_goals_scored,
+        at_away_goals_lost=at_goals_lost,
+        league_total_matches_played=league_matches_played * 2,
+        league_home_goals=league_home_goals,
+        league_away_goals=league_away_goals
     )
-    print('OK, ./probabilities.xlsx\n')
-    time.sleep(1)
-    os.startfile('probabilities.xlsx')
+
+
+def interactive() -> None:
+    # probability_machine pulls in numpy and openpyxl, which takes a while;
+    # import it in the background while the first inputs are typed
+    threading.Thread(
+        target=importlib.import_module, args=('probability_machine',), daemon=True).start()
+
+    while True:
+        print('░▒▓ Ev Sahibi Takım')
+        ht_matches_played = int(input('Oynadığı maç sayısı: '))
+        ht_goals_scored = int(input('Attığı gol: '))
+        ht_goals_lost = int(input('Yediği gol: '))
+        print('░▒▓ Konuk Takım')
+        at_matches_played = int(input('Oynadığı maç sayısı: '))
+        at_goals_scored = int(input('Attığı gol: '))
+        at_goals_lost = int(input('Yediği gol: '))
+        print('░▒▓ Lig Ortalaması')
+        league_matches_played = int(input('Oynanan maç sayısı: '))
+        league_home_goals = int(input('Ev sahibi gol: '))
+        league_away_goals = int(input('Misafir gol: '))
+
+        print('\n░▒▓ Olasılıklar:')
+
+        # waits for the background import if it is not done yet
+        import probability_machine
+
+        probability_machine.write_spreadsheet('probabilities.xlsx', **interactive_inputs(
+            ht_matches_played,
+            ht_goals_scored,
+            ht_goals_lost,
+            at_matches_played,
+            at_goals_scored,
+            at_goals_lost,
+            league_matches_played,
+            league_home_goals,
+            league_away_goals
+        ))
+        print('OK, ./probabilities.xlsx\n')
+        time.sleep(1)
+        # only windows has startfile
+        if hasattr(os, 'startfile'):
+            os.startfile('probabilities.xlsx')
+
+
+def read_records(path: str, input_format: str):
+    # dicts of column -> value, one per match, read as they are needed; - is stdin
+    if input_format is None:
+        input_format = 'jsonl' if path.endswith(('.jsonl', '.ndjson')) else 'csv'
+    f = sys.stdin if path == '-' else open(path, 'r', encoding='utf-8', newline='')
+    try:
+        if input_format == 'csv':
+            yield from csv.DictReader(f)
+        else:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+    finally:
+        if f is not sys.stdin:
+            f.close()
+
+
+def record_inputs(record: dict) -> dict:
+    # keyword arguments of write_spreadsheet, from either set of columns
+    if all(name in record for name in WORKBOOK_INPUT_NAMES):
+        return {name: int(record[name]) for name in WORKBOOK_INPUT_NAMES}
+    return interactive_inputs(*(int(record[name]) for name in INTERACTIVE_INPUT_NAMES))
+
+
+def match_name(record: dict, number: int) -> str:
+    name = str(record.get(NAME_COLUMN) or 'match {:06d}'.format(number))
+    # the name becomes a file name
+    return name.replace('/', '_').replace('\\', '_')
+
+
+def read_chunks(records, chunk_size: int, rejected: list):
+    # (match names, inputs with one list per argument), chunk_size matches at a time;
+    # the numbers of records that cannot be read go in rejected
+    names = list()
+    inputs = {name: list() for name in WORKBOOK_INPUT_NAMES}
+    for number, record in enumerate(records, 1):
+        try:
+            record_values = record_inputs(record)
+        except (KeyError, TypeError, ValueError) as e:
+            print('Error reading match {}: {}'.format(number, repr(e)))
+            rejected.append(number)
+            continue
+        names.append(match_name(record, number))
+        for name, value in record_values.items():
+            inputs[name].append(value)
+        if len(names) >= chunk_size:
+            yield names, inputs
+            names = list()
+            inputs = {name: list() for name in WORKBOOK_INPUT_NAMES}
+    if len(names) > 0:
+        yield names, inputs
+
+
+def batch(args: argparse.Namespace) -> None:
+    # imported here, so the interactive mode prompts sooner
+    from concurrent.futures import ThreadPoolExecutor
+    import probability_machine
+    from probability_engine import compute_workbooks, page_slice
+
+    output = probability_machine.OUTPUT_FORMATS[args.format]
+    if args.output_dir is not None:
+        os.makedirs(args.output_dir, exist_ok=True)
+    start = time.perf_counter()
+    compute_seconds = 0
+    matches = 0
+    # every chunk is computed in one call; per match formats are then rendered in
+    # worker processes, the rest written by threads while the next chunk is read and computed
+    render_executor = None
+    if output.per_match:
+        from render_pool import RenderExecutor, PageRecord
+        render_executor = RenderExecutor(args.workers, args.output_dir)
+    writer = ThreadPoolExecutor(max_workers=args.workers or os.cpu_count() or 1)
+    pending = list()
+    rejected = list()
+    chunks = read_chunks(read_records(args.input, args.input_format), args.chunk_size, rejected)
+
+    def computed():
+        nonlocal matches, compute_seconds
+        for names, inputs in chunks:
+            matches += len(names)
+            compute_start = time.perf_counter()
+            normal_page, double_page = compute_workbooks(**inputs)
+            compute_seconds += time.perf_counter() - compute_start
+            yield names, normal_page, double_page
+
+    errors = 0
+    try:
+        if args.output is not None:
+            # each chunk is appended to the file as it comes, see probability_machine.write_stream
+            try:
+                probability_machine.write_stream(args.format, args.output, computed())
+            except Exception as e:
+                print('Error writing output: {}'.format(repr(e)))
+                errors += 1
+        else:
+            for chunk, (names, normal_page, double_page) in enumerate(computed()):
+                if render_executor is not None:
+                    for i, name in enumerate(names):
+                        # on the grid of the match alone, so the workbook is the one write_spreadsheet makes
+                        pending.append(render_executor.submit(PageRecord(
+                            name, page_slice(normal_page, i), page_slice(double_page, i))))
+                    continue
+                pending.append(writer.submit(
+                    probability_machine.write_outputs, args.format, args.output_dir,
+                    names, normal_page, double_page, 'slate_{:05d}'.format(chunk)))
+
+        errors += len(rejected)
+        for future in pending:
+            try:
+                result = future.result()
+                # render_pool.RenderResult, or the paths written
+                if render_executor is not None and result.error is not None:
+                    print('Error rendering `{}`: {}'.format(result.filename, result.error))
+                    errors += 1
+            except Exception as e:
+                print('Error writing output: {}'.format(repr(e)))
+                errors += 1
+    finally:
+        writer.shutdown()
+        if render_executor is not None:
+            render_executor.shutdown()
+
+    seconds = time.perf_counter() - start
+    print('OK, {} matches in {:.2f}s, {:.1f} matches/s (compute {:.3f}s), {} errors, {}'.format(
+        matches, seconds, matches / seconds if seconds > 0 else 0, compute_seconds, errors,
+        args.output or args.output_dir))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Goal probabilities, interactive unless --input is given')
+    parser.add_argument('--input', help='csv or jsonl file of matches, - for stdin')
+    parser.add_argument('--input-format', choices=['csv', 'jsonl'], help='by default from the file extension')
+    # the keys of probability_machine.OUTPUT_FORMATS, which is only imported once it is needed
+    parser.add_argument('--format', default='xlsx', choices=['xlsx', 'json', 'csv', 'npz', 'parquet'])
+    parser.add_argument('--output-dir', help='directory for one file per chunk, or per match for xlsx')
+    parser.add_argument(
+        '--output',
+        help='a single file for every match, written chunk by chunk; npz keeps every chunk in memory')
+    parser.add_argument('--chunk-size', type=int, default=1024, help='matches computed in one vectorized call')
+    parser.add_argument('--workers', type=int, default=None, help='parallel writers, the cpu count by default')
+    args = parser.parse_args()
+
+    if args.input is None:
+        interactive()
+    else:
+        if (args.output is None) == (args.output_dir is None):
+            parser.error('batch mode needs exactly one of --output-dir and --output')
+        if args.format == 'xlsx' and args.output is not None:
+            parser.error('xlsx is one workbook per match, use --output-dir')
+        # checked here, not once the first chunk is written
+        if args.format == 'parquet' and importlib.util.find_spec('pyarrow') is None:
+            parser.error('parquet output needs pyarrow')
+        batch(args)
@@ -1,20 +1,52 @@
+import io
+import os
+import csv
+import json
+import threading
 import numpy as np
+from typing import NamedTuple, Callable
+from functools import lru_cache
 from openpyxl.cell.cell import Cell
 from openpyxl.workbook.workbook import Workbook
 from openpyxl.worksheet.worksheet import Worksheet
-from scipy.stats import poisson
-from scipy.interpolate import interp1d
 from openpyxl.styles import PatternFill, Font, Alignment
 from openpyxl.styles.borders import Border, Side
 from openpyxl.utils import get_column_letter
-from copy import copy
+from openpyxl.utils.indexed_list import IndexedList
+
+from probability_engine import (
+    PageData, MAX_GOALS, MAX_SCORE_SUM, PAGE_INPUT_NAMES, compute_pages, compute_workbooks, concatenate_pages, page_slice)
+from markets import (
+    Markets, ASIAN_HANDICAP_LINES, TEAM_TOTAL_LINES, TOP_SCORES,
+    compute_markets, markets_slice, fair_odds, asian_handicap_odds, line_label, market_columns)
+
+# shared style objects, reused by every cell instead of allocating new ones
+DEFAULT_FONT = Font(name='Consolas', color='FFFFFFFF')
+DEFAULT_ALIGNMENT = Alignment(vertical='center')
+DEFAULT_FILL = PatternFill(start_color='FF000000', end_color='FF000000', fill_type='solid')
+CENTER_ALIGNMENT = Alignment('center', 'center')
+HIGHLIGHT_FONT = Font(name='Consolas', color='FFFF0000', bold=True)
+HIGHLIGHT_FILL = PatternFill(start_color='FF7fBF7F', end_color='FF7fBF7F', fill_type='solid')
+
+THICK_SIDE = Side(style='thick', color='FFFFFFFF')
+DOUBLE_SIDE = Side(style='double', color='FFFFFFFF')
+BORDER_SIDES = {'thick': THICK_SIDE, 'double': DOUBLE_SIDE}
+
+
+@lru_cache(maxsize=None)
+def get_border(left: str = None, right: str = None, bottom: str = None) -> Border:
+    # borders are named by side style, e.g. get_border(right='thick', bottom='double')
+    return Border(
+        left=BORDER_SIDES.get(left),
+        right=BORDER_SIDES.get(right),
+        bottom=BORDER_SIDES.get(bottom)
+    )
 
 
 def init_cell_style(cell: Cell) -> None:
-    cell.font = Font(name='Consolas', color='FFFFFFFF')
-    cell.alignment = Alignment(vertical='center')
-    cell.fill = PatternFill(
-        start_color='FF000000', end_color='FF000000', fill_type='solid')
+    cell.font = DEFAULT_FONT
+    cell.alignment = DEFAULT_ALIGNMENT
+    cell.fill = DEFAULT_FILL
 
 
 def init_cross_dim(ws: Worksheet, index: int) -> None:
@@ -26,29 +58,36 @@ def clamp01(n: float) -> float:
     return 0.0 if n < 0 else 1.0 if n > 1 else n
 
 
-def color_probability(p: float) -> PatternFill:
+def build_color_lut(size: int) -> list:
     COLOR_GRADIENT_INDICES = [0, 0.125, 0.25, 0.5, 1]
     COLOR_GRADIENT_STOPS_R = [0, 255, 0, 0, 0]
     COLOR_GRADIENT_STOPS_G = [0, 0, 0, 127, 127]
     COLOR_GRADIENT_STOPS_B = [0, 0, 255, 255, 0]
-    COLOR_GRADIENT_R = interp1d(COLOR_GRADIENT_INDICES, COLOR_GRADIENT_STOPS_R)
-    COLOR_GRADIENT_G = interp1d(COLOR_GRADIENT_INDICES, COLOR_GRADIENT_STOPS_G)
-    COLOR_GRADIENT_B = interp1d(COLOR_GRADIENT_INDICES, COLOR_GRADIENT_STOPS_B)
-
-    p = clamp01(p)
-    r_hex = hex(round(float(COLOR_GRADIENT_R(p))))[2:].zfill(2)[0:2]
-    g_hex = hex(round(float(COLOR_GRADIENT_G(p))))[2:].zfill(2)[0:2]
-    b_hex = hex(round(float(COLOR_GRADIENT_B(p))))[2:].zfill(2)[0:2]
-    
-    color = 'FF{}{}{}'.format(r_hex, g_hex, b_hex)
-    return PatternFill(start_color=color, end_color=color, fill_type='solid')
 
-def highlight_result(cell: Cell) -> None:
-    FILL_COLOR = 'FF7fBF7F'
-    FONT_COLOR = 'FFFF0000'
+    p = np.linspace(0, 1, size)
+    r = np.rint(np.interp(p, COLOR_GRADIENT_INDICES, COLOR_GRADIENT_STOPS_R)).astype(int)
+    g = np.rint(np.interp(p, COLOR_GRADIENT_INDICES, COLOR_GRADIENT_STOPS_G)).astype(int)
+    b = np.rint(np.interp(p, COLOR_GRADIENT_INDICES, COLOR_GRADIENT_STOPS_B)).astype(int)
+
+    lut = list()
+    for i in range(size):
+        color = 'FF{:02x}{:02x}{:02x}'.format(r[i], g[i], b[i])
+        lut.append(PatternFill(start_color=color, end_color=color, fill_type='solid'))
+    return lut
+
+
+# probabilities are quantized to one of these precomputed fills
+COLOR_LUT_SIZE = 1024
+COLOR_LUT = build_color_lut(COLOR_LUT_SIZE)
+
+
+def color_probability(p: float) -> PatternFill:
+    return COLOR_LUT[round(clamp01(p) * (COLOR_LUT_SIZE - 1))]
 
-    cell.fill = PatternFill(start_color=FILL_COLOR, end_color=FILL_COLOR, fill_type='solid')
-    cell.font = Font(name='Consolas', color=FONT_COLOR, bold=True)
+
+def highlight_result(cell: Cell) -> None:
+    cell.fill = HIGHLIGHT_FILL
+    cell.font = HIGHLIGHT_FONT
 
 
 def select_cell(ws: Worksheet, row: int, column: int) -> Cell:
@@ -57,107 +96,49 @@ def select_cell(ws: Worksheet, row: int, column: int) -> Cell:
     return target_cell
 
 
-def generate_page(
-    ws: Worksheet,
-    ht_matches_played: int,
-    ht_goals_scored: int,
-    ht_goals_lost: int,
-    vt_matches_played: int,
-    vt_goals_scored: int,
-    vt_goals_lost: int,
-    league_matches_played: int,
-    league_home_goals: int,
-    league_visitor_goals: int,
-    divide_by_ht_matches_played: bool = False
-) -> None:
-
-    THICK_SIDE = Side(style='thick', color='FFFFFFFF')
-    DOUBLE_SIDE = Side(style='double', color='FFFFFFFF')
-
-    # TODO: figure out what to do if divisors are 0
-    if ht_matches_played == 0:
-        ht_matches_played = 1
-    if vt_matches_played == 0:
-        vt_matches_played = 1
-    if league_matches_played == 0:
-        league_matches_played = 1
-
-    ht_mean_goals_scored = ht_goals_scored / ht_matches_played
-    ht_mean_goals_lost = ht_goals_lost / ht_matches_played
-    vt_mean_goals_scored = vt_goals_scored / vt_matches_played
-    vt_mean_goals_lost = vt_goals_lost / vt_matches_played
-    league_mean_home_goals = league_home_goals / league_matches_played
-    league_mean_visitor_goals = league_visitor_goals / league_matches_played
-
-    # TODO: figure out what to do if divisors are 0
-    if league_mean_home_goals == 0:
-        league_mean_home_goals = 1
-    if league_mean_visitor_goals == 0:
-        league_mean_visitor_goals = 1
-
-    ht_power_offense = ht_mean_goals_scored / league_mean_home_goals
-    ht_power_defense = ht_mean_goals_lost / league_mean_visitor_goals
-    vt_power_offense = vt_mean_goals_scored / league_mean_visitor_goals
-    vt_power_defense = vt_mean_goals_lost / league_mean_home_goals
-
-    ht_adj_mean_goals = ht_power_offense * vt_power_defense * league_mean_home_goals
-    vt_adj_mean_goals = vt_power_offense * ht_power_defense * league_mean_visitor_goals
+def init_page_layout(ws: Worksheet) -> None:
+    # everything on the page that does not depend on the match
 
     working_cell = select_cell(ws, 1, 1)
     working_cell.value = 'Gol sayısı'
-    working_cell.border = Border(right=THICK_SIDE, bottom=THICK_SIDE)
+    working_cell.border = get_border(right='thick', bottom='thick')
 
     working_cell = select_cell(ws, 2, 2)
     working_cell.value = 'Olasılık'
-    working_cell.border = Border(right=DOUBLE_SIDE, bottom=DOUBLE_SIDE)
+    working_cell.border = get_border(right='double', bottom='double')
 
     working_cell = select_cell(ws, 1, 2)
     working_cell.value = 'Ev Sahibi Takım'
-    working_cell.border = Border(right=DOUBLE_SIDE, bottom=THICK_SIDE)
+    working_cell.border = get_border(right='double', bottom='thick')
 
     working_cell = select_cell(ws, 2, 1)
     working_cell.value = 'Konuk Takım'
-    working_cell.border = Border(right=THICK_SIDE, bottom=DOUBLE_SIDE)
+    working_cell.border = get_border(right='thick', bottom='double')
     
     init_cross_dim(ws, 1)
     init_cross_dim(ws, 2)
 
-    # calculate probabilities for each team to score a given number of goals
-    for i in range(8):
+    for i in range(MAX_GOALS):
         # axis along top
         working_cell = select_cell(ws, 1, 3+i)
         working_cell.value = str(i)
-        working_cell.border = Border(bottom=THICK_SIDE)
+        working_cell.border = get_border(bottom='thick')
         # axis along left
         working_cell = select_cell(ws, 3+i, 1)
         working_cell.value = str(i)
-        working_cell.border = Border(right=THICK_SIDE)
+        working_cell.border = get_border(right='thick')
 
         # home team goal probabilities
-        ht_cell = select_cell(ws, 2, 3+i)
-        ht_value = poisson.pmf(k=i, mu=ht_adj_mean_goals)
-        ht_cell.value = '{:.9f}'.format(ht_value)
-        ht_cell.fill = color_probability(ht_value)
-        ht_cell.border = Border(bottom=DOUBLE_SIDE)
+        select_cell(ws, 2, 3+i).border = get_border(bottom='double')
         # visitor team goal probabilities
-        vt_cell = select_cell(ws, 3+i, 2)
-        vt_value = poisson.pmf(k=i, mu=vt_adj_mean_goals)
-        vt_cell.value = '{:.9f}'.format(vt_value)
-        vt_cell.fill = color_probability(vt_value)
-        vt_cell.border = Border(right=DOUBLE_SIDE)
+        select_cell(ws, 3+i, 2).border = get_border(right='double')
 
         init_cross_dim(ws, 3+i)
 
-    # calculate probabilities for all combinations of goals
-    for i in range(8):
-        ht_cell = ws.cell(2, 3+i)
-        for j in range(8):
-            vt_cell = ws.cell(3+j, 2)
-        
-            working_cell = select_cell(ws, 3+j, 3+i)
-            working_value = float(ht_cell.value) * float(vt_cell.value)
-            working_cell.value = '{:.9f}'.format(working_value)
-            working_cell.fill = color_probability(working_value)
+    # probabilities for all combinations of goals
+    for i in range(MAX_GOALS):
+        for j in range(MAX_GOALS):
+            select_cell(ws, 3+j, 3+i)
 
     # set up table for summed match score probabilities
     for r in range(11, 17):
@@ -165,63 +146,31 @@ def generate_page(
 
     working_cell = select_cell(ws, 12, 1)
     working_cell.value = 'n'
-    working_cell.border = Border(right=THICK_SIDE)
+    working_cell.border = get_border(right='thick')
     working_cell = select_cell(ws, 13, 1)
     working_cell.value = 'n alt bitme'
-    working_cell.border = Border(right=THICK_SIDE)
+    working_cell.border = get_border(right='thick')
     working_cell = select_cell(ws, 14, 1)
     working_cell.value = '1/alt/ev oyna'
-    working_cell.border = Border(right=THICK_SIDE)
+    working_cell.border = get_border(right='thick')
     working_cell = select_cell(ws, 15, 1)
     working_cell.value = 'n üst bitme'
-    working_cell.border = Border(right=THICK_SIDE)
+    working_cell.border = get_border(right='thick')
     working_cell = select_cell(ws, 16, 1)
     working_cell.value = '1/üst/ev oyna'
-    working_cell.border = Border(right=THICK_SIDE)
-    for i in range(7):
+    working_cell.border = get_border(right='thick')
+
+    for i in range(MAX_SCORE_SUM):
         working_cell = select_cell(ws, 12, 2+i)
         working_cell.value = '{},5'.format(i)
-
-    # P(<0,5) === P(0:0)
-    working_cell = select_cell(ws, 13, 2)
-    working_cell.value = ws.cell(3, 3).value
-    working_cell.fill = copy(ws.cell(3, 3).fill)
-    # P(<1,5) etc.
-    for score_sum in range(1, 7):
-        working_cell = select_cell(ws, 13, 2+score_sum)
-        # start with probability for score_sum - 1
-        working_value = float(ws.cell(13, 1+score_sum).value)
-        # add all the probabilities for match scores that add to score_sum
-        for i in range(score_sum + 1):
-            j = score_sum - i
-            working_value += float(ws.cell(3+i, 3+j).value)
-        # set value and color
-        working_cell.value = '{:.9f}'.format(working_value)
-        working_cell.fill = color_probability(working_value)
-
-    # all other values
-    for i in range(7):
+        # P(<n,5)
+        select_cell(ws, 13, 2+i)
         # 1 / P(<n,5) / home team games played
-        working_cell = select_cell(ws, 14, 2+i)
-        if divide_by_ht_matches_played:
-            working_value = np.reciprocal(float(ws.cell(13, 2+i).value) * ht_matches_played)
-        else:
-            working_value = np.reciprocal(float(ws.cell(13, 2+i).value))
-        working_cell.value = '{:.9f}'.format(working_value)
-        highlight_result(working_cell)
+        highlight_result(select_cell(ws, 14, 2+i))
         # P(>n,5)
-        working_cell = select_cell(ws, 15, 2+i)
-        working_value = 1 - float(ws.cell(13, 2+i).value)
-        working_cell.value = '{:.9f}'.format(working_value)
-        working_cell.fill = color_probability(working_value)
+        select_cell(ws, 15, 2+i)
         # 1 / P(>n,5) / home team games played
-        working_cell = select_cell(ws, 16, 2+i)
-        if divide_by_ht_matches_played:
-            working_value = np.reciprocal(float(ws.cell(15, 2+i).value) * ht_matches_played)
-        else:
-            working_value = np.reciprocal(float(ws.cell(15, 2+i).value))
-        working_cell.value = '{:.9f}'.format(working_value)
-        highlight_result(working_cell)
+        highlight_result(select_cell(ws, 16, 2+i))
 
     # create table of initial values
     for r in range(17, 21):
@@ -230,22 +179,22 @@ def generate_page(
     ws.merge_cells(range_string='D18:F18')
     ws.merge_cells(range_string='G18:I18')
     working_cell = select_cell(ws, 18, 1)
-    working_cell.alignment = Alignment('center', 'center')
+    working_cell.alignment = CENTER_ALIGNMENT
     working_cell.value = 'Ev Sahibi Takım'
-    working_cell.border = Border(left=THICK_SIDE, right=THICK_SIDE, bottom=THICK_SIDE)
+    working_cell.border = get_border(left='thick', right='thick', bottom='thick')
     working_cell = select_cell(ws, 18, 4)
-    working_cell.alignment = Alignment('center', 'center')
+    working_cell.alignment = CENTER_ALIGNMENT
     working_cell.value = 'Konuk Takım'
-    working_cell.border = Border(left=THICK_SIDE, right=THICK_SIDE, bottom=THICK_SIDE)
+    working_cell.border = get_border(left='thick', right='thick', bottom='thick')
     working_cell = select_cell(ws, 18, 7)
-    working_cell.alignment = Alignment('center', 'center')
+    working_cell.alignment = CENTER_ALIGNMENT
     working_cell.value = 'Lig Ortalaması'
-    working_cell.border = Border(left=THICK_SIDE, right=THICK_SIDE, bottom=THICK_SIDE)
+    working_cell.border = get_border(left='thick', right='thick', bottom='thick')
     for i in range(1, 10):
         working_cell = select_cell(ws, 19, i)
-        working_cell.border = Border(left=THICK_SIDE, right=THICK_SIDE, bottom=THICK_SIDE)
+        working_cell.border = get_border(left='thick', right='thick', bottom='thick')
         working_cell = select_cell(ws, 20, i)
-        working_cell.border = Border(left=THICK_SIDE, right=THICK_SIDE, bottom=THICK_SIDE)
+        working_cell.border = get_border(left='thick', right='thick', bottom='thick')
     
     ws.cell(19, 1).value = 'Oynadığı maç sayısı'
     ws.cell(19, 2).value = 'Attığı gol'
@@ -257,38 +206,274 @@ def generate_page(
     ws.cell(19, 8).value = 'Ev sahibi gol'
     ws.cell(19, 9).value = 'Misafir gol'
 
-    ws.cell(20, 1).value = str(ht_matches_played)
-    ws.cell(20, 2).value = str(ht_goals_scored)
-    ws.cell(20, 3).value = str(ht_goals_lost)
-    ws.cell(20, 4).value = str(vt_matches_played)
-    ws.cell(20, 5).value = str(vt_goals_scored)
-    ws.cell(20, 6).value = str(vt_goals_lost)
-    ws.cell(20, 7).value = str(league_matches_played)
-    ws.cell(20, 8).value = str(league_home_goals)
-    ws.cell(20, 9).value = str(league_visitor_goals)
-
 
     # list format at bottom of page
     select_cell(ws, 22, 1).value = 'Gol sayısı'
     select_cell(ws, 22, 2).value = 'Ev Sahibi Takım'
     select_cell(ws, 22, 3).value = 'Konuk Takım'
-    for i in range(8):
-        value_col = 3+i
+    for i in range(MAX_GOALS):
         ws.row_dimensions[21 + 9 * i].height = 20
 
         select_cell(ws, 23 + i, 1).value = str(i)
-        select_cell(ws, 23 + i, 2).value = ws.cell(2, value_col).value
-        select_cell(ws, 23 + i, 3).value = ws.cell(value_col, 2).value
-        for j in range(8):
-            value_row = 3+j
-        
+        select_cell(ws, 23 + i, 2)
+        select_cell(ws, 23 + i, 3)
+        for j in range(MAX_GOALS):
             offset_row = j + 9 * i
             ws.row_dimensions[22 + offset_row].height = 20
             working_cell = select_cell(ws, 22 + offset_row, 5)
             working_cell.value = '{} - {}'.format(i, j)
-            working_cell = select_cell(ws, 22 + offset_row, 6)
-            working_cell.value = ws.cell(value_row, value_col).value
+            select_cell(ws, 22 + offset_row, 6)
+
+
+def fill_page(ws: Worksheet, page: PageData, index: int = 0) -> None:
+    # only the match data, on top of a page set up by init_page_layout
+
+    ht_pmf = page.ht_pmf[index]
+    vt_pmf = page.vt_pmf[index]
+    score_matrix = page.score_matrix[index]
+
+    for i in range(MAX_GOALS):
+        ht_value = '{:.9f}'.format(ht_pmf[i])
+        vt_value = '{:.9f}'.format(vt_pmf[i])
+        # home team goal probabilities
+        working_cell = ws.cell(2, 3+i)
+        working_cell.value = ht_value
+        working_cell.fill = color_probability(ht_pmf[i])
+        ws.cell(23 + i, 2).value = ht_value
+        # visitor team goal probabilities
+        working_cell = ws.cell(3+i, 2)
+        working_cell.value = vt_value
+        working_cell.fill = color_probability(vt_pmf[i])
+        ws.cell(23 + i, 3).value = vt_value
+
+        # probabilities for all combinations of goals
+        for j in range(MAX_GOALS):
+            working_value = '{:.9f}'.format(score_matrix[i, j])
+            working_cell = ws.cell(3+j, 3+i)
+            working_cell.value = working_value
+            working_cell.fill = color_probability(score_matrix[i, j])
+            ws.cell(22 + j + 9 * i, 6).value = working_value
+
+    for i in range(MAX_SCORE_SUM):
+        # P(<n,5)
+        working_cell = ws.cell(13, 2+i)
+        working_cell.value = '{:.9f}'.format(page.under[index, i])
+        working_cell.fill = color_probability(page.under[index, i])
+        # 1 / P(<n,5) / home team games played
+        ws.cell(14, 2+i).value = '{:.9f}'.format(page.under_reciprocal[index, i])
+        # P(>n,5)
+        working_cell = ws.cell(15, 2+i)
+        working_cell.value = '{:.9f}'.format(page.over[index, i])
+        working_cell.fill = color_probability(page.over[index, i])
+        # 1 / P(>n,5) / home team games played
+        ws.cell(16, 2+i).value = '{:.9f}'.format(page.over_reciprocal[index, i])
+
+    # table of initial values
+    for i in range(9):
+        ws.cell(20, 1+i).value = str(page.inputs[index, i])
+
 
+def render_page(ws: Worksheet, page: PageData, index: int = 0) -> None:
+    init_page_layout(ws)
+    fill_page(ws, page, index)
+
+
+def generate_page(
+    ws: Worksheet,
+    ht_matches_played: int,
+    ht_goals_scored: int,
+    ht_goals_lost: int,
+    vt_matches_played: int,
+    vt_goals_scored: int,
+    vt_goals_lost: int,
+    league_matches_played: int,
+    league_home_goals: int,
+    league_visitor_goals: int,
+    divide_by_ht_matches_played: bool = False
+) -> None:
+    render_page(ws, compute_pages(
+        ht_matches_played,
+        ht_goals_scored,
+        ht_goals_lost,
+        vt_matches_played,
+        vt_goals_scored,
+        vt_goals_lost,
+        league_matches_played,
+        league_home_goals,
+        league_visitor_goals,
+        divide_by_ht_matches_played
+    ))
+
+
+# (label, Markets field, column) of each row of the markets sheet
+MARKET_ROWS = (
+    [('1', 'result', 0), ('X', 'result', 1), ('2', 'result', 2)] +
+    [('1X', 'double_chance', 0), ('12', 'double_chance', 1), ('X2', 'double_chance', 2)] +
+    [('KG var', 'both_teams_score', None), ('KG yok', 'both_teams_score', None)] +
+    [('Ev sahibi {} üst'.format(line_label(line).lstrip('+')), 'home_total_over', t)
+     for t, line in enumerate(TEAM_TOTAL_LINES)] +
+    [('Konuk {} üst'.format(line_label(line).lstrip('+')), 'visitor_total_over', t)
+     for t, line in enumerate(TEAM_TOTAL_LINES)] +
+    [('Handikap {}'.format(line_label(line)), 'asian_handicap_win', l)
+     for l, line in enumerate(ASIAN_HANDICAP_LINES)]
+)
+# first row of the most likely scores
+TOP_SCORES_ROW = len(MARKET_ROWS) + 4
+
+
+def init_markets_layout(ws: Worksheet) -> None:
+    # probabilities and fair odds of the normal and double pages side by side
+    for c, width in enumerate([16, 14, 14, 14, 14]):
+        ws.column_dimensions[get_column_letter(1 + c)].width = width
+    for c, title in enumerate(['Piyasa', 'Normal', '1/olasılık', 'Çift', '1/olasılık']):
+        working_cell = select_cell(ws, 1, 1 + c)
+        working_cell.value = title
+        working_cell.border = get_border(bottom='thick', right='thick' if c % 2 == 0 else None)
+    for r, (label, _, _) in enumerate(MARKET_ROWS):
+        working_cell = select_cell(ws, 2 + r, 1)
+        working_cell.value = label
+        working_cell.border = get_border(right='thick')
+        for c in range(2, 6):
+            working_cell = select_cell(ws, 2 + r, c)
+            if c % 2 == 1:
+                highlight_result(working_cell)
+                working_cell.border = get_border(right='thick')
+
+    for c, title in enumerate(['En olası skor', 'Normal', 'Olasılık', 'Çift', 'Olasılık']):
+        working_cell = select_cell(ws, TOP_SCORES_ROW, 1 + c)
+        working_cell.value = title
+        working_cell.border = get_border(bottom='thick', right='thick' if c % 2 == 0 else None)
+    for k in range(TOP_SCORES):
+        working_cell = select_cell(ws, TOP_SCORES_ROW + 1 + k, 1)
+        working_cell.value = str(k + 1)
+        working_cell.border = get_border(right='thick')
+        for c in range(2, 6):
+            working_cell = select_cell(ws, TOP_SCORES_ROW + 1 + k, c)
+            if c % 2 == 1:
+                working_cell.border = get_border(right='thick')
+
+
+def fill_markets(ws: Worksheet, normal_markets: Markets, double_markets: Markets, index: int = 0) -> None:
+    for m, markets in enumerate([normal_markets, double_markets]):
+        column = 2 + 2 * m
+        handicap_odds = asian_handicap_odds(markets)
+        for r, (label, field, k) in enumerate(MARKET_ROWS):
+            values = getattr(markets, field)[index]
+            p = values if k is None else values[k]
+            if label == 'KG yok':
+                p = 1 - p
+            # a handicap push returns the stake
+            odds = handicap_odds[index, k] if field == 'asian_handicap_win' else fair_odds(p)
+            working_cell = ws.cell(2 + r, column)
+            working_cell.value = '{:.9f}'.format(p)
+            working_cell.fill = color_probability(p)
+            ws.cell(2 + r, column + 1).value = '{:.9f}'.format(odds)
+        for k in range(markets.top_score_probability.shape[1]):
+            p = markets.top_score_probability[index, k]
+            ws.cell(TOP_SCORES_ROW + 1 + k, column).value = '{} - {}'.format(
+                markets.top_score_home_goals[index, k], markets.top_score_visitor_goals[index, k])
+            working_cell = ws.cell(TOP_SCORES_ROW + 1 + k, column + 1)
+            working_cell.value = '{:.9f}'.format(p)
+            working_cell.fill = color_probability(p)
+
+
+SHEET_TITLES = ['Normal toplam maç sayısı', 'Çift toplam maç sayısı', 'Piyasalar']
+
+
+def init_workbook_layout() -> Workbook:
+    workbook: Workbook = Workbook()
+    ws = workbook.active
+    ws.title = SHEET_TITLES[0]
+    init_page_layout(ws)
+
+    workbook.create_sheet(SHEET_TITLES[1])
+    init_page_layout(workbook[SHEET_TITLES[1]])
+
+    workbook.create_sheet(SHEET_TITLES[2])
+    init_markets_layout(workbook[SHEET_TITLES[2]])
+
+    return workbook
+
+
+def match_markets(page: PageData, markets: Markets, index: int) -> Markets:
+    # the markets of one match: its row of the slate's markets, or computed from its page
+    if markets is None:
+        return compute_markets(page.score_matrix)
+    return markets_slice(markets, index)
+
+
+def fill_workbook(
+    workbook: Workbook,
+    normal_page: PageData,
+    double_page: PageData,
+    index: int = 0,
+    normal_markets: Markets = None,
+    double_markets: Markets = None
+) -> None:
+    # the match on its own grid, as if it was computed alone
+    normal_match, double_match = page_slice(normal_page, index), page_slice(double_page, index)
+    fill_page(workbook[SHEET_TITLES[0]], normal_match)
+    fill_page(workbook[SHEET_TITLES[1]], double_match)
+    fill_markets(
+        workbook[SHEET_TITLES[2]],
+        match_markets(normal_match, normal_markets, index),
+        match_markets(double_match, double_markets, index))
+
+
+def render_workbook(
+    normal_page: PageData,
+    double_page: PageData,
+    index: int = 0,
+    normal_markets: Markets = None,
+    double_markets: Markets = None
+) -> Workbook:
+    # a new workbook, built from scratch
+    workbook = init_workbook_layout()
+    fill_workbook(workbook, normal_page, double_page, index, normal_markets, double_markets)
+    return workbook
+
+
+# the layout is built once per process and reused; every match overwrites the same data cells.
+# each color used is added to the workbook's style tables and saved with the file, so the
+# tables are put back to those of the bare layout before every match
+TEMPLATE_STYLE_TABLES = [
+    '_fonts', '_fills', '_borders', '_alignments', '_protections', '_number_formats', '_cell_styles'
+]
+template_workbook: Workbook = None
+template_styles: dict = None
+template_lock = threading.Lock()
+
+
+def get_template_workbook() -> Workbook:
+    global template_workbook, template_styles
+    if template_workbook is None:
+        template_workbook = init_workbook_layout()
+        template_styles = {name: list(getattr(template_workbook, name)) for name in TEMPLATE_STYLE_TABLES}
+    else:
+        # every data cell gets its style again when it is filled
+        for name, values in template_styles.items():
+            setattr(template_workbook, name, IndexedList(values))
+    return template_workbook
+
+
+def save_workbook(
+    filename,
+    normal_page: PageData,
+    double_page: PageData,
+    index: int = 0,
+    normal_markets: Markets = None,
+    double_markets: Markets = None
+) -> bytes:
+    # filename may be a path or a writable binary buffer;
+    # if it is None the workbook is returned as bytes instead.
+    # markets of the whole slate can be passed in, otherwise they are computed for this match
+    buffer = io.BytesIO() if filename is None else filename
+    with template_lock:
+        workbook = get_template_workbook()
+        fill_workbook(workbook, normal_page, double_page, index, normal_markets, double_markets)
+        workbook.save(buffer)
+    if filename is None:
+        return buffer.getvalue()
 
 
 def write_spreadsheet(
@@ -312,14 +497,9 @@ def write_spreadsheet(
     # common inputs
     league_home_goals: int,
     league_away_goals: int
-) -> None:
+) -> bytes:
 
-    workbook: Workbook = Workbook()
-    ws = workbook.active
-    ws.title = 'Normal toplam maç sayısı'
-
-    generate_page(
-        ws,
+    normal_page, double_page = compute_workbooks(
         ht_total_matches_played,
         ht_total_goals_scored,
         ht_total_goals_lost,
@@ -327,15 +507,6 @@ def write_spreadsheet(
         at_total_goals_scored,
         at_total_goals_lost,
         league_home_matches_played,
-        league_home_goals,
-        league_away_goals
-    )
-
-    workbook.create_sheet('Çift toplam maç sayısı')
-    ws = workbook['Çift toplam maç sayısı']
-
-    generate_page(
-        ws,
         ht_home_matches_played,
         ht_home_goals_scored,
         ht_home_goals_lost,
@@ -344,9 +515,425 @@ def write_spreadsheet(
         at_away_goals_lost,
         league_total_matches_played,
         league_home_goals,
-        league_away_goals,
-        True
+        league_away_goals
     )
-
-    workbook.save(filename)
-
+    return save_workbook(filename, normal_page, double_page)
+
+
+def write_slate(filenames: list, **inputs) -> list:
+    # compute every match in one call, inputs are the keyword arguments of
+    # write_spreadsheet with one value per filename
+    normal_page, double_page = compute_workbooks(**inputs)
+    normal_markets = compute_markets(normal_page.score_matrix)
+    double_markets = compute_markets(double_page.score_matrix)
+    return [
+        save_workbook(filename, normal_page, double_page, index, normal_markets, double_markets)
+        for index, filename in enumerate(filenames)
+    ]
+
+
+# machine-readable outputs: every format holds the same numbers for a whole slate,
+# xlsx stays one styled workbook per match
+
+PAGE_NAMES = ['normal', 'double']
+# PageData fields with one row of numbers per match
+PAGE_ARRAY_FIELDS = [
+    'ht_adj_mean_goals', 'vt_adj_mean_goals', 'ht_pmf', 'vt_pmf', 'score_matrix',
+    'under', 'over', 'under_reciprocal', 'over_reciprocal'
+]
+# fields over the goal grid -> number of goal axes; written as goals 0 .. MAX_GOALS - 1 and
+# MAX_GOALS or more, so every file has the same columns whatever the grid of its matches
+GOAL_FIELDS = {'ht_pmf': 1, 'vt_pmf': 1, 'score_matrix': 2}
+GOAL_LABELS = [str(k) for k in range(MAX_GOALS)] + ['{}+'.format(MAX_GOALS)]
+
+
+class OutputFormat(NamedTuple):
+    extension: str
+    # write(target, match_names, normal_page, double_page, indices, normal_markets, double_markets) -> bytes,
+    # target is a path, a writable binary buffer or None for bytes;
+    # the markets are those of the whole slate, computed by the writer if not given
+    write: Callable
+    # True if a file holds one match only
+    per_match: bool = False
+    # stream(path, slates) writes (match_names, normal_page, double_page) slates into one file
+    # as they come; None if the format cannot be appended to, see write_stream
+    stream: Callable = None
+
+
+def write_bytes(target, data: bytes) -> bytes:
+    if target is None:
+        return data
+    if isinstance(target, (str, os.PathLike)):
+        with open(target, 'wb') as f:
+            f.write(data)
+    else:
+        target.write(data)
+
+
+def slate_indices(match_names: list, indices: list) -> list:
+    return list(range(len(match_names))) if indices is None else list(indices)
+
+
+def slate_markets(page: PageData, markets: Markets, indices: list) -> Markets:
+    # the markets of the matches at indices, computed now if the slate's are not given
+    if markets is None:
+        return compute_markets(page.score_matrix[indices])
+    return Markets(*(field[indices] for field in markets))
+
+
+def score_sum_label(score_sum: int) -> str:
+    # the n,5 of the over/under columns
+    return '{},5'.format(score_sum)
+
+
+def finite_list(values: np.ndarray) -> list:
+    # json has no inf or nan, those become null
+    values = np.asarray(values, dtype=np.float64)
+    return np.where(np.isfinite(values), values, None).tolist()
+
+
+def fixed_goals(values: np.ndarray, axes: int) -> np.ndarray:
+    # goals from MAX_GOALS on summed into one last column, on the last axes of values
+    for axis in range(values.ndim - axes, values.ndim):
+        head = np.take(values, np.arange(MAX_GOALS), axis=axis)
+        tail = np.take(values, np.arange(MAX_GOALS, values.shape[axis]), axis=axis)
+        values = np.concatenate([head, tail.sum(axis=axis, keepdims=True)], axis=axis)
+    return values
+
+
+def page_fields(page: PageData, indices: list) -> dict:
+    # field -> values of the matches at indices, the goal fields on the fixed goals
+    fields = dict()
+    for field in ['inputs'] + PAGE_ARRAY_FIELDS:
+        values = getattr(page, field)[indices]
+        fields[field] = fixed_goals(values, GOAL_FIELDS[field]) if field in GOAL_FIELDS else values
+    return fields
+
+
+def page_columns(page: PageData, indices: list, markets: Markets) -> tuple:
+    # (column names, values of shape (len(indices), columns)) of one page,
+    # markets are those of the matches at indices
+    fields = page_fields(page, indices)
+    names = list(PAGE_INPUT_NAMES)
+    blocks = [fields['inputs']]
+    names += ['ht_adj_mean_goals', 'vt_adj_mean_goals']
+    blocks += [fields['ht_adj_mean_goals'][:, None], fields['vt_adj_mean_goals'][:, None]]
+    names += ['ht_pmf_{}'.format(k) for k in GOAL_LABELS]
+    names += ['vt_pmf_{}'.format(k) for k in GOAL_LABELS]
+    blocks += [fields['ht_pmf'], fields['vt_pmf']]
+    names += ['score_{}_{}'.format(i, j) for i in GOAL_LABELS for j in GOAL_LABELS]
+    blocks.append(fields['score_matrix'].reshape(len(indices), -1))
+    for field in ['under', 'over', 'under_reciprocal', 'over_reciprocal']:
+        names += ['{}_{}'.format(field, score_sum_label(n)) for n in range(fields[field].shape[1])]
+        blocks.append(fields[field])
+    for name, values in market_columns(markets).items():
+        names.append(name)
+        blocks.append(values[:, None])
+    return names, np.hstack([np.asarray(b, dtype=np.float64) for b in blocks])
+
+
+def slate_rows(
+    match_names: list,
+    normal_page: PageData,
+    double_page: PageData,
+    indices: list,
+    normal_markets: Markets = None,
+    double_markets: Markets = None
+) -> tuple:
+    # one row per match and page: (column names, match names, page names, values)
+    indices = slate_indices(match_names, indices)
+    names, normal_values = page_columns(normal_page, indices, slate_markets(normal_page, normal_markets, indices))
+    _, double_values = page_columns(double_page, indices, slate_markets(double_page, double_markets, indices))
+    values = np.empty((2 * len(indices), len(names)), dtype=np.float64)
+    values[0::2] = normal_values
+    values[1::2] = double_values
+    row_matches = [match_names[i] for i in indices for _ in PAGE_NAMES]
+    row_pages = PAGE_NAMES * len(indices)
+    return names, row_matches, row_pages, values
+
+
+def json_header() -> dict:
+    # everything in a json output but the matches
+    return {
+        'goals': GOAL_LABELS,
+        'score_sums': [score_sum_label(n) for n in range(MAX_SCORE_SUM)],
+        'input_names': PAGE_INPUT_NAMES,
+        'asian_handicap_lines': ASIAN_HANDICAP_LINES,
+        'team_total_lines': TEAM_TOTAL_LINES,
+    }
+
+
+def json_matches(
+    match_names: list,
+    normal_page: PageData,
+    double_page: PageData,
+    indices: list = None,
+    normal_markets: Markets = None,
+    double_markets: Markets = None
+) -> list:
+    # one dict per match of a json output
+    indices = slate_indices(match_names, indices)
+    pages = list(zip(PAGE_NAMES, [normal_page, double_page]))
+    # page name -> field -> one list per match, converted a whole field at a time
+    fields = {
+        page_name: {field: finite_list(values) for field, values in page_fields(page, indices).items()}
+        for page_name, page in pages
+    }
+    markets = {
+        page_name: {
+            field: finite_list(values)
+            for field, values in slate_markets(page, page_markets, indices)._asdict().items()
+        }
+        for (page_name, page), page_markets in zip(pages, [normal_markets, double_markets])
+    }
+    return [
+        dict(
+            name=match_names[index],
+            **{
+                page_name: dict(
+                    inputs=fields[page_name]['inputs'][k],
+                    markets={field: values[k] for field, values in markets[page_name].items()},
+                    **{field: fields[page_name][field][k] for field in PAGE_ARRAY_FIELDS}
+                )
+                for page_name, _ in pages
+            }
+        )
+        for k, index in enumerate(indices)
+    ]
+
+
+def write_json_output(
+    target,
+    match_names: list,
+    normal_page: PageData,
+    double_page: PageData,
+    indices: list = None,
+    normal_markets: Markets = None,
+    double_markets: Markets = None
+) -> bytes:
+    document = dict(
+        json_header(),
+        matches=json_matches(match_names, normal_page, double_page, indices, normal_markets, double_markets))
+    return write_bytes(target, json.dumps(document, ensure_ascii=False).encode('utf-8'))
+
+
+def stream_json_output(path: str, slates) -> None:
+    # the document of write_json_output, one match at a time
+    with open(path, 'wb') as f:
+        header = json.dumps(json_header(), ensure_ascii=False)
+        f.write('{}, "matches": ['.format(header[:-1]).encode('utf-8'))
+        separator = ''
+        for match_names, normal_page, double_page in slates:
+            for match in json_matches(match_names, normal_page, double_page):
+                f.write((separator + json.dumps(match, ensure_ascii=False)).encode('utf-8'))
+                separator = ', '
+        f.write(b']}')
+
+
+def write_csv_output(
+    target,
+    match_names: list,
+    normal_page: PageData,
+    double_page: PageData,
+    indices: list = None,
+    normal_markets: Markets = None,
+    double_markets: Markets = None
+) -> bytes:
+    return write_bytes(target, csv_rows(
+        match_names, normal_page, double_page, indices, normal_markets, double_markets))
+
+
+def csv_rows(
+    match_names: list,
+    normal_page: PageData,
+    double_page: PageData,
+    indices: list = None,
+    normal_markets: Markets = None,
+    double_markets: Markets = None,
+    header: bool = True
+) -> bytes:
+    names, row_matches, row_pages, values = slate_rows(
+        match_names, normal_page, double_page, indices, normal_markets, double_markets)
+    text = io.StringIO(newline='')
+    writer = csv.writer(text)
+    if header:
+        writer.writerow(['match', 'page'] + names)
+    writer.writerows(
+        [match, page] + row
+        for match, page, row in zip(row_matches, row_pages, values.tolist()))
+    return text.getvalue().encode('utf-8')
+
+
+def stream_csv_output(path: str, slates) -> None:
+    # one header, then the rows of each slate as it comes
+    with open(path, 'wb') as f:
+        for k, (match_names, normal_page, double_page) in enumerate(slates):
+            f.write(csv_rows(match_names, normal_page, double_page, header=k == 0))
+
+
+def write_npz_output(
+    target,
+    match_names: list,
+    normal_page: PageData,
+    double_page: PageData,
+    indices: list = None,
+    normal_markets: Markets = None,
+    double_markets: Markets = None
+) -> bytes:
+    # arrays named <page>_<field>, the first axis is the match, as in match_names
+    indices = slate_indices(match_names, indices)
+    arrays = {
+        'match_names': np.array([match_names[i] for i in indices], dtype=np.str_),
+        'input_names': np.array(PAGE_INPUT_NAMES, dtype=np.str_),
+        'goals': np.array(GOAL_LABELS, dtype=np.str_),
+    }
+    for page_name, page, markets in zip(PAGE_NAMES, [normal_page, double_page], [normal_markets, double_markets]):
+        for field, values in page_fields(page, indices).items():
+            arrays['{}_{}'.format(page_name, field)] = values
+        for field, values in slate_markets(page, markets, indices)._asdict().items():
+            arrays['{}_markets_{}'.format(page_name, field)] = values
+    buffer = io.BytesIO() if target is None or isinstance(target, (str, os.PathLike)) else target
+    np.savez(buffer, **arrays)
+    if buffer is not target:
+        return write_bytes(target, buffer.getvalue())
+
+
+def write_parquet_output(
+    target,
+    match_names: list,
+    normal_page: PageData,
+    double_page: PageData,
+    indices: list = None,
+    normal_markets: Markets = None,
+    double_markets: Markets = None
+) -> bytes:
+    pyarrow = import_pyarrow()
+    table = parquet_table(match_names, normal_page, double_page, indices, normal_markets, double_markets)
+    buffer = io.BytesIO()
+    pyarrow.parquet.write_table(table, buffer)
+    return write_bytes(target, buffer.getvalue())
+
+
+def import_pyarrow():
+    # optional and slow to import, so only loaded for parquet output
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError('parquet output needs pyarrow')
+    return pyarrow
+
+
+def parquet_table(
+    match_names: list,
+    normal_page: PageData,
+    double_page: PageData,
+    indices: list = None,
+    normal_markets: Markets = None,
+    double_markets: Markets = None
+):
+    pyarrow = import_pyarrow()
+    names, row_matches, row_pages, values = slate_rows(
+        match_names, normal_page, double_page, indices, normal_markets, double_markets)
+    columns = {'match': row_matches, 'page': row_pages}
+    columns.update({name: values[:, i] for i, name in enumerate(names)})
+    return pyarrow.table(columns)
+
+
+def stream_parquet_output(path: str, slates) -> None:
+    # a row group per slate, the columns are the same for every one
+    pyarrow = import_pyarrow()
+    writer = None
+    try:
+        for match_names, normal_page, double_page in slates:
+            table = parquet_table(match_names, normal_page, double_page)
+            if writer is None:
+                writer = pyarrow.parquet.ParquetWriter(path, table.schema)
+            writer.write_table(table)
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+def write_xlsx_output(
+    target,
+    match_names: list,
+    normal_page: PageData,
+    double_page: PageData,
+    indices: list = None,
+    normal_markets: Markets = None,
+    double_markets: Markets = None
+) -> bytes:
+    indices = slate_indices(match_names, indices)
+    if len(indices) != 1:
+        raise ValueError('an xlsx file holds one match, got {}'.format(len(indices)))
+    return save_workbook(target, normal_page, double_page, indices[0], normal_markets, double_markets)
+
+
+OUTPUT_FORMATS = {
+    'xlsx': OutputFormat('xlsx', write_xlsx_output, per_match=True),
+    'json': OutputFormat('json', write_json_output, stream=stream_json_output),
+    'csv': OutputFormat('csv', write_csv_output, stream=stream_csv_output),
+    'npz': OutputFormat('npz', write_npz_output),
+    'parquet': OutputFormat('parquet', write_parquet_output, stream=stream_parquet_output),
+}
+
+
+def write_output(
+    output_format: str,
+    target,
+    match_names: list,
+    normal_page: PageData,
+    double_page: PageData,
+    indices: list = None
+) -> bytes:
+    return OUTPUT_FORMATS[output_format].write(
+        target, match_names, normal_page, double_page, indices,
+        compute_markets(normal_page.score_matrix), compute_markets(double_page.score_matrix))
+
+
+def write_stream(output_format: str, path: str, slates) -> None:
+    # every slate of the iterable slates in one file; formats without a stream, npz,
+    # keep every slate in memory until the last one
+    output = OUTPUT_FORMATS[output_format]
+    if output.stream is not None:
+        return output.stream(path, slates)
+    slates = list(slates)
+    if len(slates) > 0:
+        write_output(
+            output_format, path,
+            [name for match_names, _, _ in slates for name in match_names],
+            concatenate_pages([normal_page for _, normal_page, _ in slates]),
+            concatenate_pages([double_page for _, _, double_page in slates]))
+
+
+def write_outputs(
+    output_format: str,
+    output_dir: str,
+    match_names: list,
+    normal_page: PageData,
+    double_page: PageData,
+    slate_name: str = 'slate'
+) -> list:
+    # writes the slate into output_dir, one file per match for xlsx; returns the paths
+    output = OUTPUT_FORMATS[output_format]
+    # once for the slate, every file takes its rows
+    normal_markets = compute_markets(normal_page.score_matrix)
+    double_markets = compute_markets(double_page.score_matrix)
+    if output.per_match:
+        paths = list()
+        for index, match_name in enumerate(match_names):
+            path = os.path.join(output_dir, '{}.{}'.format(match_name, output.extension))
+            output.write(path, match_names, normal_page, double_page, [index], normal_markets, double_markets)
+            paths.append(path)
+        return paths
+    path = os.path.join(output_dir, '{}.{}'.format(slate_name, output.extension))
+    output.write(path, match_names, normal_page, double_page, None, normal_markets, double_markets)
+    return [path]
+
+
+def write_slate_as(output_format: str, target, match_names: list, **inputs) -> bytes:
+    # the whole slate in one file, inputs are the keyword arguments of
+    # write_spreadsheet with one value per match name
+    normal_page, double_page = compute_workbooks(**inputs)
+    return write_output(output_format, target, match_names, normal_page, double_page)
@@ -0,0 +1,67 @@
+import os
+import time
+from typing import NamedTuple
+from concurrent.futures import ProcessPoolExecutor, Future
+
+
+class PageRecord(NamedTuple):
+    # pages already computed, probability_engine.PageData of this match only, see page_slice
+    match_name: str
+    normal_page: tuple
+    double_page: tuple
+
+
+class RenderResult(NamedTuple):
+    match_name: str
+    filename: str
+    # workbook bytes, or None if it was written to path
+    data: bytes
+    path: str
+    # error message if this match failed, None otherwise
+    error: str
+    # time spent in save_workbook
+    seconds: float
+
+
+def render_record(record: PageRecord, output_dir: str = None) -> RenderResult:
+    # runs in a worker process, so only plain values go in and out
+    import probability_machine
+    filename = '{}.xlsx'.format(record.match_name)
+    start = time.monotonic()
+    try:
+        if output_dir is None:
+            data = probability_machine.save_workbook(None, record.normal_page, record.double_page)
+            return RenderResult(record.match_name, filename, data, None, None, time.monotonic() - start)
+        path = os.path.join(output_dir, filename)
+        probability_machine.save_workbook(path, record.normal_page, record.double_page)
+        return RenderResult(record.match_name, filename, None, path, None, time.monotonic() - start)
+    except Exception as e:
+        return RenderResult(record.match_name, filename, None, None, repr(e), time.monotonic() - start)
+
+
+class RenderExecutor:
+    # fans workbook rendering out over processes; failures come back per match
+
+    def __init__(self, max_workers: int = None, output_dir: str = None):
+        self.output_dir = output_dir
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.executor = ProcessPoolExecutor(max_workers=self.max_workers)
+
+    def submit(self, record: PageRecord) -> Future:
+        return self.executor.submit(render_record, record, self.output_dir)
+
+    def render(self, records: list) -> list:
+        # results in the order of records
+        futures = [self.submit(record) for record in records]
+        results = list()
+        for record, future in zip(records, futures):
+            try:
+                results.append(future.result())
+            except Exception as e:
+                # the worker process itself died
+                results.append(RenderResult(
+                    record.match_name, '{}.xlsx'.format(record.match_name), None, None, repr(e), 0))
+        return results
+
+    def shutdown(self) -> None:
+        self.executor.shutdown()
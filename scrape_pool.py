@@ -0,0 +1,90 @@
+import queue
+import threading
+
+from selenium.webdriver.firefox.options import Options
+
+from browser_manager import BrowserManager
+from league_table import StandingsCache
+from team_names import TeamNameCache
+from scraper import ScrapeResult, scrape_match
+
+
+class ScrapePool:
+    # a number of headless browsers taking match jobs from a queue;
+    # the browsers are kept between scrape() calls like the main one
+
+    def __init__(
+        self,
+        options: Options,
+        worker_count: int,
+        standings_cache: StandingsCache,
+        team_name_cache: TeamNameCache,
+        addon_path: str = None,
+        max_cycles: int = 0,
+        max_memory_growth_mb: float = 0
+    ):
+        self.standings_cache = standings_cache
+        self.team_name_cache = team_name_cache
+        self.browsers = [
+            BrowserManager(options, addon_path, max_cycles, max_memory_growth_mb)
+            for _ in range(worker_count)
+        ]
+
+    def work(
+        self,
+        browser: BrowserManager,
+        job_queue: queue.Queue,
+        results: list,
+        done: list
+    ) -> None:
+        try:
+            wd = browser.acquire()
+        except Exception as e:
+            # leave the jobs to the other workers
+            print('Scrape worker error: {}'.format(e))
+            return
+        while True:
+            try:
+                job = job_queue.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                team_names, standings = scrape_match(
+                    wd, job, self.standings_cache, self.team_name_cache, by_url=True)
+                results[job.index] = ScrapeResult(job, team_names, standings, None)
+            except Exception as e:
+                results[job.index] = ScrapeResult(job, None, None, e)
+            done[job.index].set()
+
+    def scrape(self, match_jobs: list):
+        # yields results in the order of match_jobs, i.e. by kickoff,
+        # each one as soon as it and every earlier one are done
+        job_queue = queue.Queue()
+        for job in match_jobs:
+            job_queue.put(job)
+        results = [None] * len(match_jobs)
+        done = [threading.Event() for _ in match_jobs]
+
+        threads = [
+            threading.Thread(
+                target=self.work, args=(browser, job_queue, results, done), daemon=True)
+            for browser in self.browsers[:max(1, len(match_jobs))]
+        ]
+        for thread in threads:
+            thread.start()
+
+        for i, job in enumerate(match_jobs):
+            while not done[i].wait(timeout=1):
+                if not any(thread.is_alive() for thread in threads):
+                    break
+            if results[i] is None:
+                results[i] = ScrapeResult(
+                    job, None, None, RuntimeError('no scrape worker available'))
+            yield results[i]
+
+        for thread in threads:
+            thread.join()
+
+    def quit(self) -> None:
+        for browser in self.browsers:
+            browser.quit()
@@ -0,0 +1,287 @@
+from selenium import webdriver
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support.ui import Select
+from selenium.webdriver.remote.webelement import WebElement
+from selenium.common.exceptions import NoSuchElementException
+
+import os
+import datetime
+from typing import NamedTuple
+from urllib.parse import urldefrag
+
+from league_table import StandingsCache, LeagueStandings
+from team_names import TeamNameCache, parse_match_id, parse_listing_team_names
+from stage_metrics import timed
+from page_waits import (
+    wait_for, listing_signature, listing_changed,
+    window_opened, league_page_loaded, standing_table_replaced, match_page_loaded)
+
+LISTING_URL = 'http://arsiv.mackolik.com/Iddaa-Programi'
+# the listing is read with every date and the second tab selected
+LISTING_DATE_VALUE = '-1'
+LISTING_TAB_TYPE = '2'
+
+DIR_PATH = os.path.dirname(os.path.abspath(__file__))
+with open(os.path.join(DIR_PATH, 'page_cleaner.js'), 'r') as f:
+    JS_PAGE_CLEANER = f.read()
+with open(os.path.join(DIR_PATH, 'table_extractor.js'), 'r') as f:
+    JS_TABLE_EXTRACTOR = f.read()
+
+
+class MatchJob(NamedTuple):
+    # everything needed to scrape one match from the listing
+    index: int
+    kickoff: datetime.datetime
+    match_id: str
+    listing_team_names: list
+    league_key: str
+    league_url: str
+    match_url: str
+    # only usable in the browser that read the listing
+    league_node: WebElement
+    match_node: WebElement
+
+
+class ScrapeResult(NamedTuple):
+    job: MatchJob
+    team_names: list
+    standings: LeagueStandings
+    error: Exception
+
+
+def get_listing_rows(wd: webdriver.Firefox) -> list:
+    # every row of iddaa-tab-body2 as a dict, see table_extractor.js
+    return wd.execute_script(JS_TABLE_EXTRACTOR, 'listing') or list()
+
+
+@timed('listing_load')
+def load_listing(wd: webdriver.Firefox) -> list:
+    # go to webpage
+    wd.get(LISTING_URL)
+
+    # change webpage settings
+    date_select = Select(wd.find_element(By.ID, 'IddaaDateCmb'))
+    if date_select.first_selected_option.get_attribute('value') != LISTING_DATE_VALUE:
+        signature = listing_signature(wd)
+        date_select.select_by_value(LISTING_DATE_VALUE)
+        wait_for(wd, listing_changed(signature), 'date select')
+    signature = listing_signature(wd)
+    wd.find_element(By.XPATH, '//a[@href="#" and @type="{}"]'.format(LISTING_TAB_TYPE)).click()
+    wait_for(wd, listing_changed(signature), 'listing tab')
+    wd.execute_script(JS_PAGE_CLEANER)
+
+    # organise all the matches
+    return get_listing_rows(wd)
+
+
+def get_standing_rows(wd: webdriver.Firefox) -> list:
+    # every .puan_row of tblStanding as a list of cell texts
+    rows = wd.execute_script(JS_TABLE_EXTRACTOR, 'standings')
+    if rows is None:
+        raise NoSuchElementException('no tblStanding on {}'.format(wd.current_url))
+    return [[datum.strip().lower() for datum in row] for row in rows]
+
+
+def link_url(link: dict) -> str:
+    # url of a link that goes somewhere by itself; `#` and javascript: links
+    # only do something through their onclick, so they have none
+    href = (link['href'] or '').strip()
+    if href == '' or href.startswith('#') or href.lower().startswith('javascript:'):
+        return None
+    return link['url']
+
+
+def get_listing_match(listing_row: dict) -> tuple:
+    # match id and team names straight from the listing, without opening the match
+    link = listing_row['match']
+    match_id = parse_match_id(link['href'], link['onclick'])
+    return match_id, parse_listing_team_names(link['text'])
+
+
+def build_match_jobs(
+    listing_rows: list,
+    dt_now: datetime.datetime,
+    timedelta_max: datetime.timedelta
+) -> list:
+    # the matches starting within timedelta_max, in kickoff order
+    match_jobs = list()
+    skip_next = False
+    list_date = dt_now
+    for listing_row in listing_rows:
+        # check if we should skip this entry
+        if skip_next:
+            skip_next = False
+            continue
+        print('░▒▓ Entry:')
+        # check if this entry is just a date header
+        if listing_row['className'] == 'iddaa-oyna-title2':
+            datestr = listing_row['cells'][0].strip()
+            list_date = datetime.datetime.strptime(datestr, '%d.%m.%Y')
+            skip_next = True
+            print('is date header, skip next')
+            continue
+        # this entry is a match, figure out what time it starts
+        match_time = datetime.datetime.strptime(listing_row['time'], '%H:%M')
+        match_dt = datetime.datetime(
+            list_date.year,
+            list_date.month,
+            list_date.day,
+            match_time.hour,
+            match_time.minute
+        )
+        dt_difference = match_dt - dt_now
+        print('time difference {}'.format(dt_difference))
+        # check when the match takes place, relative to dt_now
+        if dt_difference >= timedelta_max:
+            print('end entries')
+            # this match is too far away; the rest are even later
+            break
+        match_id, team_names = get_listing_match(listing_row)
+        match_jobs.append(MatchJob(
+            index=len(match_jobs),
+            kickoff=match_dt,
+            match_id=match_id,
+            listing_team_names=team_names,
+            league_key=listing_row['cells'][1],
+            league_url=link_url(listing_row['league']),
+            match_url=link_url(listing_row['match']),
+            league_node=listing_row['leagueNode'],
+            match_node=listing_row['matchNode']
+        ))
+    return match_jobs
+
+
+def is_navigable(url: str, page_url: str = LISTING_URL) -> bool:
+    # a page of its own, not a fragment of page_url or page_url itself
+    if url is None or not url.startswith(('http://', 'https://')):
+        return False
+    return urldefrag(url)[0] != urldefrag(page_url)[0]
+
+
+def all_navigable(match_jobs: list) -> bool:
+    # every job can be scraped by url, without the listing's browser
+    return all(is_navigable(job.league_url) and is_navigable(job.match_url) for job in match_jobs)
+
+
+def read_team_names(wd: webdriver.Firefox) -> list:
+    # team names on the currently open match page
+    team_names = list()
+    team_names.append(
+        wd.find_element(By.XPATH, '//a[@class="left-block-team-name"]')
+        .text.strip().lower())
+    team_names.append(
+        wd.find_element(By.XPATH, '//a[@class="r-left-block-team-name"]')
+        .text.strip().lower())
+    return team_names
+
+
+def read_league_table(wd: webdriver.Firefox) -> list:
+    # standing table on the currently open league page
+    data_rows = list()
+    try:
+        try:
+            # make sure it's not in the finals league, e.g. KOSTA Apertural Final
+            # just choose the shortest name, that should do it (?)
+            # no groups no finals etc.
+            league_select: WebElement = wd.find_element(By.ID, 'Select2')
+            league_names = [e.text for e in league_select.find_elements(By.TAG_NAME, 'option')]
+            shortest_name = min(league_names, key=len)
+            if len(shortest_name) < len(Select(league_select).first_selected_option.text):
+                old_table = wd.find_element(By.ID, 'tblStanding')
+                Select(league_select).select_by_visible_text(shortest_name)
+                wait_for(wd, standing_table_replaced(old_table), 'sub-league switch')
+        except NoSuchElementException:
+            print('no sub-league selector')
+        # go on to find the data table
+        data_rows = get_standing_rows(wd)
+    except Exception as e:
+        print(e)
+    return data_rows
+
+
+@timed('team_names')
+def get_team_names(wd: webdriver.Firefox, node: WebElement) -> list:
+    wh_main = wd.current_window_handle
+    window_count = len(wd.window_handles)
+    node.find_element(By.TAG_NAME, 'a').click()
+    wait_for(wd, window_opened(window_count), 'match window')
+    wd.switch_to.window(wd.window_handles[-1])
+    try:
+        wait_for(wd, match_page_loaded, 'match page')
+        return read_team_names(wd)
+    finally:
+        wd.close()
+        wd.switch_to.window(wh_main)
+
+
+@timed('league_table')
+def get_league_table(wd: webdriver.Firefox, node: WebElement) -> list:
+    wh_main = wd.current_window_handle
+    window_count = len(wd.window_handles)
+    node.click()
+    wait_for(wd, window_opened(window_count), 'league window')
+    wd.switch_to.window(wd.window_handles[-1])
+    try:
+        wait_for(wd, league_page_loaded, 'league page')
+        return read_league_table(wd)
+    finally:
+        wd.close()
+        wd.switch_to.window(wh_main)
+
+
+@timed('team_names')
+def load_team_names(wd: webdriver.Firefox, url: str) -> list:
+    # same as get_team_names, but in this window and without the listing
+    wd.get(url)
+    wait_for(wd, match_page_loaded, 'match page')
+    return read_team_names(wd)
+
+
+@timed('league_table')
+def load_league_table(wd: webdriver.Firefox, url: str) -> list:
+    wd.get(url)
+    wait_for(wd, league_page_loaded, 'league page')
+    return read_league_table(wd)
+
+
+def scrape_match(
+    wd: webdriver.Firefox,
+    job: MatchJob,
+    standings_cache: StandingsCache,
+    team_name_cache: TeamNameCache,
+    by_url: bool = False
+) -> tuple:
+    # team names and standings for one match; by_url navigates this window
+    # instead of clicking the listing, so any browser can do it
+    team_names = team_name_cache.get(job.match_id) or job.listing_team_names
+    if by_url:
+        scrape_league = lambda: load_league_table(wd, job.league_url)
+    else:
+        scrape_league = lambda: get_league_table(wd, job.league_node)
+    standings = standings_cache.get_or_scrape(job.league_key, scrape_league)
+    if team_names is None or (
+            len(standings.rows) > 0 and any(t not in standings.teams for t in team_names)):
+        # the listing names are ambiguous or differ from the standing table,
+        # fall back to the match page and remember the result
+        if by_url:
+            team_names = load_team_names(wd, job.match_url)
+        else:
+            team_names = get_team_names(wd, job.match_node)
+        team_name_cache.put(job.match_id, team_names)
+    return team_names, standings
+
+
+def scrape_serial(
+    wd: webdriver.Firefox,
+    match_jobs: list,
+    standings_cache: StandingsCache,
+    team_name_cache: TeamNameCache,
+    by_url: bool = False
+):
+    # yields a ScrapeResult per job, as soon as it is scraped
+    for job in match_jobs:
+        try:
+            yield ScrapeResult(
+                job, *scrape_match(wd, job, standings_cache, team_name_cache, by_url), None)
+        except Exception as e:
+            yield ScrapeResult(job, None, None, e)
@@ -0,0 +1,165 @@
+import os
+import time
+import json
+import datetime
+import threading
+import functools
+from contextlib import contextmanager
+
+with open('_config.json', 'r') as f:
+    config = json.loads(f.read())
+
+    # one json line per cycle is appended here
+    METRICS_JSONL_PATH = config.get('metricsJsonlPath', 'metrics.jsonl')
+    # prometheus text format, for the node exporter textfile collector; null turns it off
+    METRICS_PROM_PATH = config.get('metricsPromPath')
+
+    del config
+
+METRIC_PREFIX = 'mackolik'
+
+# stage name -> list of (seconds, failed), for the current cycle
+stage_times: dict = dict()
+stage_lock = threading.Lock()
+cycle_start: datetime.datetime = None
+cycle_start_monotonic: float = None
+
+
+def percentile(values: list, q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q * (len(values) - 1))))]
+
+
+def record_stage(name: str, seconds: float, failed: bool = False) -> None:
+    with stage_lock:
+        stage_times.setdefault(name, list()).append((seconds, failed))
+
+
+@contextmanager
+def stage(name: str):
+    # times the block; an exception counts as an error of the stage and is raised again
+    start = time.monotonic()
+    failed = False
+    try:
+        yield
+    except BaseException:
+        failed = True
+        raise
+    finally:
+        record_stage(name, time.monotonic() - start, failed)
+
+
+def timed(name: str):
+    # the same as stage, as a decorator
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def start_cycle() -> None:
+    global cycle_start, cycle_start_monotonic
+    with stage_lock:
+        stage_times.clear()
+    cycle_start = datetime.datetime.now()
+    cycle_start_monotonic = time.monotonic()
+
+
+def stage_summary() -> dict:
+    summary = dict()
+    with stage_lock:
+        items = [(name, list(times)) for name, times in stage_times.items()]
+    for name, times in items:
+        seconds = [s for s, _ in times]
+        summary[name] = {
+            'count': len(times),
+            'errors': sum(1 for _, failed in times if failed),
+            'p50': percentile(seconds, 0.5),
+            'p90': percentile(seconds, 0.9),
+            'max': max(seconds),
+            'total': sum(seconds)
+        }
+    return summary
+
+
+def end_cycle(window_seconds: float, waits: dict = None, **counts) -> dict:
+    # everything measured since start_cycle; waits is page_waits.wait_summary(),
+    # counts are extra numbers such as delivered=3
+    seconds = time.monotonic() - cycle_start_monotonic
+    return {
+        'cycle_start': cycle_start.isoformat(),
+        'cycle_end': datetime.datetime.now().isoformat(),
+        'seconds': seconds,
+        'window_seconds': window_seconds,
+        # how far the cycle ran past its window, 0 if it fit
+        'overrun_seconds': max(0, seconds - window_seconds),
+        'counts': counts,
+        'stages': stage_summary(),
+        'waits': waits or dict()
+    }
+
+
+def prometheus_text(cycle: dict) -> str:
+    lines = list()
+
+    def metric(name: str, help_text: str, samples: list) -> None:
+        full_name = '{}_{}'.format(METRIC_PREFIX, name)
+        lines.append('# HELP {} {}'.format(full_name, help_text))
+        lines.append('# TYPE {} gauge'.format(full_name))
+        for labels, value in samples:
+            label_text = ','.join(
+                '{}="{}"'.format(k, str(v).replace('\\', '\\\\').replace('"', '\\"'))
+                for k, v in labels.items())
+            lines.append('{}{} {}'.format(
+                full_name, '{' + label_text + '}' if label_text else '', float(value)))
+
+    stages = cycle['stages']
+    metric('stage_calls', 'Calls of each stage in the last cycle.',
+           [({'stage': n}, s['count']) for n, s in stages.items()])
+    metric('stage_errors', 'Failed calls of each stage in the last cycle.',
+           [({'stage': n}, s['errors']) for n, s in stages.items()])
+    metric('stage_seconds_total', 'Time spent in each stage in the last cycle.',
+           [({'stage': n}, s['total']) for n, s in stages.items()])
+    metric('stage_seconds', 'Latency of each stage in the last cycle.',
+           [({'stage': n, 'quantile': q}, s[key]) for n, s in stages.items()
+            for q, key in [('0.5', 'p50'), ('0.9', 'p90'), ('1', 'max')]])
+    waits = cycle['waits']
+    metric('page_waits', 'Page waits of each kind in the last cycle.',
+           [({'wait': n}, s['count']) for n, s in waits.items()])
+    metric('page_wait_timeouts', 'Page waits that timed out in the last cycle.',
+           [({'wait': n}, s['timeouts']) for n, s in waits.items()])
+    metric('page_wait_seconds_total', 'Time spent waiting for pages in the last cycle.',
+           [({'wait': n}, s['total']) for n, s in waits.items()])
+    metric('cycle_seconds', 'Duration of the last cycle.', [({}, cycle['seconds'])])
+    metric('cycle_window_seconds', 'Time the last cycle had.', [({}, cycle['window_seconds'])])
+    metric('cycle_overrun_seconds', 'How far the last cycle ran past its window.',
+           [({}, cycle['overrun_seconds'])])
+    metric('cycle_end_timestamp_seconds', 'When the last cycle ended.',
+           [({}, datetime.datetime.fromisoformat(cycle['cycle_end']).timestamp())])
+    for name, value in cycle['counts'].items():
+        metric('cycle_{}'.format(name), 'Count of {} in the last cycle.'.format(name), [({}, value)])
+    return '\n'.join(lines) + '\n'
+
+
+def export_cycle(cycle: dict) -> None:
+    if METRICS_JSONL_PATH:
+        with open(METRICS_JSONL_PATH, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(cycle) + '\n')
+    if METRICS_PROM_PATH:
+        # written next to it and renamed, so the collector never reads half a file
+        temp_path = '{}.tmp'.format(METRICS_PROM_PATH)
+        with open(temp_path, 'w', encoding='utf-8', newline='\n') as f:
+            f.write(prometheus_text(cycle))
+        os.replace(temp_path, METRICS_PROM_PATH)
+
+
+def print_cycle(cycle: dict) -> None:
+    for name, s in cycle['stages'].items():
+        print('stage {}: n={} errors={} p50={:.2f}s p90={:.2f}s max={:.2f}s total={:.2f}s'.format(
+            name, s['count'], s['errors'], s['p50'], s['p90'], s['max'], s['total']))
+    if cycle['overrun_seconds'] > 0:
+        print('cycle overran its {:.0f}s window by {:.0f}s'.format(
+            cycle['window_seconds'], cycle['overrun_seconds']))
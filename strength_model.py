@@ -0,0 +1,291 @@
+import threading
+import collections
+import numpy as np
+from typing import NamedTuple
+
+from league_table import (
+    LeagueStandings, IDX_TEAM_NAME,
+    IDX_TOTAL_MATCHES_PLAYED, IDX_TOTAL_GOALS_SCORED, IDX_TOTAL_GOALS_LOST,
+    IDX_HT_MATCHES_PLAYED, IDX_HT_GOALS_SCORED, IDX_HT_GOALS_LOST,
+    IDX_AT_MATCHES_PLAYED, IDX_AT_GOALS_SCORED, IDX_AT_GOALS_LOST
+)
+from probability_engine import (
+    MeanGoals, PageData, TAIL_EPSILON, grid_sizes, build_page, fix_divisor)
+
+# attack/defense/home advantage of every team of a league, fitted at once (Dixon-Coles style):
+# home goals ~ Poisson(home_advantage * attack[home] * defense[visitor])
+# visitor goals ~ Poisson(attack[visitor] * defense[home])
+# optionally with the Dixon-Coles correction of the 0-0, 1-0, 0-1 and 1-1 scores
+#
+# with "probabilityModel": "fitted" in _config.json, pipeline.compute_stage takes the normal page
+# of the emailed workbooks from here; the double page stays the one of probability_engine.
+# for a league snapshot, e.g. in a script or a notebook:
+#   strengths = strength_cache.get_or_fit(league_key, standings)
+#   page = compute_fitted_page(strengths, home_teams, visitor_teams)
+# page is a PageData like the normal page, so markets.compute_markets(page.score_matrix) and
+# probability_machine.save_workbook(path, page, double_page) take it; passing Results of the
+# played matches fits the actual pairings and rho, see tests/test_strength_model.py
+
+# the fixed point iteration stops after this many steps, or once nothing moves more than the tolerance
+FIT_ITERATIONS = 500
+FIT_TOLERANCE = 1e-10
+# values of the low score correlation tried when results are given
+RHO_GRID = np.linspace(-0.3, 0.3, 601)
+# fitted leagues kept in the cache
+CACHE_SIZE = 64
+
+
+class Results(NamedTuple):
+    # one value per played match, team names as in the standing table
+    home_team: list
+    visitor_team: list
+    home_goals: np.ndarray
+    visitor_goals: np.ndarray
+
+
+class Strengths(NamedTuple):
+    # team names, in the order of every array below
+    teams: list
+    # team name -> index
+    index: dict
+    # goals scored against an average defense, shape (T,)
+    attack: np.ndarray
+    # goals conceded relative to the average defense, which is 1, shape (T,)
+    defense: np.ndarray
+    home_advantage: float
+    # low score correlation, 0 without the correction
+    rho: float
+    # total matches played, goals scored, goals lost, as on the normal page, shape (T, 3)
+    totals: np.ndarray
+    # league home matches played, home goals, away goals, shape (3,)
+    league: np.ndarray
+    # fixed point steps taken
+    iterations: int
+
+
+def standings_counts(standings: LeagueStandings, teams: list) -> tuple:
+    # (home matches, home goals scored, home goals lost, away ...) of each team, shape (T,) each
+    def column(idx: int) -> np.ndarray:
+        return np.array([int(standings.teams[t][idx]) for t in teams], dtype=np.float64)
+    return (
+        column(IDX_HT_MATCHES_PLAYED), column(IDX_HT_GOALS_SCORED), column(IDX_HT_GOALS_LOST),
+        column(IDX_AT_MATCHES_PLAYED), column(IDX_AT_GOALS_SCORED), column(IDX_AT_GOALS_LOST)
+    )
+
+
+def standings_exposure(standings: LeagueStandings, teams: list) -> tuple:
+    # the table does not say who played whom, so the home matches of each team are
+    # spread evenly over the rest of the league;
+    # returns (W, home goals scored, home goals lost, away goals scored, away goals lost)
+    # where W[i, j] is the number of times i hosted j
+    home_played, home_scored, home_lost, _, away_scored, away_lost = standings_counts(standings, teams)
+    n = len(teams)
+    exposure = np.repeat(home_played[:, None] / max(n - 1, 1), n, axis=1)
+    np.fill_diagonal(exposure, 0)
+    return exposure, home_scored, home_lost, away_scored, away_lost
+
+
+def results_indices(results: Results, index: dict) -> tuple:
+    # (home index, visitor index, home goals, visitor goals) of the results between known teams
+    known = np.array([
+        h in index and v in index for h, v in zip(results.home_team, results.visitor_team)
+    ], dtype=bool)
+    home = np.array([index[h] for h, k in zip(results.home_team, known) if k], dtype=np.intp)
+    visitor = np.array([index[v] for v, k in zip(results.visitor_team, known) if k], dtype=np.intp)
+    home_goals = np.asarray(results.home_goals, dtype=np.float64)[known]
+    visitor_goals = np.asarray(results.visitor_goals, dtype=np.float64)[known]
+    return home, visitor, home_goals, visitor_goals
+
+
+def results_exposure(home: np.ndarray, visitor: np.ndarray, home_goals, visitor_goals, n: int) -> tuple:
+    # the same as standings_exposure, from the actual pairings
+    exposure = np.zeros((n, n))
+    np.add.at(exposure, (home, visitor), 1)
+    return (
+        exposure,
+        np.bincount(home, weights=home_goals, minlength=n),
+        np.bincount(home, weights=visitor_goals, minlength=n),
+        np.bincount(visitor, weights=visitor_goals, minlength=n),
+        np.bincount(visitor, weights=home_goals, minlength=n)
+    )
+
+
+def safe_divide(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    # 0 where nothing was played
+    return np.divide(a, b, out=np.zeros_like(a), where=b > 0)
+
+
+def fit_poisson(exposure: np.ndarray, home_scored, home_lost, away_scored, away_lost) -> tuple:
+    # maximum likelihood by the fixed point of the score equations (Maher);
+    # every step updates all teams at once, returns (attack, defense, home advantage, steps)
+    n = exposure.shape[0]
+    scored = home_scored + away_scored
+    lost = home_lost + away_lost
+    home_goals = home_scored.sum()
+    attack = np.ones(n)
+    defense = np.ones(n)
+    home_advantage = 1.0
+    steps = 0
+    for steps in range(1, FIT_ITERATIONS + 1):
+        # expected goals of each team per unit of its own parameter
+        new_attack = safe_divide(
+            scored, home_advantage * (exposure @ defense) + exposure.T @ defense)
+        new_defense = safe_divide(
+            lost, exposure @ new_attack + home_advantage * (exposure.T @ new_attack))
+        scale = new_defense.mean()
+        if scale > 0:
+            new_defense /= scale
+            new_attack *= scale
+        expected_home_goals = new_attack @ exposure @ new_defense
+        new_home_advantage = home_goals / expected_home_goals if expected_home_goals > 0 else 1.0
+        change = max(
+            np.abs(new_attack - attack).max(initial=0),
+            np.abs(new_defense - defense).max(initial=0),
+            abs(new_home_advantage - home_advantage))
+        attack, defense, home_advantage = new_attack, new_defense, new_home_advantage
+        if change < FIT_TOLERANCE:
+            break
+    return attack, defense, float(home_advantage), steps
+
+
+def low_score_factor(home_goals, visitor_goals, ht_mean_goals, vt_mean_goals, rho) -> np.ndarray:
+    # Dixon-Coles tau, 1 except for the 0-0, 1-0, 0-1 and 1-1 scores;
+    # every argument broadcasts, so rho can be a grid of values
+    factor = np.ones(np.broadcast(home_goals, visitor_goals, ht_mean_goals, vt_mean_goals, rho).shape)
+    factor = np.where((home_goals == 0) & (visitor_goals == 0), 1 - ht_mean_goals * vt_mean_goals * rho, factor)
+    factor = np.where((home_goals == 0) & (visitor_goals == 1), 1 + ht_mean_goals * rho, factor)
+    factor = np.where((home_goals == 1) & (visitor_goals == 0), 1 + vt_mean_goals * rho, factor)
+    factor = np.where((home_goals == 1) & (visitor_goals == 1), 1 - rho, factor)
+    return factor
+
+
+def fit_rho(home_goals, visitor_goals, ht_mean_goals, vt_mean_goals) -> float:
+    # with the means fixed only tau depends on rho; every value of RHO_GRID is scored at once
+    low = (home_goals <= 1) & (visitor_goals <= 1)
+    if not low.any():
+        return 0.0
+    factor = low_score_factor(
+        home_goals[low], visitor_goals[low], ht_mean_goals[low], vt_mean_goals[low], RHO_GRID[:, None])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        log_likelihood = np.where(factor > 0, np.log(factor), -np.inf).sum(axis=1)
+    return float(RHO_GRID[np.argmax(log_likelihood)])
+
+
+def fit_strengths(standings: LeagueStandings, results: Results = None, rho: float = None) -> Strengths:
+    # with results the actual pairings are used and rho is fitted unless given,
+    # otherwise the standing table alone, and rho defaults to 0
+    teams = [r[IDX_TEAM_NAME] for r in standings.rows]
+    index = {team: i for i, team in enumerate(teams)}
+    if results is not None:
+        home, visitor, home_goals, visitor_goals = results_indices(results, index)
+        fit_inputs = results_exposure(home, visitor, home_goals, visitor_goals, len(teams))
+    else:
+        fit_inputs = standings_exposure(standings, teams)
+    attack, defense, home_advantage, steps = fit_poisson(*fit_inputs)
+
+    if rho is None:
+        rho = 0.0
+        if results is not None and home.size > 0:
+            rho = fit_rho(
+                home_goals, visitor_goals,
+                home_advantage * attack[home] * defense[visitor], attack[visitor] * defense[home])
+
+    totals = np.array([
+        [int(standings.teams[t][idx]) for idx in
+         [IDX_TOTAL_MATCHES_PLAYED, IDX_TOTAL_GOALS_SCORED, IDX_TOTAL_GOALS_LOST]]
+        for t in teams
+    ], dtype=np.float64).reshape(len(teams), 3)
+    league = np.array(
+        [standings.home_matches_played, standings.home_goals, standings.away_goals], dtype=np.float64)
+    return Strengths(teams, index, attack, defense, home_advantage, rho, totals, league, steps)
+
+
+def fixture_mean_goals(strengths: Strengths, home_teams: list, visitor_teams: list) -> MeanGoals:
+    # a KeyError for teams not in the table, like league_table.match_inputs
+    home = np.array([strengths.index[t] for t in home_teams], dtype=np.intp)
+    visitor = np.array([strengths.index[t] for t in visitor_teams], dtype=np.intp)
+    inputs = np.concatenate([
+        strengths.totals[home], strengths.totals[visitor],
+        np.broadcast_to(strengths.league, (home.size, 3))
+    ], axis=1)
+    inputs[:, [0, 3, 6]] = fix_divisor(inputs[:, [0, 3, 6]])
+    return MeanGoals(
+        inputs=inputs,
+        ht_adj_mean_goals=strengths.home_advantage * strengths.attack[home] * strengths.defense[visitor],
+        vt_adj_mean_goals=strengths.attack[visitor] * strengths.defense[home],
+        reciprocal_scale=1
+    )
+
+
+def apply_low_score_correction(page: PageData, rho: float) -> PageData:
+    if rho == 0:
+        return page
+    ht_mean_goals = page.ht_adj_mean_goals
+    vt_mean_goals = page.vt_adj_mean_goals
+    goals = np.arange(2)
+    score_matrix = page.score_matrix.copy()
+    score_matrix[:, :2, :2] *= low_score_factor(
+        goals[None, :, None], goals[None, None, :],
+        ht_mean_goals[:, None, None], vt_mean_goals[:, None, None], rho)
+    # the correction moves P(0-0) * mean * mean * rho from the 0 and 2 goal totals to 1 goal,
+    # and leaves each team's own goals alone
+    moved = page.score_matrix[:, 0, 0] * ht_mean_goals * vt_mean_goals * rho
+    under = page.under.copy()
+    under[:, 0] -= moved
+    if under.shape[1] > 1:
+        under[:, 1] += moved
+    over = 1 - under
+    with np.errstate(divide='ignore'):
+        return page._replace(
+            score_matrix=score_matrix,
+            under=under,
+            under_reciprocal=np.reciprocal(under),
+            over=over,
+            over_reciprocal=np.reciprocal(over)
+        )
+
+
+def compute_fitted_page(
+    strengths: Strengths,
+    home_teams: list,
+    visitor_teams: list,
+    epsilon: float = TAIL_EPSILON
+) -> PageData:
+    # a page like the normal one, for any number of fixtures of the league
+    mean_goals = fixture_mean_goals(strengths, home_teams, visitor_teams)
+    max_goals = grid_sizes(
+        np.maximum(mean_goals.ht_adj_mean_goals, mean_goals.vt_adj_mean_goals), epsilon)
+    return apply_low_score_correction(build_page(mean_goals, max_goals), strengths.rho)
+
+
+class StrengthCache:
+    # (league key, snapshot time) -> Strengths, the least recently used ones are dropped
+
+    def __init__(self, max_entries: int = CACHE_SIZE):
+        self.max_entries = max_entries
+        self.entries = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    def get_or_fit(
+        self,
+        league_key: str,
+        standings: LeagueStandings,
+        results: Results = None,
+        rho: float = None
+    ) -> Strengths:
+        key = (league_key, standings.scraped_at, results is not None, rho)
+        with self.lock:
+            strengths = self.entries.get(key)
+            if strengths is not None:
+                self.entries.move_to_end(key)
+                return strengths
+        # fitted outside the lock, a rare duplicate fit is cheaper than blocking other leagues
+        strengths = fit_strengths(standings, results, rho)
+        with self.lock:
+            self.entries[key] = strengths
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return strengths
+
+
+strength_cache = StrengthCache()
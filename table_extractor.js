@@ -0,0 +1,50 @@
+// read a whole table in one round trip, arguments[0] selects which one
+function cellTexts(row) {
+    var texts = [];
+    for (var i = 0; i < row.cells.length; i++) {
+        texts.push(row.cells[i].innerText.trim());
+    }
+    return texts;
+}
+function linkOf(cell) {
+    var link = cell ? cell.querySelector('a') : null;
+    return {
+        text: link ? link.innerText.trim() : '',
+        href: link ? link.getAttribute('href') : null,
+        url: link ? link.href : null,
+        onclick: link ? link.getAttribute('onclick') : null
+    };
+}
+// rows of the program listing, with the cells that open the league and match pages
+if (arguments[0] == 'listing') {
+    var rows = document.querySelectorAll('span#iddaa-tab-body2 > table > tbody > tr');
+    var result = [];
+    for (var i = 0; i < rows.length; i++) {
+        var row = rows[i];
+        var cells = row.cells;
+        result.push({
+            className: row.getAttribute('class'),
+            cells: cellTexts(row),
+            time: cells.length > 0 ? cells[0].innerHTML : '',
+            leagueNode: cells.length > 1 ? cells[1] : null,
+            matchNode: cells.length > 4 ? cells[4] : null,
+            league: linkOf(cells[1]),
+            match: linkOf(cells[4])
+        });
+    }
+    return result;
+}
+// rows of the standing table
+if (arguments[0] == 'standings') {
+    var table = document.getElementById('tblStanding');
+    if (!table) {
+        return null;
+    }
+    var rows = table.querySelectorAll('.puan_row');
+    var result = [];
+    for (var i = 0; i < rows.length; i++) {
+        result.push(cellTexts(rows[i]));
+    }
+    return result;
+}
+return null;
@@ -0,0 +1,58 @@
+import os
+import re
+import json
+
+# e.g. http://arsiv.mackolik.com/Mac/3598431/Galatasaray-Fenerbahce
+MATCH_ID_PATTERN = re.compile(r'/Mac/(\d+)|(\d{5,})')
+
+
+def parse_match_id(*link_attributes) -> str:
+    # the first match id found in the link's href, onclick etc.
+    for attribute in link_attributes:
+        if not attribute:
+            continue
+        found = MATCH_ID_PATTERN.search(attribute)
+        if found is not None:
+            return found.group(1) or found.group(2)
+    return None
+
+
+def parse_listing_team_names(text: str) -> list:
+    # listing rows read `home - away`, anything else is ambiguous
+    team_names = [t.strip().lower() for t in text.split(' - ')]
+    if len(team_names) != 2 or not all(team_names):
+        return None
+    return team_names
+
+
+class TeamNameCache:
+    # match id -> [home team name, away team name], saved as json between runs
+
+    def __init__(self, path: str):
+        self.path = path
+        self.entries = dict()
+        self.changed = False
+        if path and os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    self.entries = json.loads(f.read())
+            except Exception as e:
+                print('Team name cache error: {}'.format(e))
+
+    def get(self, match_id: str) -> list:
+        if match_id is None:
+            return None
+        return self.entries.get(match_id)
+
+    def put(self, match_id: str, team_names: list) -> None:
+        if match_id is None or self.entries.get(match_id) == team_names:
+            return
+        self.entries[match_id] = team_names
+        self.changed = True
+
+    def save(self) -> None:
+        if not self.path or not self.changed:
+            return
+        with open(self.path, 'w', encoding='utf-8') as f:
+            f.write(json.dumps(self.entries, ensure_ascii=False))
+        self.changed = False
@@ -0,0 +1,29 @@
+import os
+import sys
+
+import pytest
+
+TESTS_PATH = os.path.dirname(os.path.abspath(__file__))
+REPO_PATH = os.path.dirname(TESTS_PATH)
+sys.path.insert(0, REPO_PATH)
+# modules read _config.json from the working directory
+os.chdir(REPO_PATH)
+
+FIXTURE_PATHS = [
+    os.path.join(TESTS_PATH, 'fixtures'),
+    # the standing tables are shared with the benchmarks
+    os.path.join(REPO_PATH, 'benchmarks', 'fixtures'),
+]
+
+
+@pytest.fixture
+def read_fixture():
+    # saved html page by file name
+    def read(name: str) -> str:
+        for fixture_path in FIXTURE_PATHS:
+            path = os.path.join(fixture_path, name)
+            if os.path.exists(path):
+                with open(path, 'r', encoding='utf-8') as f:
+                    return f.read()
+        raise FileNotFoundError(name)
+    return read
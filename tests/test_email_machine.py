@@ -0,0 +1,171 @@
+import json
+import base64
+import zipfile
+import io
+import email
+import threading
+from http.server import HTTPServer, BaseHTTPRequestHandler
+
+import pytest
+
+import email_machine
+
+
+class HttpError(Exception):
+    # like googleapiclient.errors.HttpError, which carries the response
+    def __init__(self, status: int):
+        super().__init__('http {}'.format(status))
+        self.resp = type('Response', (), {'status': status})()
+
+
+class FakeService:
+    # users().messages().send(...).execute() of the gmail client; fails with the given
+    # statuses first, then sends
+    def __init__(self, failures: list = None):
+        self.failures = list(failures or [])
+        self.sent = list()
+        self.calls = 0
+
+    def users(self):
+        return self
+
+    def messages(self):
+        return self
+
+    def send(self, userId, body):
+        self.body = body
+        return self
+
+    def execute(self):
+        self.calls += 1
+        if len(self.failures) > 0:
+            raise HttpError(self.failures.pop(0))
+        self.sent.append(base64.urlsafe_b64decode(self.body['raw']))
+        return {'id': 'message-{}'.format(len(self.sent))}
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(email_machine, 'RETRY_BASE_SECONDS', 0)
+
+
+def attachments(count: int, size: int) -> list:
+    return [('match {}.xlsx'.format(i), bytes([i]) * size) for i in range(count)]
+
+
+def attached_files(raw: bytes) -> dict:
+    message = email.message_from_bytes(raw)
+    return {
+        part.get_filename(): part.get_payload(decode=True)
+        for part in message.walk() if part.get_filename() is not None
+    }
+
+
+def test_split_attachments():
+    files = attachments(5, 300*1024)
+    groups = email_machine.split_attachments(files, 1024*1024)
+    assert [f for group in groups for f in group] == files
+    for group in groups:
+        size = email_machine.MESSAGE_OVERHEAD_BYTES + sum(
+            email_machine.encoded_size(len(data)) for _, data in group)
+        assert size <= 1024*1024
+    # too big for any message, sent on its own
+    assert email_machine.split_attachments(attachments(2, 2*1024*1024), 1024*1024) == [
+        [f] for f in attachments(2, 2*1024*1024)]
+
+
+def test_send_update_splits_messages(monkeypatch):
+    monkeypatch.setattr(email_machine, 'MAX_MESSAGE_MB', 1)
+    files = attachments(5, 300*1024)
+    service = FakeService()
+    outcomes = email_machine.send_update(files, service)
+    assert len(outcomes) > 1
+    assert [f for outcome in outcomes for f in outcome.filenames] == [name for name, _ in files]
+    assert all(outcome.error is None and outcome.attempts == 1 for outcome in outcomes)
+    assert [outcome.message_id for outcome in outcomes] == [
+        'message-{}'.format(i + 1) for i in range(len(outcomes))]
+    for outcome, raw in zip(outcomes, service.sent):
+        assert len(raw) == outcome.size <= 1024*1024
+        assert sorted(attached_files(raw)) == sorted(outcome.filenames)
+    assert email.message_from_bytes(service.sent[0])['Subject'] == \
+        'Mackolik update (1/{})'.format(len(outcomes))
+
+
+def test_send_update_zips_attachments(monkeypatch):
+    monkeypatch.setattr(email_machine, 'ZIP_ATTACHMENTS', True)
+    files = attachments(3, 10*1024)
+    service = FakeService()
+    outcomes = email_machine.send_update(files, service)
+    assert len(outcomes) == 1
+    attached = attached_files(service.sent[0])
+    assert list(attached) == ['mackolik_update_1.zip']
+    with zipfile.ZipFile(io.BytesIO(attached['mackolik_update_1.zip'])) as archive:
+        assert {name: archive.read(name) for name in archive.namelist()} == dict(files)
+
+
+def test_send_update_retries_transient_errors():
+    service = FakeService([503, 429, 500])
+    [outcome] = email_machine.send_update(attachments(1, 1024), service)
+    assert outcome.error is None
+    assert outcome.attempts == 4
+    assert outcome.message_id == 'message-1'
+
+
+def test_send_update_gives_up(monkeypatch):
+    monkeypatch.setattr(email_machine, 'MAX_RETRIES', 2)
+    service = FakeService([503] * 10)
+    [outcome] = email_machine.send_update(attachments(1, 1024), service)
+    assert outcome.message_id is None
+    assert outcome.attempts == 3
+    assert outcome.error is not None
+
+
+def test_send_update_does_not_retry_client_errors():
+    service = FakeService([400])
+    [outcome] = email_machine.send_update(attachments(1, 1024), service)
+    assert outcome.attempts == 1
+    assert outcome.message_id is None
+    assert service.calls == 1
+
+
+class FakeGmailHandler(BaseHTTPRequestHandler):
+    # POST .../users/{userId}/messages/send, failing with the server's statuses first
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        server = self.server
+        if len(server.failures) > 0:
+            status = server.failures.pop(0)
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.end_headers()
+            self.wfile.write(json.dumps({'error': {'code': status, 'message': 'fake'}}).encode())
+            return
+        server.sent.append((self.path, json.loads(body)))
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.end_headers()
+        self.wfile.write(json.dumps({'id': 'local-{}'.format(len(server.sent))}).encode())
+
+    def log_message(self, *args):
+        pass
+
+
+def test_send_update_to_local_endpoint(monkeypatch):
+    pytest.importorskip('googleapiclient')
+    server = HTTPServer(('127.0.0.1', 0), FakeGmailHandler)
+    server.failures = [503]
+    server.sent = list()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        monkeypatch.setattr(email_machine, 'GMAIL_API_ENDPOINT', 'http://127.0.0.1:{}'.format(server.server_port))
+        monkeypatch.setattr(email_machine, 'email_service', None)
+        [outcome] = email_machine.send_update(attachments(2, 1024))
+    finally:
+        server.shutdown()
+    assert outcome.error is None
+    assert outcome.attempts == 2
+    assert outcome.message_id == 'local-1'
+    path, body = server.sent[0]
+    assert path.split('?')[0].endswith('/messages/send')
+    assert sorted(attached_files(base64.urlsafe_b64decode(body['raw']))) == ['match 0.xlsx', 'match 1.xlsx']
@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+
+from http_scraper import parse_standings_html
+from league_table import summarize_league_table, match_inputs
+from probability_engine import compute_workbooks
+from fixture_tensor import FixtureTensor, FixtureTensorCache
+from markets import compute_markets
+
+
+@pytest.fixture
+def standings(read_fixture):
+    return summarize_league_table(parse_standings_html(read_fixture('standings_20_teams.html')))
+
+
+@pytest.mark.parametrize('lazy', [False, True])
+def test_pages_match_computing_alone(standings, lazy):
+    tensor = FixtureTensor(standings, lazy)
+    for home_team in tensor.teams:
+        for visitor_team in tensor.teams:
+            if home_team == visitor_team:
+                continue
+            alone = compute_workbooks(**match_inputs(standings, home_team, visitor_team))
+            normal_page, double_page, index = tensor.pages(home_team, visitor_team)
+            assert index == 0
+            for expected, page in zip(alone, [normal_page, double_page]):
+                for field in expected._fields:
+                    np.testing.assert_array_equal(getattr(page, field), getattr(expected, field))
+                # and so every market derived from it
+                for expected_values, values in zip(
+                        compute_markets(expected.score_matrix), compute_markets(page.score_matrix)):
+                    np.testing.assert_array_equal(values, expected_values)
+
+
+def test_shared_grid_views(standings):
+    tensor = FixtureTensor(standings)
+    n = len(tensor.teams)
+    home_goals, visitor_goals = tensor.expected_goals()
+    assert home_goals.shape == visitor_goals.shape == (n, n)
+    assert tensor.score_matrices().shape == (n, n, tensor.max_goals, tensor.max_goals)
+    np.testing.assert_array_equal(
+        FixtureTensor(standings, lazy=True).score_matrices('double'), tensor.score_matrices('double'))
+
+
+def test_cache_byte_limit(standings):
+    tensor_bytes = FixtureTensor(standings).nbytes
+    cache = FixtureTensorCache(2 * tensor_bytes)
+    first = cache.get('a', standings)
+    assert cache.get('a', standings) is first
+    for league_key in ['b', 'c', 'd']:
+        cache.get(league_key, standings)
+    assert list(cache.entries) == [('c', standings.scraped_at), ('d', standings.scraped_at)]
+    assert cache.nbytes <= 2 * tensor_bytes
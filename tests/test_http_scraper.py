@@ -0,0 +1,201 @@
+import datetime
+
+import pytest
+
+from selenium.webdriver.common.by import By
+
+from http_scraper import (
+    HttpScraper, parse_listing_html, parse_listing_selection, parse_standings_html, parse_sub_league_url,
+    parse_team_names_html)
+from league_table import summarize_league_table, IDX_TEAM_NAME
+from scraper import LISTING_URL, JS_TABLE_EXTRACTOR, build_match_jobs, all_navigable, is_navigable, load_listing
+
+LEAGUE_URL = 'http://arsiv.mackolik.com/Puan-Durumu/1/TURKIYE-Super-Lig'
+
+
+def test_parse_listing_html(read_fixture):
+    rows = parse_listing_html(read_fixture('listing.html'))
+    assert len(rows) == 5
+    assert rows[0]['className'] == 'iddaa-oyna-title2'
+    assert rows[0]['cells'][0] == '18.10.2026'
+    match_row = rows[2]
+    assert match_row['time'] == '20:00'
+    assert match_row['cells'][1] == 'TUR'
+    assert match_row['league']['url'] == LEAGUE_URL
+    assert match_row['match']['href'] == '/Mac/3598431/Galatasaray-Fenerbahce'
+    assert match_row['match']['text'] == 'Galatasaray - Fenerbahçe'
+    assert rows[3]['match']['onclick'] == 'popMatch(3600001)'
+    # no link in the league cell
+    assert rows[4]['league']['url'] is None
+
+
+def test_listing_to_match_jobs(read_fixture):
+    rows = parse_listing_html(read_fixture('listing.html'))
+    jobs = build_match_jobs(rows, datetime.datetime(2026, 10, 18, 12), datetime.timedelta(hours=10))
+    assert [job.kickoff for job in jobs] == [
+        datetime.datetime(2026, 10, 18, 20), datetime.datetime(2026, 10, 18, 21, 45)]
+    assert jobs[0].match_id == '3598431'
+    assert jobs[0].listing_team_names == ['galatasaray', 'fenerbahçe']
+    assert jobs[0].league_key == 'TUR'
+    assert jobs[0].match_url == 'http://arsiv.mackolik.com/Mac/3598431/Galatasaray-Fenerbahce'
+    assert jobs[1].match_id == '3600001'
+    # opened by its onclick, there is no page to go to
+    assert jobs[1].match_url is None
+    assert not all_navigable(jobs)
+    assert all_navigable(jobs[:1])
+
+
+def test_is_navigable():
+    assert is_navigable(LEAGUE_URL)
+    assert not is_navigable(None)
+    assert not is_navigable('javascript:void(0)')
+    assert not is_navigable('/Mac/3598431')
+    # what link.href makes of href="#" on the listing
+    assert not is_navigable(LISTING_URL + '#')
+    assert not is_navigable(LISTING_URL)
+    assert not is_navigable(LEAGUE_URL + '#', LEAGUE_URL)
+
+
+def test_parse_standings_html(read_fixture):
+    rows = parse_standings_html(read_fixture('standings_10_teams.html'))
+    assert len(rows) == 10
+    assert all(len(row) == 26 for row in rows)
+    assert rows[0][IDX_TEAM_NAME] == 'trabzonspor'
+    assert rows[1][IDX_TEAM_NAME] == 'beşiktaş'
+    standings = summarize_league_table(rows)
+    assert 'trabzonspor' in standings.teams
+    assert standings.home_matches_played == sum(int(r[11]) for r in rows)
+
+
+def test_parse_standings_html_without_rows(read_fixture):
+    # a header row only, as before scripts fill the table
+    assert parse_standings_html(read_fixture('league_groups.html')) == []
+    assert parse_standings_html(read_fixture('match.html')) is None
+
+
+def test_parse_sub_league_url(read_fixture):
+    assert parse_sub_league_url(read_fixture('league_groups.html'), LEAGUE_URL) == \
+        'http://arsiv.mackolik.com/Puan-Durumu/1/TURKIYE-Super-Lig-Grup-A'
+    # the only option is the one shown
+    assert parse_sub_league_url(read_fixture('standings_10_teams.html'), LEAGUE_URL) is None
+    assert parse_sub_league_url(read_fixture('match.html'), LEAGUE_URL) is None
+
+
+def test_parse_team_names_html(read_fixture):
+    assert parse_team_names_html(read_fixture('match.html')) == ['galatasaray', 'fenerbahçe']
+    assert parse_team_names_html(read_fixture('listing.html')) is None
+
+
+def fake_scraper(pages: dict) -> HttpScraper:
+    scraper = HttpScraper(pool_size=1, listing_url=LISTING_URL)
+    scraper.fetch = lambda url: pages[url]
+    return scraper
+
+
+def test_load_league_table(read_fixture):
+    scraper = fake_scraper({LEAGUE_URL: read_fixture('standings_20_teams.html')})
+    assert len(scraper.load_league_table(LEAGUE_URL)) == 20
+
+
+def test_load_league_table_without_rows(read_fixture):
+    # an empty table goes to the browser instead of being cached
+    groups_page = read_fixture('league_groups.html')
+    scraper = fake_scraper({
+        LEAGUE_URL: groups_page,
+        'http://arsiv.mackolik.com/Puan-Durumu/1/TURKIYE-Super-Lig-Grup-A': groups_page
+    })
+    with pytest.raises(ValueError):
+        scraper.load_league_table(LEAGUE_URL)
+
+
+def test_parse_listing_selection(read_fixture):
+    assert parse_listing_selection(read_fixture('listing.html')) == ('-1', '2')
+    assert parse_listing_selection(read_fixture('listing_default.html')) == ('0', '1')
+    assert parse_listing_selection(read_fixture('match.html')) == (None, None)
+
+
+class FakeOption:
+    def __init__(self, browser, value: str):
+        self.browser = browser
+        self.value = value
+
+    def get_attribute(self, name):
+        return self.value
+
+    def is_selected(self):
+        return self.browser.date_value == self.value
+
+    def is_enabled(self):
+        return True
+
+    def click(self):
+        self.browser.date_value = self.value
+
+
+class FakeSelect:
+    tag_name = 'select'
+
+    def __init__(self, browser):
+        self.browser = browser
+
+    def get_dom_attribute(self, name):
+        return None
+
+    def find_elements(self, by, value):
+        options = [FakeOption(self.browser, v) for v in ['0', '-1']]
+        if by == By.CSS_SELECTOR:
+            options = [o for o in options if '"{}"'.format(o.value) in value]
+        return options
+
+
+class FakeTab:
+    def __init__(self, browser, tab_type: str):
+        self.browser = browser
+        self.tab_type = tab_type
+
+    def click(self):
+        self.browser.tab_type = self.tab_type
+
+
+class FakeListingBrowser:
+    # the listing as load_listing sees it, on the default date and tab until they are selected
+    def __init__(self, pages: dict):
+        self.pages = pages
+        self.date_value = None
+        self.tab_type = None
+
+    def get(self, url):
+        self.date_value, self.tab_type = '0', '1'
+
+    def page(self) -> str:
+        return self.pages.get((self.date_value, self.tab_type), self.pages[('0', '1')])
+
+    def find_element(self, by, value):
+        if by == By.ID:
+            return FakeSelect(self)
+        return FakeTab(self, value.split('@type="')[1].split('"')[0])
+
+    def execute_script(self, script, *args):
+        if script == JS_TABLE_EXTRACTOR:
+            return parse_listing_html(self.page())
+        if 'iddaa-tab-body2' in script:
+            # listing_signature
+            return '{}:{}'.format(self.date_value, self.tab_type)
+        return None
+
+
+def test_both_backends_list_the_same_jobs(read_fixture):
+    pages = {('0', '1'): read_fixture('listing_default.html'), ('-1', '2'): read_fixture('listing.html')}
+    dt_now = datetime.datetime(2026, 10, 18, 12)
+    horizon = datetime.timedelta(hours=10)
+    browser_jobs = build_match_jobs(load_listing(FakeListingBrowser(pages)), dt_now, horizon)
+    http_scraper = fake_scraper({LISTING_URL: pages[('-1', '2')]})
+    http_jobs = build_match_jobs(http_scraper.get_listing_rows(), dt_now, horizon)
+    assert len(browser_jobs) == 2
+    assert http_jobs == browser_jobs
+
+
+def test_http_listing_on_another_selection(read_fixture):
+    # a page on the default date and tab gives no rows, the browser reads the listing instead
+    scraper = fake_scraper({LISTING_URL: read_fixture('listing_default.html')})
+    assert scraper.get_listing_rows() == []
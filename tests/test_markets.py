@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+
+from markets import (
+    ASIAN_HANDICAP_LINES, TEAM_TOTAL_LINES, compute_markets, asian_handicap_odds, markets_slice, line_label)
+
+# rows are home goals, columns visitor goals
+SCORE_MATRIX = np.array([
+    [0.10, 0.05, 0.05],
+    [0.20, 0.10, 0.05],
+    [0.15, 0.20, 0.10],
+])
+
+
+def test_result_and_double_chance():
+    markets = compute_markets(SCORE_MATRIX)
+    np.testing.assert_allclose(markets.result, [[0.55, 0.30, 0.15]])
+    np.testing.assert_allclose(markets.double_chance, [[0.85, 0.70, 0.45]])
+    np.testing.assert_allclose(markets.both_teams_score, [0.45])
+
+
+def test_asian_handicap():
+    markets = compute_markets(SCORE_MATRIX)
+    lines = ASIAN_HANDICAP_LINES
+    expected = {
+        # win, push, lose of a home bet
+        -1: (0.15, 0.40, 0.45),
+        -0.5: (0.55, 0, 0.45),
+        0: (0.55, 0.30, 0.15),
+        0.5: (0.85, 0, 0.15),
+        1: (0.85, 0.10, 0.05),
+    }
+    for line, (win, push, lose) in expected.items():
+        k = lines.index(line)
+        assert markets.asian_handicap_win[0, k] == pytest.approx(win)
+        assert markets.asian_handicap_push[0, k] == pytest.approx(push)
+        assert markets.asian_handicap_lose[0, k] == pytest.approx(lose)
+    # a push returns the stake
+    assert asian_handicap_odds(markets)[0, lines.index(0)] == pytest.approx(0.70 / 0.55)
+
+
+def test_team_totals_and_top_scores():
+    markets = compute_markets(SCORE_MATRIX)
+    assert TEAM_TOTAL_LINES[:2] == [0.5, 1.5]
+    np.testing.assert_allclose(markets.home_total_over[0, :2], [0.80, 0.45])
+    np.testing.assert_allclose(markets.visitor_total_over[0, :2], [0.55, 0.20])
+    # nothing beyond the grid
+    np.testing.assert_allclose(markets.home_total_over[0, 2:], 0, atol=1e-12)
+    np.testing.assert_allclose(markets.top_score_probability, [[0.20, 0.20, 0.15, 0.10, 0.10]])
+    top = set(zip(markets.top_score_home_goals[0, :2], markets.top_score_visitor_goals[0, :2]))
+    assert top == {(1, 0), (2, 1)}
+
+
+def test_markets_slice():
+    slate = np.stack([SCORE_MATRIX, SCORE_MATRIX.T])
+    markets = compute_markets(slate)
+    for index in range(2):
+        for field, expected in zip(markets_slice(markets, index), compute_markets(slate[index])):
+            np.testing.assert_array_equal(field, expected)
+
+
+def test_line_label():
+    assert [line_label(line) for line in [-2.5, -1, 0, 0.5, 2]] == ['-2,5', '-1', '0', '+0,5', '+2']
@@ -0,0 +1,96 @@
+import datetime
+
+from match_scheduler import MatchScheduler, RECORD_KEEP_TIMEDELTA, job_key
+
+from test_pipeline import match_job
+
+NOW = datetime.datetime(2026, 10, 18, 12)
+
+
+def scheduler(path: str = None) -> MatchScheduler:
+    # due 6 hours before kickoff, sent again 1 hour and 15 minutes before
+    return MatchScheduler(
+        path,
+        datetime.timedelta(hours=6),
+        [datetime.timedelta(minutes=15), datetime.timedelta(hours=1)],
+        datetime.timedelta(minutes=30)
+    )
+
+
+def job_at(index: int, kickoff: datetime.datetime):
+    return match_job(index)._replace(kickoff=kickoff)
+
+
+def test_due_jobs():
+    s = scheduler()
+    soon = job_at(3, NOW + datetime.timedelta(hours=2))
+    later = job_at(4, NOW + datetime.timedelta(hours=7))
+    due = s.due_jobs([later, soon], NOW)
+    # re-indexed in listing order
+    assert [(job.match_id, job.index) for job in due] == [(soon.match_id, 0)]
+
+    s.mark_processed(soon, NOW)
+    assert s.due_jobs([soon], NOW + datetime.timedelta(minutes=30)) == []
+    # the 1 hour refresh point has passed
+    assert len(s.due_jobs([soon], NOW + datetime.timedelta(hours=1, minutes=1))) == 1
+    s.mark_processed(soon, NOW + datetime.timedelta(hours=1, minutes=1))
+    assert s.due_jobs([soon], NOW + datetime.timedelta(hours=1, minutes=30)) == []
+    assert len(s.due_jobs([soon], NOW + datetime.timedelta(hours=1, minutes=50))) == 1
+
+
+def test_next_wake():
+    s = scheduler()
+    # nothing listed yet, the next listing read
+    assert s.next_wake(NOW) == NOW + datetime.timedelta(minutes=30)
+
+    job = job_at(0, NOW + datetime.timedelta(hours=6, minutes=10))
+    s.update_listing([job], NOW)
+    # the match becomes due before the listing is read again
+    assert s.next_wake(NOW) == job.kickoff - datetime.timedelta(hours=6)
+
+    s.mark_processed(job, job.kickoff - datetime.timedelta(hours=5))
+    now = job.kickoff - datetime.timedelta(hours=1, minutes=10)
+    # the next listing read comes before the 1 hour refresh point, then the other way round
+    s.update_listing([job], now - datetime.timedelta(minutes=25))
+    assert s.next_wake(now) == now - datetime.timedelta(minutes=25) + datetime.timedelta(minutes=30)
+    s.update_listing([job], now)
+    assert s.next_wake(now) == job.kickoff - datetime.timedelta(hours=1)
+    # past every refresh point, only the listing is left
+    s.mark_processed(job, job.kickoff - datetime.timedelta(minutes=10))
+    assert s.next_wake(job.kickoff - datetime.timedelta(minutes=10)) == \
+        job.kickoff - datetime.timedelta(minutes=10) + datetime.timedelta(minutes=30)
+
+
+def test_prune():
+    s = scheduler()
+    old = job_at(0, NOW - RECORD_KEEP_TIMEDELTA - datetime.timedelta(minutes=1))
+    recent = job_at(1, NOW - datetime.timedelta(hours=2))
+    s.mark_processed(old, old.kickoff)
+    s.mark_processed(recent, recent.kickoff)
+    s.prune(NOW)
+    assert list(s.records) == [job_key(recent)]
+
+
+def test_save_and_load(tmp_path):
+    path = str(tmp_path / 'processed_matches.json')
+    s = scheduler(path)
+    job = job_at(0, NOW + datetime.timedelta(hours=2))
+    s.mark_processed(job, NOW)
+    s.save()
+    loaded = scheduler(path)
+    assert loaded.records == s.records
+    assert loaded.last_sent(job_key(job)) == NOW
+    # nothing is sent twice after a restart
+    assert loaded.due_jobs([job], NOW + datetime.timedelta(minutes=5)) == []
+
+
+def test_unreadable_record_file(tmp_path, capsys):
+    path = tmp_path / 'processed_matches.json'
+    path.write_text('{', encoding='utf-8')
+    assert scheduler(str(path)).records == {}
+    assert 'record error' in capsys.readouterr().out
+
+
+def test_job_key_without_match_id():
+    job = match_job(0)._replace(match_id=None, listing_team_names=['ulsan', 'jeonbuk'])
+    assert job_key(job) == '2026.10.18 20.00 ulsan - jeonbuk'
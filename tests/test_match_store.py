@@ -0,0 +1,98 @@
+import sqlite3
+import datetime
+
+import numpy as np
+import pytest
+
+from http_scraper import parse_standings_html
+from league_table import summarize_league_table
+from match_store import MatchStore
+from probability_engine import compute_workbooks, page_slice
+
+from test_pipeline import match_job, scrape_results, compute_items
+
+
+@pytest.fixture
+def standings(read_fixture):
+    return summarize_league_table(parse_standings_html(read_fixture('standings_10_teams.html')))
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = MatchStore(str(tmp_path / 'store.sqlite3'))
+    yield store
+    store.close()
+
+
+def record_matches(store: MatchStore, standings, count: int) -> tuple:
+    items = compute_items(scrape_results(standings, count))
+    normal_page, double_page = compute_workbooks(
+        **{key: [item[2][key] for item in items] for key in items[0][2]})
+    for index, (job, _, _, standings, team_names) in enumerate(items):
+        store.record_standings(job.league_key, job.league_url, standings)
+        store.record_match(job, team_names, standings)
+        store.record_pages(job, normal_page, double_page, index)
+    return items, normal_page, double_page
+
+
+def test_flush_and_queries(store, standings):
+    items, normal_page, _ = record_matches(store, standings, 3)
+    # a standing table and a match per item, and two pages
+    assert store.flush() == 3 * 4
+    assert store.flush() == 0
+
+    matches = store.matches()
+    assert [m['match_key'] for m in matches] == [item[0].match_id for item in items]
+    assert matches[0]['home_team'] == items[0][4][0]
+    assert matches[0]['kickoff'] == items[0][0].kickoff
+    home_team = items[1][4][0]
+    assert [m['home_team'] for m in store.matches(team_name=home_team)] == [home_team]
+    assert len(store.matches(start=items[1][0].kickoff)) == 2
+    assert len(store.matches(end=items[1][0].kickoff)) == 1
+    assert store.matches(league_key='ISP') == []
+
+    # the table is stored once, as scraped
+    snapshots = store.standings_snapshots('TUR')
+    assert len(snapshots) == 1
+    assert snapshots[0] == (standings.scraped_at, standings.rows)
+    assert store.latest_standings('TUR') == standings.rows
+    assert store.latest_standings('ISP') is None
+    assert len(store.team_history(home_team)) == 1
+
+    # each match on its own grid
+    (_, ht_mean, _, matrix, under), = store.score_matrices(items[0][0].match_id)
+    expected = page_slice(normal_page, 0)
+    assert ht_mean == expected.ht_adj_mean_goals[0]
+    np.testing.assert_array_equal(matrix, expected.score_matrix[0])
+    np.testing.assert_array_equal(under, expected.under[0])
+    assert len(store.score_matrices(items[0][0].match_id, 'double')) == 1
+
+
+def test_match_sent_again_keeps_its_row(store, standings):
+    items, _, _ = record_matches(store, standings, 1)
+    store.flush()
+    job, _, _, standings, team_names = items[0]
+    later = job._replace(kickoff=job.kickoff + datetime.timedelta(minutes=30))
+    store.record_match(later, team_names, standings)
+    store.flush()
+    matches = store.matches()
+    assert len(matches) == 1
+    assert matches[0]['kickoff'] == later.kickoff
+
+
+def test_failed_flush_keeps_records(store, standings, monkeypatch):
+    record_matches(store, standings, 2)
+
+    def locked(league_id, standings):
+        raise sqlite3.OperationalError('database is locked')
+    monkeypatch.setattr(store, 'snapshot_id', locked)
+    with pytest.raises(sqlite3.OperationalError):
+        store.flush()
+    # rolled back, not even the league is there
+    assert store.connection.execute('SELECT COUNT(*) FROM leagues').fetchone()[0] == 0
+
+    # recorded while the flush failed, written after what was already queued
+    store.record_match(match_job(5), list(standings.teams)[:2], standings)
+    monkeypatch.undo()
+    assert store.flush() == 2 * 4 + 1
+    assert len(store.matches()) == 3
@@ -0,0 +1,24 @@
+from page_waits import league_page_loaded
+
+
+class FakeDriver:
+    # just what league_page_loaded reads
+    def __init__(self, current_url: str, ready_state: str, has_table: bool):
+        self.current_url = current_url
+        self.ready_state = ready_state
+        self.has_table = has_table
+
+    def find_elements(self, by, value):
+        return [object()] if self.has_table else []
+
+    def execute_script(self, script):
+        return self.ready_state
+
+
+def test_league_page_loaded():
+    league_url = 'http://arsiv.mackolik.com/Puan-Durumu/1/TURKIYE-Super-Lig'
+    assert league_page_loaded(FakeDriver(league_url, 'interactive', True))
+    assert league_page_loaded(FakeDriver(league_url, 'complete', False))
+    assert not league_page_loaded(FakeDriver(league_url, 'loading', False))
+    # a new window before it navigates
+    assert not league_page_loaded(FakeDriver('about:blank', 'complete', False))
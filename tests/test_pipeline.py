@@ -0,0 +1,163 @@
+import queue
+import datetime
+
+import numpy as np
+import pytest
+
+from http_scraper import parse_standings_html
+from league_table import summarize_league_table, match_inputs
+from probability_engine import compute_workbooks, page_slice
+from scraper import MatchJob, ScrapeResult
+from strength_model import StrengthCache, compute_fitted_page
+from email_machine import SendOutcome
+from pipeline import STOP, compute_stage, run_pipeline
+
+
+@pytest.fixture
+def standings(read_fixture):
+    return summarize_league_table(parse_standings_html(read_fixture('standings_10_teams.html')))
+
+
+def match_job(index: int, league_key: str = 'TUR') -> MatchJob:
+    return MatchJob(
+        index=index,
+        kickoff=datetime.datetime(2026, 10, 18, 20) + datetime.timedelta(minutes=index),
+        match_id=str(3598431 + index),
+        listing_team_names=None,
+        league_key=league_key,
+        league_url='http://arsiv.mackolik.com/Puan-Durumu/1/TURKIYE-Super-Lig',
+        match_url='http://arsiv.mackolik.com/Mac/{}'.format(3598431 + index),
+        league_node=None,
+        match_node=None
+    )
+
+
+def scrape_results(standings, count: int) -> list:
+    teams = list(standings.teams)
+    return [
+        ScrapeResult(match_job(i), [teams[i], teams[-1 - i]], standings, None)
+        for i in range(count)
+    ]
+
+
+def compute_items(results: list) -> list:
+    # what scrape_stage puts on the queue
+    return [
+        (job, 'match {}'.format(job.index), match_inputs(standings, *team_names), standings, team_names)
+        for job, team_names, standings, _ in results
+    ]
+
+
+def run_compute_stage(items: list, **kwargs) -> list:
+    in_queue = queue.Queue()
+    out_queue = queue.Queue()
+    for item in items:
+        in_queue.put(item)
+    in_queue.put(STOP)
+    compute_stage(in_queue, out_queue, 16, **kwargs)
+    computed = list()
+    while True:
+        item = out_queue.get_nowait()
+        if item is STOP:
+            return computed
+        computed.append(item)
+
+
+def assert_pages_equal(page, expected) -> None:
+    for field in expected._fields:
+        np.testing.assert_array_equal(getattr(page, field), getattr(expected, field))
+
+
+def test_compute_stage_with_fitted_model(standings):
+    items = compute_items(scrape_results(standings, 3))
+    strengths = StrengthCache()
+    computed = run_compute_stage(items, strengths=strengths)
+    assert [item[1] for item in computed] == [item[1] for item in items]
+    # one fit for the league, every fixture is indexed into it
+    assert len(strengths.entries) == 1
+    fitted = strengths.get_or_fit('TUR', standings)
+    _, double_page = compute_workbooks(**{key: [item[2][key] for item in items] for key in items[0][2]})
+    for k, (_, _, _, normal_page, match_double_page, index) in enumerate(computed):
+        team_names = items[k][4]
+        assert_pages_equal(
+            page_slice(normal_page, index), compute_fitted_page(fitted, [team_names[0]], [team_names[1]]))
+        assert_pages_equal(page_slice(match_double_page, index), page_slice(double_page, k))
+
+
+def test_compute_stage_keeps_standings_model(standings):
+    items = compute_items(scrape_results(standings, 2))
+    normal_page, double_page = compute_workbooks(
+        **{key: [item[2][key] for item in items] for key in items[0][2]})
+    for k, (_, _, _, page, _, index) in enumerate(run_compute_stage(items)):
+        assert_pages_equal(page_slice(page, index), page_slice(normal_page, k))
+
+
+class FakeSend:
+    # records every update; fails the messages of the filenames in failing
+    def __init__(self, failing: set = frozenset(), error: Exception = None):
+        self.failing = failing
+        self.error = error
+        self.updates = list()
+
+    def __call__(self, files: list) -> list:
+        self.updates.append([filename for filename, _ in files])
+        if self.error is not None:
+            raise self.error
+        return [
+            SendOutcome([filename], len(data), None, 1, 'failed' if filename in self.failing else None)
+            for filename, data in files
+        ]
+
+
+def test_run_pipeline_delivers_and_skips(standings):
+    results = scrape_results(standings, 3)
+    no_table = ScrapeResult(match_job(3), results[0].team_names, standings._replace(rows=[]), None)
+    unknown_team = ScrapeResult(match_job(4), ['nobody', results[0].team_names[1]], standings, None)
+    scrape_error = ScrapeResult(match_job(5), None, None, ValueError('no page'))
+    send = FakeSend()
+    delivered, skipped = run_pipeline(
+        iter(results[:1] + [no_table, scrape_error] + results[1:] + [unknown_team]), send=send)
+    assert delivered == [result.job for result in results]
+    assert skipped == [no_table.job, unknown_team.job]
+    # one update at the end, in kickoff order
+    assert send.updates == [[
+        '{} {} - {}.xlsx'.format(result.job.kickoff.strftime('%Y.%m.%d %H.%M'), *result.team_names)
+        for result in results
+    ]]
+
+
+def test_run_pipeline_batches_and_failed_sends(standings):
+    results = scrape_results(standings, 3)
+    send = FakeSend(failing={'2026.10.18 20.01 {} - {}.xlsx'.format(*results[1].team_names)})
+    delivered, _ = run_pipeline(iter(results), delivery_batch_size=2, send=send)
+    assert [len(update) for update in send.updates] == [2, 1]
+    # a failed message is not delivered, it is tried again next cycle
+    assert delivered == [results[0].job, results[2].job]
+
+
+def test_run_pipeline_stops_on_errors(standings):
+    results = scrape_results(standings, 2)
+
+    def failing_scrape():
+        yield results[0]
+        raise RuntimeError('browser died')
+    # what was scraped before the error is still sent
+    delivered, _ = run_pipeline(failing_scrape(), send=FakeSend())
+    assert delivered == [results[0].job]
+
+    # every stage stops when sending fails
+    delivered, _ = run_pipeline(iter(results), send=FakeSend(error=ConnectionError('offline')))
+    assert delivered == []
+
+
+class FailingTensors:
+    def pages(self, *args):
+        raise ValueError('bad table')
+
+
+def test_run_pipeline_stops_on_compute_errors(standings):
+    send = FakeSend()
+    delivered, skipped = run_pipeline(
+        iter(scrape_results(standings, 2)), send=send, tensors=FailingTensors())
+    assert delivered == [] and skipped == []
+    assert send.updates == []
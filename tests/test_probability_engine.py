@@ -0,0 +1,122 @@
+import math
+
+import numpy as np
+import pytest
+
+from probability_engine import (
+    MAX_GOALS, MAX_GRID_GOALS, TAIL_EPSILON, compute_workbooks, grid_sizes, page_slice, poisson_pmf)
+
+# write_spreadsheet arguments of an ordinary match
+MATCH = dict(
+    ht_total_matches_played=20, ht_total_goals_scored=35, ht_total_goals_lost=18,
+    at_total_matches_played=20, at_total_goals_scored=22, at_total_goals_lost=30,
+    league_home_matches_played=190,
+    ht_home_matches_played=10, ht_home_goals_scored=20, ht_home_goals_lost=7,
+    at_away_matches_played=10, at_away_goals_scored=9, at_away_goals_lost=16,
+    league_total_matches_played=380,
+    league_home_goals=290, league_away_goals=230
+)
+
+
+def slate(*matches: dict) -> dict:
+    return {key: [match[key] for match in matches] for key in MATCH}
+
+
+def test_grid_holds_tail_mass():
+    means = np.array([0.1, 1.5, 4, 9, 20])
+    sizes = grid_sizes(means)
+    assert np.all(sizes >= MAX_GOALS)
+    for mean, size in zip(means, sizes):
+        pmf = poisson_pmf(np.array([mean]), 200)[0]
+        assert pmf[size:].sum() < TAIL_EPSILON
+        # and the grid is the smallest one that does, unless MAX_GOALS is
+        assert size == MAX_GOALS or pmf[size - 1:].sum() >= TAIL_EPSILON
+
+
+def test_each_match_keeps_its_own_grid():
+    alone = compute_workbooks(**slate(MATCH))
+    extreme = dict(MATCH, ht_home_goals_scored=300, at_away_goals_lost=300)
+    normal_page, double_page = compute_workbooks(**slate(MATCH, extreme))
+    assert double_page.max_goals[1] == MAX_GRID_GOALS
+    for expected, page in zip(alone, [normal_page, double_page]):
+        match_page = page_slice(page, 0)
+        assert match_page.score_matrix.shape == expected.score_matrix.shape
+        for field in expected._fields:
+            np.testing.assert_array_equal(getattr(match_page, field), getattr(expected, field))
+        # nothing beyond the grid of the match
+        assert np.all(page.score_matrix[0, page.max_goals[0]:, :] == 0)
+
+
+def test_capped_grid_keeps_all_mass(capsys):
+    extreme = dict(MATCH, ht_home_goals_scored=300, at_away_goals_lost=300)
+    _, double_page = compute_workbooks(**slate(extreme))
+    assert double_page.score_matrix.shape[1] == MAX_GRID_GOALS
+    assert double_page.score_matrix.sum() == pytest.approx(1)
+    assert 'Warning' in capsys.readouterr().out
+
+
+def scalar_page(
+    ht_matches_played, ht_goals_scored, ht_goals_lost,
+    vt_matches_played, vt_goals_scored, vt_goals_lost,
+    league_matches_played, league_home_goals, league_visitor_goals,
+    divide_by_ht_matches_played=False
+) -> dict:
+    # the formulas of the original generate_page, one match and one cell at a time
+    ht_matches_played = ht_matches_played or 1
+    vt_matches_played = vt_matches_played or 1
+    league_matches_played = league_matches_played or 1
+    league_mean_home_goals = league_home_goals / league_matches_played or 1
+    league_mean_visitor_goals = league_visitor_goals / league_matches_played or 1
+    ht_adj_mean_goals = (
+        ht_goals_scored / ht_matches_played / league_mean_home_goals
+        * vt_goals_lost / vt_matches_played / league_mean_home_goals * league_mean_home_goals)
+    vt_adj_mean_goals = (
+        vt_goals_scored / vt_matches_played / league_mean_visitor_goals
+        * ht_goals_lost / ht_matches_played / league_mean_visitor_goals * league_mean_visitor_goals)
+    ht_pmf = [
+        math.exp(-ht_adj_mean_goals) * ht_adj_mean_goals ** k / math.factorial(k) for k in range(MAX_GOALS)]
+    vt_pmf = [
+        math.exp(-vt_adj_mean_goals) * vt_adj_mean_goals ** k / math.factorial(k) for k in range(MAX_GOALS)]
+    under = list()
+    for score_sum in range(7):
+        under.append(sum(ht_pmf[i] * vt_pmf[score_sum - i] for i in range(score_sum + 1)) + (
+            under[-1] if score_sum > 0 else 0))
+    scale = ht_matches_played if divide_by_ht_matches_played else 1
+    return dict(
+        ht_adj_mean_goals=ht_adj_mean_goals,
+        vt_adj_mean_goals=vt_adj_mean_goals,
+        ht_pmf=ht_pmf,
+        vt_pmf=vt_pmf,
+        score_matrix=[[h * v for v in vt_pmf] for h in ht_pmf],
+        under=under,
+        under_reciprocal=[1 / (u * scale) for u in under],
+        over=[1 - u for u in under],
+        over_reciprocal=[1 / ((1 - u) * scale) for u in under]
+    )
+
+
+def test_compute_workbooks_matches_scalar_formulas():
+    # an ordinary match, and one without away matches played
+    matches = [MATCH, dict(MATCH, at_away_matches_played=0, at_away_goals_scored=2, at_away_goals_lost=1)]
+    normal_page, double_page = compute_workbooks(**slate(*matches))
+    for index, match in enumerate(matches):
+        expected_pages = [
+            scalar_page(
+                match['ht_total_matches_played'], match['ht_total_goals_scored'], match['ht_total_goals_lost'],
+                match['at_total_matches_played'], match['at_total_goals_scored'], match['at_total_goals_lost'],
+                match['league_home_matches_played'], match['league_home_goals'], match['league_away_goals']),
+            scalar_page(
+                match['ht_home_matches_played'], match['ht_home_goals_scored'], match['ht_home_goals_lost'],
+                match['at_away_matches_played'], match['at_away_goals_scored'], match['at_away_goals_lost'],
+                match['league_total_matches_played'], match['league_home_goals'], match['league_away_goals'],
+                True)
+        ]
+        for page, expected in zip([normal_page, double_page], expected_pages):
+            match_page = page_slice(page, index)
+            for field, values in expected.items():
+                actual = getattr(match_page, field)[0]
+                if field in ('ht_pmf', 'vt_pmf'):
+                    actual = actual[:MAX_GOALS]
+                elif field == 'score_matrix':
+                    actual = actual[:MAX_GOALS, :MAX_GOALS]
+                np.testing.assert_allclose(actual, values, rtol=1e-12, err_msg=field)
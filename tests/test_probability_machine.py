@@ -0,0 +1,112 @@
+import io
+import csv
+import json
+import numpy as np
+import openpyxl
+import pytest
+
+import probability_machine
+from probability_engine import MAX_GOALS, compute_workbooks, page_slice
+
+from test_probability_engine import MATCH, slate
+
+
+@pytest.fixture(scope='module')
+def pages():
+    # a few different matches, so every workbook has its own colors
+    matches = [
+        dict(MATCH, ht_total_goals_scored=goals, ht_home_goals_scored=goals // 2)
+        for goals in [10, 35, 60, 90]
+    ]
+    return compute_workbooks(**slate(*matches))
+
+
+def workbook_cells(data: bytes) -> list:
+    workbook = openpyxl.load_workbook(io.BytesIO(data))
+    return [
+        (ws.title, cell.coordinate, cell.value, cell.fill.start_color.rgb, cell.font.color.rgb, cell.font.b)
+        for ws in workbook.worksheets for row in ws.iter_rows() for cell in row
+    ]
+
+
+def test_template_matches_fresh_workbook(pages):
+    normal_page, double_page = pages
+    sizes = list()
+    for index in range(len(normal_page.inputs)):
+        data = probability_machine.save_workbook(None, normal_page, double_page, index)
+        fresh = io.BytesIO()
+        probability_machine.render_workbook(normal_page, double_page, index).save(fresh)
+        assert workbook_cells(data) == workbook_cells(fresh.getvalue())
+        # as saved, with the colors of this match only
+        sizes.append(len(probability_machine.template_workbook._cell_styles))
+    fresh_sizes = list()
+    for index in range(len(normal_page.inputs)):
+        workbook = probability_machine.render_workbook(normal_page, double_page, index)
+        workbook.save(io.BytesIO())
+        fresh_sizes.append(len(workbook._cell_styles))
+    assert sizes == fresh_sizes
+
+
+def csv_output(*matches: dict) -> list:
+    names = ['match {}'.format(k) for k in range(len(matches))]
+    data = probability_machine.write_slate_as('csv', None, names, **slate(*matches))
+    return list(csv.reader(io.StringIO(data.decode('utf-8'))))
+
+
+def test_csv_columns_do_not_depend_on_the_slate():
+    extreme = dict(MATCH, ht_home_goals_scored=300, at_away_goals_lost=300)
+    alone = csv_output(MATCH)
+    batched = csv_output(MATCH, extreme)
+    assert alone[0] == batched[0]
+    assert alone[0][:2] == ['match', 'page']
+    assert 'score_{}+_{}+'.format(MAX_GOALS, MAX_GOALS) in alone[0]
+    # the same match gives the same rows
+    np.testing.assert_allclose(
+        np.array(alone[1][2:], dtype=float), np.array(batched[1][2:], dtype=float), rtol=1e-12)
+    # the folded goals keep every match's probabilities summing to 1
+    scores = [name.startswith('score_') for name in batched[0]]
+    for row in batched[1:]:
+        assert sum(float(v) for v, is_score in zip(row, scores) if is_score) == pytest.approx(1)
+
+
+def test_json_and_npz_goal_axes(pages):
+    normal_page, double_page = pages
+    names = ['match {}'.format(k) for k in range(len(normal_page.inputs))]
+    document = json.loads(probability_machine.write_json_output(None, names, normal_page, double_page))
+    assert document['goals'] == probability_machine.GOAL_LABELS
+    for match in document['matches']:
+        assert len(match['normal']['ht_pmf']) == MAX_GOALS + 1
+        assert np.array(match['double']['score_matrix']).shape == (MAX_GOALS + 1, MAX_GOALS + 1)
+    arrays = np.load(io.BytesIO(probability_machine.write_npz_output(None, names, normal_page, double_page)))
+    assert arrays['normal_score_matrix'].shape == (len(names), MAX_GOALS + 1, MAX_GOALS + 1)
+
+
+def test_stream_matches_single_write(tmp_path):
+    matches = [
+        dict(MATCH, ht_total_goals_scored=goals, ht_home_goals_scored=goals // 2) for goals in [10, 35, 60, 90]]
+    names = ['match {}'.format(k) for k in range(len(matches))]
+    # two chunks, each on its own grid
+    slates = [
+        (names[:2], *compute_workbooks(**slate(*matches[:2]))),
+        (names[2:], *compute_workbooks(**slate(*matches[2:])))
+    ]
+    normal_page, double_page = compute_workbooks(**slate(*matches))
+    path = tmp_path / 'all.csv'
+    probability_machine.write_stream('csv', str(path), slates)
+    streamed = list(csv.reader(io.StringIO(path.read_text(encoding='utf-8'))))
+    written = list(csv.reader(io.StringIO(
+        probability_machine.write_output('csv', None, names, normal_page, double_page).decode('utf-8'))))
+    assert streamed[0] == written[0]
+    assert [row[:2] for row in streamed] == [row[:2] for row in written]
+    np.testing.assert_allclose(
+        np.array([row[2:] for row in streamed[1:]], dtype=float),
+        np.array([row[2:] for row in written[1:]], dtype=float), rtol=1e-12)
+    path = tmp_path / 'all.json'
+    probability_machine.write_stream('json', str(path), slates)
+    streamed = json.loads(path.read_text(encoding='utf-8'))
+    written = json.loads(probability_machine.write_output('json', None, names, normal_page, double_page))
+    assert streamed.keys() == written.keys()
+    assert [match['name'] for match in streamed['matches']] == names
+    np.testing.assert_allclose(
+        [match['normal']['score_matrix'] for match in streamed['matches']],
+        [match['normal']['score_matrix'] for match in written['matches']], rtol=1e-12)
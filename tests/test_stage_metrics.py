@@ -0,0 +1,83 @@
+import json
+
+import pytest
+
+import stage_metrics
+from stage_metrics import percentile, record_stage, stage, timed, start_cycle, end_cycle, prometheus_text
+
+
+def test_percentile():
+    values = [5, 1, 4, 2, 3]
+    assert percentile(values, 0) == 1
+    assert percentile(values, 0.5) == 3
+    assert percentile(values, 0.9) == 5
+    assert percentile(values, 1) == 5
+    assert percentile([7], 0.9) == 7
+
+
+def test_stages_of_a_cycle():
+    start_cycle()
+    for seconds in [0.1, 0.2, 0.3, 0.4]:
+        record_stage('compute_workbooks', seconds)
+    with pytest.raises(ValueError):
+        with stage('send_update'):
+            raise ValueError('offline')
+
+    @timed('send_update')
+    def send():
+        return 'sent'
+    assert send() == 'sent'
+
+    cycle = end_cycle(60, delivered=3)
+    compute = cycle['stages']['compute_workbooks']
+    assert compute['count'] == 4 and compute['errors'] == 0
+    assert compute['p50'] == 0.3
+    assert compute['max'] == 0.4
+    assert compute['total'] == pytest.approx(1.0)
+    assert cycle['stages']['send_update']['count'] == 2
+    assert cycle['stages']['send_update']['errors'] == 1
+    assert cycle['counts'] == {'delivered': 3}
+    assert cycle['overrun_seconds'] == 0
+    # a new cycle starts empty
+    start_cycle()
+    assert end_cycle(60)['stages'] == {}
+
+
+def test_prometheus_text():
+    cycle = {
+        'cycle_start': '2026-10-18T12:00:00',
+        'cycle_end': '2026-10-18T12:31:00',
+        'seconds': 1860.0,
+        'window_seconds': 1800,
+        'overrun_seconds': 60.0,
+        'counts': {'delivered': 3},
+        'stages': {'send_update': {'count': 2, 'errors': 1, 'p50': 0.5, 'p90': 1.5, 'max': 2.0, 'total': 2.5}},
+        'waits': {'date "select"': {'count': 1, 'timeouts': 0, 'total': 0.25}},
+    }
+    lines = prometheus_text(cycle).splitlines()
+    assert '# TYPE mackolik_stage_calls gauge' in lines
+    assert 'mackolik_stage_calls{stage="send_update"} 2.0' in lines
+    assert 'mackolik_stage_errors{stage="send_update"} 1.0' in lines
+    assert 'mackolik_stage_seconds{stage="send_update",quantile="0.9"} 1.5' in lines
+    # quotes in label values are escaped
+    assert 'mackolik_page_waits{wait="date \\"select\\""} 1.0' in lines
+    assert 'mackolik_cycle_overrun_seconds 60.0' in lines
+    assert 'mackolik_cycle_delivered 3.0' in lines
+    # every sample has a help and type line before it
+    names = {line.split(' ')[2] for line in lines if line.startswith('# TYPE')}
+    assert all(line.split('{')[0].split(' ')[0] in names for line in lines if not line.startswith('#'))
+
+
+def test_export_cycle(tmp_path, monkeypatch):
+    jsonl_path = tmp_path / 'metrics.jsonl'
+    prom_path = tmp_path / 'metrics.prom'
+    monkeypatch.setattr(stage_metrics, 'METRICS_JSONL_PATH', str(jsonl_path))
+    monkeypatch.setattr(stage_metrics, 'METRICS_PROM_PATH', str(prom_path))
+    start_cycle()
+    record_stage('compute_workbooks', 0.1)
+    cycle = end_cycle(60)
+    stage_metrics.export_cycle(cycle)
+    stage_metrics.export_cycle(cycle)
+    assert [json.loads(line) for line in jsonl_path.read_text(encoding='utf-8').splitlines()] == [cycle, cycle]
+    assert prom_path.read_text(encoding='utf-8') == prometheus_text(cycle)
+    assert not (tmp_path / 'metrics.prom.tmp').exists()
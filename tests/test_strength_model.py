@@ -0,0 +1,115 @@
+import numpy as np
+import pytest
+
+from league_table import (
+    summarize_league_table, IDX_TEAM_NAME,
+    IDX_TOTAL_MATCHES_PLAYED, IDX_TOTAL_GOALS_SCORED, IDX_TOTAL_GOALS_LOST,
+    IDX_HT_MATCHES_PLAYED, IDX_HT_GOALS_SCORED, IDX_HT_GOALS_LOST,
+    IDX_AT_MATCHES_PLAYED, IDX_AT_GOALS_SCORED, IDX_AT_GOALS_LOST
+)
+from strength_model import Results, StrengthCache, fit_strengths, compute_fitted_page
+
+TEAMS = 12
+ROUNDS = 3
+
+
+@pytest.fixture(scope='module')
+def league():
+    # a simulated league, every pairing played ROUNDS times at home
+    rng = np.random.default_rng(1)
+    attack = np.exp(rng.normal(0.3, 0.3, TEAMS))
+    defense = np.exp(rng.normal(0, 0.2, TEAMS))
+    defense /= defense.mean()
+    pairs = [(i, j) for _ in range(ROUNDS) for i in range(TEAMS) for j in range(TEAMS) if i != j]
+    home = np.array([i for i, _ in pairs])
+    visitor = np.array([j for _, j in pairs])
+    home_goals = rng.poisson(1.3 * attack[home] * defense[visitor])
+    visitor_goals = rng.poisson(attack[visitor] * defense[home])
+
+    names = ['team {}'.format(t) for t in range(TEAMS)]
+    rows = list()
+    for t in range(TEAMS):
+        at_home, away = home == t, visitor == t
+        row = [''] * (IDX_AT_GOALS_LOST + 2)
+        row[IDX_TEAM_NAME] = names[t]
+        row[IDX_TOTAL_MATCHES_PLAYED] = at_home.sum() + away.sum()
+        row[IDX_TOTAL_GOALS_SCORED] = home_goals[at_home].sum() + visitor_goals[away].sum()
+        row[IDX_TOTAL_GOALS_LOST] = visitor_goals[at_home].sum() + home_goals[away].sum()
+        row[IDX_HT_MATCHES_PLAYED] = at_home.sum()
+        row[IDX_HT_GOALS_SCORED] = home_goals[at_home].sum()
+        row[IDX_HT_GOALS_LOST] = visitor_goals[at_home].sum()
+        row[IDX_AT_MATCHES_PLAYED] = away.sum()
+        row[IDX_AT_GOALS_SCORED] = visitor_goals[away].sum()
+        row[IDX_AT_GOALS_LOST] = home_goals[away].sum()
+        rows.append([str(value) for value in row])
+    results = Results(
+        [names[i] for i in home], [names[j] for j in visitor], home_goals, visitor_goals)
+    return summarize_league_table(rows), results
+
+
+def poisson_nll(params: np.ndarray, results: Results, index: dict) -> float:
+    # without the constant log(goals!) terms
+    attack = np.exp(params[:TEAMS])
+    defense = np.exp(params[TEAMS:2 * TEAMS])
+    home = np.array([index[t] for t in results.home_team])
+    visitor = np.array([index[t] for t in results.visitor_team])
+    home_mean = np.exp(params[-1]) * attack[home] * defense[visitor]
+    visitor_mean = attack[visitor] * defense[home]
+    return float(
+        (home_mean - results.home_goals * np.log(home_mean)).sum()
+        + (visitor_mean - results.visitor_goals * np.log(visitor_mean)).sum())
+
+
+def test_fit_matches_generic_maximum_likelihood(league):
+    optimize = pytest.importorskip('scipy.optimize')
+    standings, results = league
+    strengths = fit_strengths(standings, results)
+    assert strengths.iterations > 0
+
+    fitted = optimize.minimize(
+        poisson_nll, np.zeros(2 * TEAMS + 1), args=(results, strengths.index), method='L-BFGS-B')
+    attack = np.exp(fitted.x[:TEAMS])
+    defense = np.exp(fitted.x[TEAMS:2 * TEAMS])
+    home_advantage = np.exp(fitted.x[-1])
+    # the same model up to a common scale of attack and defense
+    scale = defense.mean()
+    np.testing.assert_allclose(attack * scale, strengths.attack, rtol=1e-3)
+    np.testing.assert_allclose(defense / scale, strengths.defense, rtol=1e-3)
+    assert home_advantage == pytest.approx(strengths.home_advantage, rel=1e-3)
+
+    params = np.concatenate([
+        np.log(strengths.attack), np.log(strengths.defense), [np.log(strengths.home_advantage)]])
+    assert poisson_nll(params, results, strengths.index) <= fitted.fun + 1e-6
+
+
+def test_low_score_correction_keeps_page_consistent(league):
+    standings, results = league
+    strengths = fit_strengths(standings, results, rho=-0.1)
+    teams = strengths.teams
+    page = compute_fitted_page(strengths, teams[:5], teams[5:10])
+
+    np.testing.assert_allclose(page.score_matrix.sum(axis=(1, 2)), 1, atol=1e-6)
+    goals = page.score_matrix.shape[1]
+    total_goals = np.add.outer(np.arange(goals), np.arange(goals))
+    under = np.stack([
+        page.score_matrix[:, total_goals <= n].sum(axis=1) for n in range(page.under.shape[1])
+    ], axis=1)
+    np.testing.assert_allclose(page.under, under, atol=1e-12)
+    np.testing.assert_allclose(page.over, 1 - under, atol=1e-12)
+
+
+def test_fit_from_standings_alone(league):
+    standings, _ = league
+    strengths = fit_strengths(standings)
+    assert strengths.rho == 0
+    assert strengths.defense.mean() == pytest.approx(1)
+    assert strengths.home_advantage > 1
+
+
+def test_cache_reuses_fit(league):
+    standings, results = league
+    cache = StrengthCache(max_entries=1)
+    strengths = cache.get_or_fit('league', standings)
+    assert cache.get_or_fit('league', standings) is strengths
+    cache.get_or_fit('league', standings, results)
+    assert cache.get_or_fit('league', standings) is not strengths